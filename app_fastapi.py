@@ -1,25 +1,1201 @@
 import asyncio
+import atexit
+import bisect
+import heapq
+import contextvars
 import json
+import logging
 import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
 import time
-from collections import defaultdict
+import unicodedata
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta
-from typing import List
+from email.utils import parsedate_to_datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
 import aiohttp
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
+try:
+    import orjson
+except ImportError:  # optional, only used with FAST_JSON=true
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="Game Recommender API")
 
-# Enable CORS
+# --- STRUCTURED LOGGING ---
+# Logs are JSON lines. The handler on the event loop only puts records on a
+# bounded queue; a listener thread formats and writes them, so a backed-up
+# stdout pipe never stalls request handling (records are dropped instead once
+# the queue is full). Records logged while a request is handled carry its id.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10000  # records buffered for the writer thread
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record, with the record's extra= fields merged in"""
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        request_id = request_id_var.get()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread unformatted; drops them when full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting (including tracebacks) happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonLogFormatter())
+    listener = QueueListener(log_queue, stream_handler)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    nexa_logger = logging.getLogger("nexa")
+    nexa_logger.handlers = [handler]
+    nexa_logger.setLevel(LOG_LEVEL)
+    nexa_logger.propagate = False
+    return nexa_logger, handler, listener
+
+
+logger, log_handler, log_listener = configure_logging()
+log_listener.start()
+atexit.register(log_listener.stop)  # flush what is still queued
+
+
+# --- END STRUCTURED LOGGING ---
+
+
+# --- FAST JSON ---
+# With FAST_JSON=true (and orjson installed) API responses are encoded and
+# upstream bodies parsed with orjson. Endpoints return encoded responses
+# directly, skipping FastAPI's jsonable_encoder pass over plain dict payloads.
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() == "true"
+if FAST_JSON and orjson is None:
+    logger.warning("FAST_JSON is set but orjson is not installed; using json")
+use_orjson = FAST_JSON and orjson is not None
+
+
+def json_dumps(content, default=None):
+    """Compact UTF-8 JSON bytes"""
+    if use_orjson:
+        return orjson.dumps(content, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def json_loads(data):
+    return orjson.loads(data) if use_orjson else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return json_dumps(content)
+
+
+def parse_fields(fields):
+    """ "title,rawg_id" -> {"title", "rawg_id"}; None or empty keeps every field"""
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(",") if field.strip()} or None
+
+
+def select_fields(item, fields):
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+
+def select_game_fields(payload, fields):
+    """Apply a sparse fieldset to the game cards of a recommendation payload"""
+    if fields is None:
+        return payload
+    payload = dict(payload)
+    if "game" in payload:
+        payload["game"] = select_fields(payload["game"], fields)
+    if "games" in payload:
+        payload["games"] = [select_fields(game, fields) for game in payload["games"]]
+    return payload
+
+
+# --- END FAST JSON ---
+
+
+# --- UPSTREAM HTTP CLIENT POOL ---
+# One pooled aiohttp session per upstream provider. Sessions are opened in the
+# app lifespan and reused by every request, so connections stay alive instead
+# of paying a fresh TCP+TLS handshake per call.
+HTTP_CLIENT_SETTINGS = {
+    "openai": {"limit": 16, "timeout": 60},
+    "anthropic": {"limit": 16, "timeout": 60},
+    "rawg": {"limit": 32, "timeout": 15},
+    "twitch": {"limit": 32, "timeout": 10},
+    "twitch_auth": {"limit": 4, "timeout": 10},
+    "igdb": {"limit": 8, "timeout": 10},
+}
+HTTP_CONNECT_TIMEOUT = 5  # seconds
+HTTP_KEEPALIVE_TIMEOUT = 60  # seconds
+HTTP_DNS_CACHE_TTL = 300  # seconds
+
+# provider -> (event loop, session); sessions are bound to the loop they were created on
+_http_sessions = {}
+
+
+def _create_http_session(provider):
+    settings = HTTP_CLIENT_SETTINGS[provider]
+    connector = aiohttp.TCPConnector(
+        limit=settings["limit"],
+        limit_per_host=settings["limit"],
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=settings["timeout"], connect=HTTP_CONNECT_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_http_session(provider):
+    """Return the pooled session for an upstream provider, creating it lazily"""
+    loop = asyncio.get_running_loop()
+    entry = _http_sessions.get(provider)
+    if entry is None or entry[0] is not loop or entry[1].closed:
+        entry = (loop, _create_http_session(provider))
+        _http_sessions[provider] = entry
+    return entry[1]
+
+
+async def open_http_sessions():
+    for provider in HTTP_CLIENT_SETTINGS:
+        get_http_session(provider)
+
+
+async def close_http_sessions():
+    loop = asyncio.get_running_loop()
+    entries = list(_http_sessions.values())
+    _http_sessions.clear()
+    for session_loop, session in entries:
+        if session_loop is loop and not session.closed:
+            await session.close()
+
+
+# --- END UPSTREAM HTTP CLIENT POOL ---
+
+
+# --- METRICS ---
+# Prometheus-style metrics served at /metrics: latency histograms per pipeline
+# stage and per upstream provider, upstream call and error counters, and cache
+# hit ratios. Stages timed while handling a request are also returned in its
+# Server-Timing header.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _metric_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Counter (or, with kind="gauge", gauge) value per label set"""
+
+    def __init__(self, name, help_text, label_names=(), kind="counter"):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.kind = kind
+        self.values = Counter()
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] += amount
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_metric_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    """Latency histogram per label set, with cumulative buckets on render"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                bucket_labels = _metric_labels(
+                    self.label_names + ("le",), labels + (bound,)
+                )
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            label_text = _metric_labels(self.label_names, labels)
+            yield f"{self.name}_sum{label_text} {series[-1]:.6f}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+stage_seconds = Histogram(
+    "nexa_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)
+)
+request_seconds = Histogram(
+    "nexa_request_duration_seconds", "API request latency by route", ("route",)
+)
+requests_total = Metric(
+    "nexa_requests_total", "API requests by route and status", ("route", "status")
+)
+upstream_seconds = Histogram(
+    "nexa_upstream_request_duration_seconds",
+    "Upstream call latency by provider",
+    ("provider",),
+)
+upstream_calls = Metric(
+    "nexa_upstream_requests_total",
+    "Upstream calls by provider and HTTP status",
+    ("provider", "status"),
+)
+upstream_errors = Metric(
+    "nexa_upstream_errors_total",
+    "Upstream calls that failed or returned a non-200 status",
+    ("provider",),
+)
+
+# (stage, seconds) pairs of the request being handled, for Server-Timing
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block as one pipeline stage; cancelled blocks are not recorded"""
+    started = time.perf_counter()
+    cancelled = False
+    try:
+        yield
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        if not cancelled:
+            elapsed = time.perf_counter() - started
+            stage_seconds.observe(elapsed, stage)
+            timings = request_timings.get()
+            if timings is not None:
+                timings.append((stage, elapsed))
+
+
+def record_upstream_call(provider, status, seconds):
+    """Count one upstream call; status is None when no response arrived"""
+    upstream_calls.inc(provider, str(status) if status is not None else "error")
+    upstream_seconds.observe(seconds, provider)
+    if status != 200:
+        upstream_errors.inc(provider)
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+# --- END METRICS ---
+
+
+# --- ADAPTIVE UPSTREAM CONCURRENCY ---
+# Each provider gets an AIMD concurrency limit: it grows by one request per
+# window of fast successes and is halved on 429/503 or network errors, so
+# bursts from many users queue here instead of saturating the provider.
+# Idempotent requests are retried with jittered backoff, never sooner than a
+# Retry-After header allows.
+UPSTREAM_CONCURRENCY = {
+    # provider: (initial limit, minimum, maximum, target latency in seconds)
+    "rawg": (8, 1, 32, 2.0),
+    "twitch": (8, 1, 32, 1.0),
+    "igdb": (4, 1, 8, 1.0),
+}
+UPSTREAM_RETRY_ATTEMPTS = 3
+UPSTREAM_RETRY_BASE_DELAY = 0.25  # seconds, doubled on every attempt
+UPSTREAM_RETRY_MAX_DELAY = 5  # give up rather than wait longer than this
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}
+
+
+class AdaptiveConcurrencyLimiter:
+    """Additive-increase/multiplicative-decrease limit on in-flight requests"""
+
+    def __init__(self, initial, minimum, maximum, target_latency):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = Counter()
+        self._waiters = deque()
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < int(self.limit):
+                break
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Hand a wake-up we can no longer use to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if overloaded or latency > self.target_latency:
+            # Decrease at most once per target latency so one burst of 429s
+            # doesn't collapse the limit to the minimum
+            if now - self._last_decrease > self.target_latency:
+                factor = 0.5 if overloaded else 0.9
+                self.limit = max(self.minimum, self.limit * factor)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def pause(self, seconds):
+        """Hold every new request until a Retry-After has passed"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done() and not waiter.get_loop().is_closed():
+                waiter.set_result(None)
+                free -= 1
+
+    def snapshot(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            **self.stats,
+        }
+
+
+upstream_limiters = {
+    provider: AdaptiveConcurrencyLimiter(*settings)
+    for provider, settings in UPSTREAM_CONCURRENCY.items()
+}
+
+# Results lost to upstream failures, by pipeline stage
+dropped_results = Counter()
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(
+            (
+                parsedate_to_datetime(value) - datetime.now().astimezone()
+            ).total_seconds(),
+            0.0,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, retry_after=None):
+    backoff = UPSTREAM_RETRY_BASE_DELAY * 2**attempt * random.uniform(0.5, 1.5)
+    return max(backoff, retry_after or 0)
+
+
+async def upstream_request(provider, method, url, retry=None, **kwargs):
+    """
+    Pooled, concurrency-limited upstream call returning (status, json payload).
+    The payload is None unless the status is 200. GETs (or retry=True) are
+    retried on 429, 5xx and network errors.
+    """
+    limiter = upstream_limiters.get(provider)
+    retry = method == "GET" if retry is None else retry
+    attempts = UPSTREAM_RETRY_ATTEMPTS if retry else 1
+    for attempt in range(attempts):
+        if limiter:
+            await limiter.acquire()
+        started = time.monotonic()
+        status, payload, retry_after, failed = None, None, None, False
+        try:
+            async with get_http_session(provider).request(
+                method, url, **kwargs
+            ) as resp:
+                status = resp.status
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if status == 200:
+                    payload = await resp.json(loads=json_loads)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            failed = True
+            if attempt + 1 >= attempts:
+                raise
+        finally:
+            record_upstream_call(provider, status, time.monotonic() - started)
+            if limiter:
+                limiter.release(
+                    time.monotonic() - started,
+                    overloaded=failed or status in OVERLOAD_STATUSES,
+                )
+                limiter.stats["requests"] += 1
+                limiter.stats["errors"] += failed
+                limiter.stats["throttled"] += status == 429
+        if status == 429 and retry_after and limiter:
+            limiter.pause(min(retry_after, UPSTREAM_RETRY_MAX_DELAY))
+        if not failed and (status not in RETRYABLE_STATUSES or attempt + 1 >= attempts):
+            return status, payload
+        if retry_after and retry_after > UPSTREAM_RETRY_MAX_DELAY:
+            return status, payload
+        if limiter:
+            limiter.stats["retries"] += 1
+        await asyncio.sleep(retry_delay(attempt, retry_after))
+
+
+# --- END ADAPTIVE UPSTREAM CONCURRENCY ---
+
+
+# --- PERSISTENT UPSTREAM RESPONSE CACHE ---
+# RAWG and IGDB payloads change rarely, so successful responses are kept in a
+# single SQLite file that survives restarts. Point UPSTREAM_CACHE_PATH at a
+# mounted volume to keep it across redeploys as well.
+UPSTREAM_CACHE_PATH = os.getenv("UPSTREAM_CACHE_PATH", "upstream_cache.sqlite3")
+UPSTREAM_CACHE_MAX_BYTES = int(os.getenv("UPSTREAM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+UPSTREAM_CACHE_TTLS = {  # seconds, per endpoint
+    "rawg:search": 24 * 3600,
+    "rawg:game": 7 * 24 * 3600,
+    "rawg:screenshots": 7 * 24 * 3600,
+    "igdb:games": 24 * 3600,
+    "llm:titles": int(os.getenv("LLM_TITLE_CACHE_TTL", 24 * 3600)),
+    "prewarm:state": 90 * 24 * 3600,
+}
+# Credentials never become part of a cache key
+UPSTREAM_CACHE_EXCLUDED_PARAMS = {"key"}
+
+
+class UpstreamCache:
+    """Size-capped SQLite cache of upstream JSON responses with per-endpoint TTLs"""
+
+    def __init__(self, path, max_bytes, ttls):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        normalized = sorted(
+            (k, str(v))
+            for k, v in (params or {}).items()
+            if k not in UPSTREAM_CACHE_EXCLUDED_PARAMS
+        )
+        return json.dumps([endpoint, normalized])
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, body TEXT NOT NULL, "
+                "size INTEGER NOT NULL, expires_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            self._total_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT body, size, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            body, size, expires_at = row
+            now = time.time()
+            if now >= expires_at:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                return None
+            conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return json_loads(body)
+
+    def _set(self, key, endpoint, value):
+        body = json.dumps(value)
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, endpoint, body, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, size, now + self.ttls[endpoint], now),
+            )
+            self._total_bytes += size - (row[0] if row else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        # Drop expired rows first, then least recently used ones down to 90%
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        target = self.max_bytes * 0.9
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[
+            0
+        ]
+        for key, size in conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+        self._total_bytes = total
+
+    async def get(self, endpoint, params):
+        value = await asyncio.to_thread(self._get, self.make_key(endpoint, params))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, endpoint, params, value):
+        key = self.make_key(endpoint, params)
+        await asyncio.to_thread(self._set, key, endpoint, value)
+
+    def values(self, endpoint):
+        """All unexpired cached responses for one endpoint"""
+        with self._lock:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT body FROM responses WHERE endpoint = ? AND expires_at > ?",
+                    (endpoint, time.time()),
+                )
+                .fetchall()
+            )
+        return [json_loads(body) for (body,) in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+upstream_cache = UpstreamCache(
+    UPSTREAM_CACHE_PATH, UPSTREAM_CACHE_MAX_BYTES, UPSTREAM_CACHE_TTLS
+)
+
+
+async def cache_upstream_response(endpoint, params, value):
+    """Cache a fresh upstream answer; a failed write must not lose the answer"""
+    try:
+        await upstream_cache.set(endpoint, params, value)
+    except Exception as e:
+        logger.error(
+            "Upstream cache write failed", extra={"endpoint": endpoint, "error": str(e)}
+        )
+
+
+# --- END PERSISTENT UPSTREAM RESPONSE CACHE ---
+
+
+# --- SINGLE-FLIGHT REQUEST COALESCING ---
+class _Flight:
+    def __init__(self, loop, task):
+        self.loop = loop
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """Buffers one async iterator so several readers can replay and follow it"""
+
+    def __init__(self, loop, source):
+        self.loop = loop
+        self.items = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream calls: while a call for a key is
+    in flight, later callers with the same key wait for its result instead of
+    issuing their own request. Keys start with the provider name.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.started = 0
+        self.shared = 0
+
+    def _join(self, key, start):
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(key)
+        if flight is None or flight.loop is not loop or flight.task.done():
+            flight = start(loop)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._forget(k, f))
+            self.started += 1
+        else:
+            self.shared += 1
+        return flight
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key, fn):
+        """Await fn() once for all concurrent callers with the same key"""
+        flight = self._join(
+            key, lambda loop: _Flight(loop, asyncio.ensure_future(fn()))
+        )
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Nobody is left waiting for the result, so stop the upstream call
+            if flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def stream(self, key, fn):
+        """Iterate fn() once for all concurrent readers with the same key"""
+        flight = self._join(key, lambda loop: _StreamFlight(loop, fn()))
+        flight.readers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.task.done():
+                flight.task.cancel()
+
+
+upstream_flights = SingleFlight()
+
+
+# --- END SINGLE-FLIGHT REQUEST COALESCING ---
+
+# --- SHARED WORKER STATE ---
+# With several uvicorn workers, state that must be global to the box (rate
+# limit counters, OAuth tokens, the RAWG quota) lives in one SQLite database in
+# WAL mode. Every update is a short BEGIN IMMEDIATE transaction, so concurrent
+# workers serialize on the write lock instead of overwriting each other.
+SHARED_STATE = os.getenv("SHARED_STATE", "false").lower() == "true"
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "shared_state.sqlite3")
+SHARED_STATE_BUSY_TIMEOUT = 5000  # milliseconds to wait for another worker
+
+SHARED_STATE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, "
+    "window_index INTEGER NOT NULL, previous INTEGER NOT NULL, "
+    "current INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS rate_limits_window ON rate_limits (window_index)",
+    "CREATE TABLE IF NOT EXISTS oauth_tokens (key TEXT PRIMARY KEY, "
+    "access_token TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, "
+    "owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS rawg_quota (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS rawg_quota_days (day TEXT PRIMARY KEY, "
+    "count INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS rawg_quota_history (id INTEGER PRIMARY KEY "
+    "AUTOINCREMENT, timestamp TEXT NOT NULL, title TEXT)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, "
+    "value REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS prewarm_queries (key TEXT PRIMARY KEY, "
+    "count REAL NOT NULL, preference TEXT NOT NULL, filters TEXT NOT NULL)",
+)
+
+
+class SharedStateStore:
+    """SQLite database shared by all worker processes on this machine"""
+
+    def __init__(self, path):
+        self.path = path
+        self.owner = f"{os.getpid()}:{id(self)}"
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                check_same_thread=False,
+                isolation_level=None,
+                timeout=SHARED_STATE_BUSY_TIMEOUT / 1000,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SHARED_STATE_SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """Exclusive-write transaction across threads and processes"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def fetchone(self, sql, params=()):
+        """Single-row read; WAL readers never wait for a writer"""
+        with self._lock:
+            return self._connection().execute(sql, params).fetchone()
+
+    def try_lease(self, name, ttl):
+        """Claim a named lease for ttl seconds unless another worker holds it"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+            if row and row[0] != self.owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) "
+                "VALUES (?, ?, ?)",
+                (name, self.owner, now + ttl),
+            )
+            return True
+
+    def increment(self, name, amount=0):
+        """Atomically add amount to a named counter and return its new value"""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+            return conn.execute(
+                "SELECT value FROM counters WHERE name = ?", (name,)
+            ).fetchone()[0]
+
+    def release_lease(self, name):
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner)
+            )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+shared_state = SharedStateStore(SHARED_STATE_PATH) if SHARED_STATE else None
+
+
+# --- END SHARED WORKER STATE ---
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await open_http_sessions()
+    await asyncio.to_thread(rawg_quota.load)
+    await asyncio.to_thread(autocomplete_index.load_cached_igdb)
+    await asyncio.to_thread(title_index.load)
+    # Fetch Twitch/IGDB tokens up front and keep them fresh in the background
+    oauth_tokens.register(TWITCH_TOKEN_URL, TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET)
+    oauth_tokens.register(IGDB_TOKEN_URL, IGDB_CLIENT_ID, IGDB_CLIENT_SECRET)
+    background_tasks = [
+        asyncio.create_task(rawg_quota_flush_loop()),
+        asyncio.create_task(rawg_usage_summary_loop()),
+        asyncio.create_task(oauth_tokens.run()),
+    ]
+    if TWITCH_CLIENT_ID and TWITCH_CLIENT_SECRET:
+        background_tasks.append(asyncio.create_task(twitch_viewers.run()))
+    if PREWARM_ENABLED:
+        await query_prewarmer.load()
+        background_tasks.append(asyncio.create_task(query_prewarmer.run()))
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await rawg_quota.flush()
+        if PREWARM_ENABLED:
+            await query_prewarmer.save()
+        await close_http_sessions()
+        upstream_cache.close()
+        title_index.close()
+        if shared_state:
+            shared_state.close()
+
+
+app = FastAPI(title="Game Recommender API", lifespan=lifespan)
+
+# --- RATE LIMITING ---
+# Sliding-window counters: each (route, client) keeps the request count of the
+# current and previous fixed window, and the previous count is weighted by how
+# much of it still overlaps the sliding window. Checks are O(1), and clients
+# that have been idle for two windows are evicted from the front of the LRU.
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+RATE_LIMITS = {
+    "recommendations": int(
+        os.getenv("RATE_LIMIT_RECOMMENDATIONS", os.getenv("RATE_LIMIT_REQUESTS", "10"))
+    ),
+    "details": int(os.getenv("RATE_LIMIT_DETAILS", "30")),
+    "autocomplete": int(os.getenv("RATE_LIMIT_AUTOCOMPLETE", "120")),
+}
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMITED_PATHS = {
+    "/api/recommendations": "recommendations",
+    "/api/recommendations/stream": "recommendations",
+    "/api/game-details": "details",
+    "/api/igdb-autocomplete": "autocomplete",
+}
+
+
+def sliding_window_hit(counter, limit, window, now):
+    """
+    Apply one request to counter = [window_index, previous, current] in place.
+    Returns (allowed, remaining, reset_after, retry_after).
+    """
+    index = int(now // window)
+    if counter[0] != index:
+        counter[1] = counter[2] if counter[0] == index - 1 else 0
+        counter[2] = 0
+        counter[0] = index
+    elapsed = now - index * window
+    previous_weight = counter[1] * (1 - elapsed / window)
+    reset_after = window - elapsed
+    if previous_weight + counter[2] + 1 > limit:
+        if counter[1] and counter[2] + 1 <= limit:
+            # Wait until enough of the previous window has slid out
+            needed = window * (1 - (limit - counter[2] - 1) / counter[1])
+            retry_after = needed - elapsed
+        else:
+            retry_after = reset_after
+        return False, 0, reset_after, max(retry_after, 0)
+    counter[2] += 1
+    remaining = int(limit - previous_weight - counter[2])
+    return True, max(remaining, 0), reset_after, 0
+
+
+class MemoryRateLimitBackend:
+    """In-process rate limit counters, evicting idle and least recent clients"""
+
+    blocking = False
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()  # key -> [window_index, previous, current]
+
+    def hit(self, key, limit, window, now):
+        counter = self._counters.pop(key, None) or [int(now // window), 0, 0]
+        result = sliding_window_hit(counter, limit, window, now)
+        self._counters[key] = counter
+        self._evict(window, now)
+        return result
+
+    def _evict(self, window, now):
+        idle_before = int(now // window) - 1
+        while self._counters:
+            key, counter = next(iter(self._counters.items()))
+            if counter[0] >= idle_before and len(self._counters) <= self.max_keys:
+                break
+            del self._counters[key]
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class SqliteRateLimitBackend:
+    """Rate limit counters in the shared state database, for multi-worker mode"""
+
+    PRUNE_EVERY = 1000  # hits between sweeps of idle counters
+    blocking = True  # SQLite writes may wait on other workers' locks
+
+    def __init__(self, store):
+        self.store = store
+        self._hits = 0
+
+    def hit(self, key, limit, window, now):
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT window_index, previous, current FROM rate_limits "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            counter = list(row) if row else [int(now // window), 0, 0]
+            result = sliding_window_hit(counter, limit, window, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits "
+                "(key, window_index, previous, current) VALUES (?, ?, ?, ?)",
+                (key, *counter),
+            )
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM rate_limits WHERE window_index < ?",
+                    (int(now // window) - 1,),
+                )
+        return result
+
+
+class RateLimiter:
+    """
+    Per-route limits over a pluggable backend exposing hit(key, limit, window,
+    now); blocking backends are called off the event loop.
+    """
+
+    def __init__(self, backend, limits, window=RATE_LIMIT_WINDOW):
+        self.backend = backend
+        self.limits = limits
+        self.window = window
+
+    async def check(self, route, client_ip):
+        """Returns (allowed, headers) for one request"""
+        limit = self.limits[route]
+        hit_args = (f"{route}:{client_ip}", limit, self.window, time.time())
+        if self.backend.blocking:
+            hit = await asyncio.to_thread(self.backend.hit, *hit_args)
+        else:
+            hit = self.backend.hit(*hit_args)
+        allowed, remaining, reset_after, retry_after = hit
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(max(int(-(-reset_after // 1)), 1)),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(int(-(-retry_after // 1)), 1))
+        return allowed, headers
+
+
+rate_limiter = RateLimiter(
+    SqliteRateLimitBackend(shared_state) if shared_state else MemoryRateLimitBackend(),
+    RATE_LIMITS,
+)
+
+
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    route = RATE_LIMITED_PATHS.get(request.url.path)
+    if route is None or request.method == "OPTIONS":
+        return await call_next(request)
+    client_ip = request.client.host if request.client else "unknown"
+    allowed, headers = await rate_limiter.check(route, client_ip)
+    if not allowed:
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": "Rate limit exceeded",
+                "message": "Too many requests. Please try again later.",
+            },
+            headers=headers,
+        )
+    response = await call_next(request)
+    response.headers.update(headers)
+    return response
+
+
+# --- END RATE LIMITING ---
+
+# Streaming responses are timed up to their first byte
+TIMED_ROUTES = set(RATE_LIMITED_PATHS)
+
+
+@app.middleware("http")
+async def request_timing_middleware(request: Request, call_next):
+    """Time API requests, tag their logs with a request id, set Server-Timing"""
+    route = request.url.path
+    if route not in TIMED_ROUTES:
+        return await call_next(request)
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    timings = []
+    timings_token = request_timings.set(timings)
+    request_id_token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Request completed",
+            extra={
+                "route": route,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 1),
+                "stages": {stage: round(sec * 1000, 1) for stage, sec in timings},
+            },
+        )
+    finally:
+        request_timings.reset(timings_token)
+        request_id_var.reset(request_id_token)
+    request_seconds.observe(elapsed, route)
+    requests_total.inc(route, str(response.status_code))
+    response.headers["Server-Timing"] = server_timing_header(
+        timings + [("total", elapsed)]
+    )
+    response.headers["Timing-Allow-Origin"] = "*"
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+# Enable CORS (registered last so it also wraps rate-limited responses)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -36,6 +1212,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Retry-After",
+        "Server-Timing",
+        "X-Request-ID",
+        "X-RateLimit-Limit",
+        "X-RateLimit-Remaining",
+        "X-RateLimit-Reset",
+    ],
 )
 
 # Serve static files from the React build
@@ -52,6 +1236,9 @@ class RecommendationRequest(BaseModel):
 
 class GameDetailsRequest(BaseModel):
     title: str
+    # RAWG id/slug from a recommendation card; lets the lookup skip the search
+    rawg_id: Optional[int] = None
+    slug: Optional[str] = None
 
 
 # Function to get the Claude API key
@@ -86,122 +1273,850 @@ def check_environment():
     return missing_vars
 
 
+# --- OAUTH TOKEN MANAGER ---
+# Twitch and IGDB both authenticate with client-credentials tokens from
+# id.twitch.tv. One manager owns every token: identical credential sets share a
+# token, tokens are refreshed in the background before they expire, and a 401
+# from the API invalidates the token and retries the call once.
+TOKEN_REFRESH_MARGIN = 600  # refresh this many seconds before expiry
+TOKEN_EXPIRY_SKEW = 60  # treat tokens as expired this many seconds early
+TOKEN_REFRESH_RETRY_DELAY = 30  # seconds before retrying a failed refresh
+TOKEN_LEASE_TTL = 30  # seconds one worker may spend fetching a shared token
+TOKEN_LEASE_POLL = 0.1  # seconds between checks while another worker fetches
+
+
+class OAuthTokenManager:
+    """
+    Client-credentials tokens keyed by (token_url, client_id, client_secret).
+    With a shared state store, workers share tokens and only the worker holding
+    the refresh lease calls the token endpoint.
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN, store=None):
+        self.refresh_margin = refresh_margin
+        self.store = store
+        self._tokens = {}  # credentials -> {"access_token", "expires_at"}
+        self._credentials = set()  # credentials kept warm by the refresh loop
+        self.refreshes = 0
+
+    def register(self, token_url, client_id, client_secret):
+        if client_id and client_secret:
+            self._credentials.add((token_url, client_id, client_secret))
+
+    async def get_token(self, token_url, client_id, client_secret):
+        credentials = (token_url, client_id, client_secret)
+        self.register(*credentials)
+        entry = self._tokens.get(credentials)
+        if entry is None and self.store is not None:
+            entry = await asyncio.to_thread(self._load_shared, credentials)
+            if entry:
+                self._tokens[credentials] = entry
+        if entry and time.time() < entry["expires_at"] - TOKEN_EXPIRY_SKEW:
+            return entry["access_token"]
+        # Only reached before the background refresh has run, or after a 401
+        return await self.refresh(*credentials)
+
+    async def refresh(self, token_url, client_id, client_secret):
+        credentials = (token_url, client_id, client_secret)
+        stale = self._tokens.get(credentials, {}).get("access_token")
+        entry = await upstream_flights.do(
+            ("twitch_auth", token_url, client_id),
+            lambda: self._fetch(credentials, stale),
+        )
+        self._tokens[credentials] = entry
+        return entry["access_token"]
+
+    async def _fetch(self, credentials, stale):
+        if self.store is None:
+            return await self._request_token(*credentials)
+        lease = f"oauth:{credentials[0]}:{credentials[1]}"
+        deadline = time.time() + TOKEN_LEASE_TTL
+        while True:
+            # Another worker may already have replaced the stale token
+            entry = await asyncio.to_thread(self._load_shared, credentials)
+            if (
+                entry
+                and entry["access_token"] != stale
+                and entry["expires_at"] - time.time() > TOKEN_EXPIRY_SKEW
+            ):
+                return entry
+            if time.time() >= deadline:
+                break
+            if await asyncio.to_thread(self.store.try_lease, lease, TOKEN_LEASE_TTL):
+                try:
+                    entry = await self._request_token(*credentials)
+                    await asyncio.to_thread(self._save_shared, credentials, entry)
+                    return entry
+                finally:
+                    await asyncio.to_thread(self.store.release_lease, lease)
+            await asyncio.sleep(TOKEN_LEASE_POLL)
+        # The lease holder stalled; fetch a token for this worker only
+        return await self._request_token(*credentials)
+
+    async def _request_token(self, token_url, client_id, client_secret):
+        data = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "grant_type": "client_credentials",
+        }
+        session = get_http_session("twitch_auth")
+        started, status = time.monotonic(), None
+        try:
+            async with session.post(token_url, data=data) as resp:
+                status = resp.status
+                resp.raise_for_status()
+                self.refreshes += 1
+                result = await resp.json()
+        finally:
+            record_upstream_call("twitch_auth", status, time.monotonic() - started)
+        return {
+            "access_token": result["access_token"],
+            "expires_at": time.time() + result["expires_in"],
+        }
+
+    @staticmethod
+    def _shared_key(credentials):
+        # The secret never leaves the process; the client id identifies the app
+        return json.dumps([credentials[0], credentials[1]])
+
+    def _load_shared(self, credentials):
+        row = self.store.fetchone(
+            "SELECT access_token, expires_at FROM oauth_tokens WHERE key = ?",
+            (self._shared_key(credentials),),
+        )
+        return {"access_token": row[0], "expires_at": row[1]} if row else None
+
+    def _save_shared(self, credentials, entry):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO oauth_tokens (key, access_token, expires_at) "
+                "VALUES (?, ?, ?)",
+                (
+                    self._shared_key(credentials),
+                    entry["access_token"],
+                    entry["expires_at"],
+                ),
+            )
+
+    async def invalidate(self, token_url, client_id, client_secret, access_token):
+        credentials = (token_url, client_id, client_secret)
+        entry = self._tokens.get(credentials)
+        if entry and entry["access_token"] == access_token:
+            del self._tokens[credentials]
+        if self.store is not None:
+            await asyncio.to_thread(self._delete_shared, credentials, access_token)
+
+    def _delete_shared(self, credentials, access_token):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "DELETE FROM oauth_tokens WHERE key = ? AND access_token = ?",
+                (self._shared_key(credentials), access_token),
+            )
+
+    async def run(self):
+        """Background loop that refreshes every known token ahead of expiry"""
+        while True:
+            now = time.time()
+            next_check = now + 3600
+            for credentials in list(self._credentials):
+                entry = self._tokens.get(credentials)
+                if entry is None or entry["expires_at"] - now <= self.refresh_margin:
+                    try:
+                        await self.refresh(*credentials)
+                    except Exception as e:
+                        logger.warning("Token refresh failed", extra={"error": str(e)})
+                        next_check = min(next_check, now + TOKEN_REFRESH_RETRY_DELAY)
+                        continue
+                    entry = self._tokens[credentials]
+                next_check = min(next_check, entry["expires_at"] - self.refresh_margin)
+            await asyncio.sleep(max(next_check - time.time(), 1))
+
+
+oauth_tokens = OAuthTokenManager(store=shared_state)
+
+
+async def authorized_request(
+    provider, method, url, token_url, client_id, client_secret, **kwargs
+):
+    """
+    Call a Twitch-authenticated API and return (status, json payload).
+    A 401 means the token was revoked or expired early: it is dropped and the
+    request is retried once with a fresh token.
+    """
+    for attempt in range(2):
+        token = await oauth_tokens.get_token(token_url, client_id, client_secret)
+        headers = {"Client-ID": client_id, "Authorization": f"Bearer {token}"}
+        status, payload = await upstream_request(
+            provider, method, url, headers=headers, **kwargs
+        )
+        if status == 401 and attempt == 0:
+            await oauth_tokens.invalidate(token_url, client_id, client_secret, token)
+            continue
+        return status, payload
+
+
+# --- END OAUTH TOKEN MANAGER ---
+
 # --- TWITCH API INTEGRATION ---
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
-TWITCH_TOKEN_URL = "https://id.twitch.tv/oauth2/token"
-TWITCH_API_BASE = "https://api.twitch.tv/helix"
-
-_twitch_token = None
-_twitch_token_expiry = 0
+# Upstream base URLs are overridable so benchmarks can point at local stand-ins
+TWITCH_TOKEN_URL = os.getenv("TWITCH_TOKEN_URL", "https://id.twitch.tv/oauth2/token")
+TWITCH_API_BASE = os.getenv("TWITCH_API_BASE", "https://api.twitch.tv/helix")
 
 
 async def get_twitch_token():
-    global _twitch_token, _twitch_token_expiry
-    if _twitch_token and time.time() < _twitch_token_expiry:
-        return _twitch_token
-    data = {
-        "client_id": TWITCH_CLIENT_ID,
-        "client_secret": TWITCH_CLIENT_SECRET,
-        "grant_type": "client_credentials",
+    return await oauth_tokens.get_token(
+        TWITCH_TOKEN_URL, TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET
+    )
+
+
+async def helix_get(path, params):
+    """GET a Helix endpoint; returns (status, json payload or None)"""
+    return await authorized_request(
+        "twitch",
+        "GET",
+        f"{TWITCH_API_BASE}{path}",
+        TWITCH_TOKEN_URL,
+        TWITCH_CLIENT_ID,
+        TWITCH_CLIENT_SECRET,
+        params=params,
+    )
+
+
+TWITCH_BATCH_SIZE = 100  # Helix accepts up to 100 name/game_id params per request
+TWITCH_STREAMS_MAX_PAGES = 3  # pages of 100 streams followed per batch of game ids
+
+# Lowercased game name -> Twitch game id (None if Twitch doesn't know the game).
+# Game ids never change, so resolved names are kept for the life of the process.
+_twitch_game_ids = {}
+
+
+def _batches(items, size):
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+async def resolve_twitch_game_ids(game_names):
+    """Map game names to Twitch game ids, resolving unknown names in batches"""
+    unknown = [
+        name
+        for name in dict.fromkeys(game_names)
+        if name.lower() not in _twitch_game_ids
+    ]
+    for batch in _batches(unknown, TWITCH_BATCH_SIZE):
+        status, data = await helix_get("/games", [("name", name) for name in batch])
+        if status != 200:
+            continue
+        found = {game["name"].lower(): game["id"] for game in data.get("data", [])}
+        for name in batch:
+            _twitch_game_ids[name.lower()] = found.get(name.lower())
+    return {name: _twitch_game_ids.get(name.lower()) for name in game_names}
+
+
+async def _fetch_stream_viewers(game_ids, max_pages=TWITCH_STREAMS_MAX_PAGES):
+    viewers = defaultdict(int)
+    params = [("game_id", game_id) for game_id in game_ids] + [("first", 100)]
+    for _ in range(max_pages):
+        status, data = await helix_get("/streams", params)
+        if status != 200:
+            break
+        for stream in data.get("data", []):
+            viewers[stream["game_id"]] += stream["viewer_count"]
+        cursor = data.get("pagination", {}).get("cursor")
+        if not cursor or not data.get("data"):
+            break
+        params = [p for p in params if p[0] != "after"] + [("after", cursor)]
+    return viewers
+
+
+async def get_twitch_viewer_counts(game_names):
+    """Return {game_name: live viewer count} for many games in a few Helix calls"""
+    if not game_names:
+        return {}
+    names = tuple(sorted(set(game_names)))
+    counts = await upstream_flights.do(
+        ("twitch", "viewers", names), lambda: _get_twitch_viewer_counts(names)
+    )
+    return {name: counts.get(name, 0) for name in game_names}
+
+
+async def _get_twitch_viewer_counts(game_names):
+    game_ids = await resolve_twitch_game_ids(game_names)
+
+    known_ids = list(dict.fromkeys(gid for gid in game_ids.values() if gid))
+    viewers = defaultdict(int)
+    for batch_viewers in await asyncio.gather(
+        *(
+            _fetch_stream_viewers(batch)
+            for batch in _batches(known_ids, TWITCH_BATCH_SIZE)
+        )
+    ):
+        viewers.update(batch_viewers)
+    return {
+        name: viewers.get(game_id, 0) if game_id else 0
+        for name, game_id in game_ids.items()
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(TWITCH_TOKEN_URL, data=data) as resp:
-            resp.raise_for_status()
-            result = await resp.json()
-            _twitch_token = result["access_token"]
-            _twitch_token_expiry = time.time() + result["expires_in"] - 60
-            return _twitch_token
 
 
 async def get_twitch_viewer_count(game_name):
-    token = await get_twitch_token()
-    headers = {"Client-ID": TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
-    # Get the game ID from Twitch
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{TWITCH_API_BASE}/games", headers=headers, params={"name": game_name}
-        ) as resp:
-            data = await resp.json()
-            if not data.get("data"):
-                return 0
-            game_id = data["data"][0]["id"]
-        # Get streams for this game ID
-        async with session.get(
-            f"{TWITCH_API_BASE}/streams",
-            headers=headers,
-            params={"game_id": game_id, "first": 100},
-        ) as resp:
-            data = await resp.json()
-            if not data.get("data"):
-                return 0
-            return sum(stream["viewer_count"] for stream in data["data"])
+    counts = await get_twitch_viewer_counts([game_name])
+    return counts.get(game_name, 0)
 
 
 # --- END TWITCH API INTEGRATION ---
 
+# --- TWITCH VIEWER AGGREGATOR ---
+# Viewer counts are kept off the request path: a background task walks Helix
+# top games and the whole live stream list and keeps a game id -> viewers map.
+# Requests read the map; only games it has never seen are fetched lazily, and
+# those are then tracked by the background task too. Only complete sums go in
+# the map: if the stream list can't be read to the end, top and tracked games
+# are counted per game instead.
+TWITCH_AGGREGATE_INTERVAL = int(os.getenv("TWITCH_AGGREGATE_INTERVAL", "120"))
+TWITCH_TOP_GAMES_PAGES = 5  # pages of 100 top games
+TWITCH_AGGREGATE_MAX_PAGES = int(
+    os.getenv("TWITCH_AGGREGATE_MAX_PAGES", "1000")
+)  # pages of 100 streams per pass before falling back to per-game counts
+TWITCH_VIEWERS_MAX_AGE = 3 * TWITCH_AGGREGATE_INTERVAL  # seconds a count is trusted
+TWITCH_TRACKED_MAX = 2000  # long-tail games refreshed by the background task
+
+
+class TwitchViewerAggregator:
+    """Background-maintained live viewer counts per Twitch game"""
+
+    def __init__(self):
+        self.viewers = {}  # game id -> (viewers, updated_at)
+        self.tracked = OrderedDict()  # long-tail game ids found by lazy lookups
+        self.last_refresh = 0.0
+        self.stats = Counter()
+
+    async def refresh(self):
+        game_ids = list(dict.fromkeys([*await self._scan_top_games(), *self.tracked]))
+        counts = defaultdict(int)
+        if await self._scan_streams(counts):
+            # Every live stream was counted: a game missing from them has none
+            for game_id in game_ids:
+                counts[game_id] += 0
+        else:
+            # Sums from a cut-short scan are partial; count these games directly
+            self.stats["partial_scans"] += 1
+            counts = await self._count_per_game(game_ids)
+        now = time.time()
+        self.viewers.update(
+            (game_id, (count, now)) for game_id, count in counts.items()
+        )
+        self.last_refresh = now
+        self.stats["refreshes"] += 1
+
+    async def _scan_top_games(self):
+        """Ids of the top games on Twitch, caching their name -> id mapping"""
+        game_ids = []
+        params = [("first", 100)]
+        for _ in range(TWITCH_TOP_GAMES_PAGES):
+            status, data = await helix_get("/games/top", params)
+            if status != 200:
+                raise Exception(f"Twitch top games error: {status}")
+            for game in data.get("data", []):
+                _twitch_game_ids[game["name"].lower()] = game["id"]
+                game_ids.append(game["id"])
+            cursor = data.get("pagination", {}).get("cursor")
+            if not cursor or not data.get("data"):
+                break
+            params = [("first", 100), ("after", cursor)]
+        return game_ids
+
+    async def _scan_streams(self, counts):
+        """Add up viewers per game over all live streams; False if cut short"""
+        params = [("first", 100)]
+        for _ in range(TWITCH_AGGREGATE_MAX_PAGES):
+            status, data = await helix_get("/streams", params)
+            if status != 200:
+                raise Exception(f"Twitch streams error: {status}")
+            streams = data.get("data", [])
+            for stream in streams:
+                counts[stream["game_id"]] += stream["viewer_count"]
+            cursor = data.get("pagination", {}).get("cursor")
+            if not cursor or not streams:
+                return True
+            params = [("first", 100), ("after", cursor)]
+        return False
+
+    async def _count_per_game(self, game_ids):
+        counts = {}
+        for batch in _batches(game_ids, TWITCH_BATCH_SIZE):
+            batch_viewers = await _fetch_stream_viewers(
+                batch, max_pages=TWITCH_AGGREGATE_MAX_PAGES
+            )
+            for game_id in batch:
+                counts[game_id] = batch_viewers.get(game_id, 0)
+        return counts
+
+    def cached_counts(self, game_names):
+        """Split names into ({name: viewers} known from the map, [unknown names])"""
+        known, unknown = {}, []
+        cutoff = time.time() - TWITCH_VIEWERS_MAX_AGE
+        for name in game_names:
+            key = name.lower()
+            if key in _twitch_game_ids and _twitch_game_ids[key] is None:
+                known[name] = 0  # not a game on Twitch
+                continue
+            entry = self.viewers.get(_twitch_game_ids.get(key))
+            if entry is not None and entry[1] >= cutoff:
+                known[name] = entry[0]
+            else:
+                unknown.append(name)
+        return known, unknown
+
+    async def get_viewer_counts(self, game_names):
+        known, unknown = self.cached_counts(game_names)
+        self.stats["hits"] += len(known)
+        self.stats["lazy"] += len(unknown)
+        if unknown:
+            fetched = await get_twitch_viewer_counts(unknown)
+            now = time.time()
+            for name in unknown:
+                game_id = _twitch_game_ids.get(name.lower())
+                if game_id:
+                    self.viewers[game_id] = (fetched.get(name, 0), now)
+                    self._track(game_id)
+            known.update(fetched)
+        return known
+
+    def _track(self, game_id):
+        self.tracked[game_id] = True
+        self.tracked.move_to_end(game_id)
+        while len(self.tracked) > TWITCH_TRACKED_MAX:
+            self.tracked.popitem(last=False)
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(
+                    "Twitch viewer aggregation failed", extra={"error": str(e)}
+                )
+            await asyncio.sleep(TWITCH_AGGREGATE_INTERVAL)
+
+
+twitch_viewers = TwitchViewerAggregator()
+
+
+# --- END TWITCH VIEWER AGGREGATOR ---
+
 # --- IGDB API INTEGRATION ---
 IGDB_CLIENT_ID = os.getenv("IGDB_CLIENT_ID", TWITCH_CLIENT_ID)
 IGDB_CLIENT_SECRET = os.getenv("IGDB_CLIENT_SECRET", TWITCH_CLIENT_SECRET)
-IGDB_TOKEN_URL = "https://id.twitch.tv/oauth2/token"
-IGDB_API_BASE = "https://api.igdb.com/v4"
+IGDB_TOKEN_URL = os.getenv("IGDB_TOKEN_URL", TWITCH_TOKEN_URL)
+IGDB_API_BASE = os.getenv("IGDB_API_BASE", "https://api.igdb.com/v4")
+
+
+async def get_igdb_token():
+    return await oauth_tokens.get_token(
+        IGDB_TOKEN_URL, IGDB_CLIENT_ID, IGDB_CLIENT_SECRET
+    )
 
-_igdb_token = None
-_igdb_token_expiry = 0
+
+async def igdb_search_games(query, limit=5):
+    data = (
+        f'search "{query}"; '
+        "fields name,slug,first_release_date,cover.url,total_rating_count; "
+        f"limit {limit};"
+    )
+    try:
+        return await upstream_flights.do(("igdb", data), lambda: _igdb_search(data))
+    except Exception as e:
+        logger.warning("IGDB search failed", extra={"error": str(e)})
+        return []
+
+
+async def _igdb_search(data):
+    cached = await upstream_cache.get("igdb:games", {"body": data})
+    if cached is not None:
+        return cached
+    status, result = await authorized_request(
+        "igdb",
+        "POST",
+        f"{IGDB_API_BASE}/games",
+        IGDB_TOKEN_URL,
+        IGDB_CLIENT_ID,
+        IGDB_CLIENT_SECRET,
+        data=data,
+        retry=True,  # IGDB queries are POSTs but only read data
+    )
+    if status != 200:
+        raise Exception(f"IGDB API error: {status}")
+    await cache_upstream_response("igdb:games", {"body": data}, result)
+    return result
+
+
+# --- END IGDB API INTEGRATION ---
 
 
-async def get_igdb_token():
-    global _igdb_token, _igdb_token_expiry
-    if _igdb_token and time.time() < _igdb_token_expiry:
-        return _igdb_token
-    data = {
-        "client_id": IGDB_CLIENT_ID,
-        "client_secret": IGDB_CLIENT_SECRET,
-        "grant_type": "client_credentials",
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(IGDB_TOKEN_URL, data=data) as resp:
-            resp.raise_for_status()
-            result = await resp.json()
-            _igdb_token = result["access_token"]
-            _igdb_token_expiry = time.time() + result["expires_in"] - 60
-            return _igdb_token
+# --- RAWG API INTEGRATION ---
+RAWG_API_BASE = os.getenv("RAWG_API_BASE", "https://api.rawg.io/api")
 
 
-async def igdb_search_games(query, limit=5):
-    try:
-        token = await get_igdb_token()
-        headers = {
-            "Client-ID": IGDB_CLIENT_ID,
-            "Authorization": f"Bearer {token}",
-        }
-        data = f'search "{query}"; fields name,slug,first_release_date,cover.url; limit {limit};'
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{IGDB_API_BASE}/games", headers=headers, data=data
-            ) as resp:
-                resp.raise_for_status()
-                return await resp.json()
-    except Exception as e:
-        print(f"IGDB search error: {e}")
-        return []
+async def rawg_get(endpoint, path, params=None):
+    """
+    GET a RAWG endpoint through the persistent upstream cache.
+    Only requests that actually reach RAWG count against the quota, and
+    concurrent identical requests share a single upstream call.
+    """
+    params = dict(params or {})
+    cache_params = {"path": path, **params}
+    return await upstream_flights.do(
+        ("rawg", upstream_cache.make_key(endpoint, cache_params)),
+        lambda: _rawg_get(endpoint, path, params, cache_params),
+    )
 
 
-# --- END IGDB API INTEGRATION ---
+async def _rawg_get(endpoint, path, params, cache_params):
+    cached = await upstream_cache.get(endpoint, cache_params)
+    if cached is not None:
+        return cached
+    status, result = await upstream_request(
+        "rawg",
+        "GET",
+        f"{RAWG_API_BASE}{path}",
+        params={**params, "key": get_rawg_api_key()},
+    )
+    if status != 200:
+        raise Exception(f"RAWG API error: {status}")
+    rawg_quota.record(params.get("search", path))
+    await cache_upstream_response(endpoint, cache_params, result)
+    return result
+
+
+# --- END RAWG API INTEGRATION ---
+
+
+# --- LOCAL AUTOCOMPLETE INDEX ---
+# Autocomplete is answered from an in-process title index: a prefix trie over
+# the start of every word in a title, where each node keeps its most popular
+# titles, plus a trigram index for misspelled queries. IGDB is only asked about
+# prefixes the index cannot fill; its results are added to the index, as are
+# titles seen in recommendations and in cached IGDB responses at startup.
+AUTOCOMPLETE_LIMIT = 7
+AUTOCOMPLETE_MAX_TITLES = int(os.getenv("AUTOCOMPLETE_MAX_TITLES", "50000"))
+AUTOCOMPLETE_MAX_PREFIX = 32  # characters of each word suffix indexed in the trie
+AUTOCOMPLETE_MIN_SIMILARITY = 0.4  # trigram Dice coefficient for fuzzy matches
+AUTOCOMPLETE_SEEN_BOOST = 25  # popularity added each time a title is recommended
+AUTOCOMPLETE_FETCHED_PREFIXES = 10000  # cold prefixes remembered as fetched
+AUTOCOMPLETE_FETCHED_TTL = int(
+    os.getenv("AUTOCOMPLETE_FETCHED_TTL", 24 * 3600)
+)  # seconds before a fetched prefix is asked about again
+AUTOCOMPLETE_EVICT_SHARE = 0.01  # least popular share of titles dropped when full
+
+
+def normalize_autocomplete_text(text):
+    return " ".join("".join(c if c.isalnum() else " " for c in text.lower()).split())
+
+
+def title_trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.top = []  # keys of the most popular titles below this node
+
+
+class AutocompleteIndex:
+    """Popularity-ranked prefix and trigram index of game titles"""
+
+    def __init__(self, max_titles=AUTOCOMPLETE_MAX_TITLES, top_k=AUTOCOMPLETE_LIMIT):
+        self.max_titles = max_titles
+        self.top_k = top_k
+        # normalized name -> {"name", "slug", "cover", "rating_count", "boost",
+        # "popularity"}; popularity = IGDB rating count + recommendation boosts
+        self._titles = {}
+        self._root = _TrieNode()
+        self._trigrams = defaultdict(set)
+        # normalized query -> (IGDB result count, fetched at)
+        self._fetched = OrderedDict()
+        # Queries answered from the index alone vs. sent to IGDB
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._titles)
+
+    def _rank(self, key):
+        return (-self._titles[key]["popularity"], len(key), key)
+
+    def add(self, name, slug=None, cover=None, rating_count=0, boost=0):
+        """
+        Insert a title or raise its popularity. The IGDB rating count is kept
+        as the largest one seen, so the same game appearing in many responses
+        isn't counted again; boosts add up. A full index makes room by dropping
+        its least popular titles.
+        """
+        key = normalize_autocomplete_text(name or "")
+        if not key:
+            return
+        entry = self._titles.get(key)
+        if entry is None:
+            if len(self._titles) >= self.max_titles:
+                self._evict(max(1, int(self.max_titles * AUTOCOMPLETE_EVICT_SHARE)))
+            entry = {
+                "name": name,
+                "slug": slug,
+                "cover": cover,
+                "rating_count": 0,
+                "boost": 0,
+                "popularity": 0,
+            }
+            self._titles[key] = entry
+            grams = title_trigrams(key)
+            entry["grams"] = len(grams)
+            for gram in grams:
+                self._trigrams[gram].add(key)
+        entry["slug"] = entry["slug"] or slug
+        entry["cover"] = entry["cover"] or cover
+        entry["rating_count"] = max(entry["rating_count"], rating_count)
+        entry["boost"] += boost
+        entry["popularity"] = entry["rating_count"] + entry["boost"]
+        self._promote(key)
+
+    def _promote(self, key):
+        starts = [0] + [i + 1 for i, c in enumerate(key) if c == " "]
+        for start in starts:
+            node = self._root
+            for char in key[start : start + AUTOCOMPLETE_MAX_PREFIX]:
+                node = node.children.setdefault(char, _TrieNode())
+                top = node.top
+                if key not in top:
+                    if len(top) >= self.top_k and self._rank(top[-1]) < self._rank(key):
+                        continue
+                    top.append(key)
+                top.sort(key=self._rank)
+                del top[self.top_k :]
+
+    def _evict(self, count):
+        for key in heapq.nlargest(count, self._titles, key=self._rank):
+            self._remove(key)
+
+    def _remove(self, key):
+        del self._titles[key]
+        for gram in title_trigrams(key):
+            keys = self._trigrams[gram]
+            keys.discard(key)
+            if not keys:
+                del self._trigrams[gram]
+        starts = [0] + [i + 1 for i, c in enumerate(key) if c == " "]
+        for start in starts:
+            path = []
+            node = self._root
+            for char in key[start : start + AUTOCOMPLETE_MAX_PREFIX]:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                path.append((node, char, child))
+                node = child
+            # The least popular titles are only listed where every title fits,
+            # so what's left in each list is still complete; empty nodes go
+            for parent, char, child in reversed(path):
+                if key in child.top:
+                    child.top.remove(key)
+                if not child.top and not child.children:
+                    del parent.children[char]
+            # Fetched prefixes that found this title no longer cover it
+            for end in range(1, len(key) - start + 1):
+                self._fetched.pop(key[start : start + end], None)
+
+    def add_igdb_results(self, games):
+        """Add IGDB results; returns how many of them are in the index"""
+        for game in games:
+            self.add(
+                game.get("name"),
+                game.get("slug"),
+                game.get("cover", {}).get("url"),
+                game.get("total_rating_count") or 0,
+            )
+        return sum(
+            normalize_autocomplete_text(game.get("name") or "") in self._titles
+            for game in games
+        )
 
+    def _prefix_keys(self, query):
+        node = self._root
+        for char in query[:AUTOCOMPLETE_MAX_PREFIX]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        if len(query) <= AUTOCOMPLETE_MAX_PREFIX:
+            return node.top
+        return [key for key in node.top if query in key]
+
+    def _fuzzy_keys(self, query, limit):
+        grams = title_trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        scored = []
+        for key, count in shared.items():
+            score = 2 * count / (len(grams) + self._titles[key]["grams"])
+            if score >= AUTOCOMPLETE_MIN_SIMILARITY:
+                scored.append((-score, self._rank(key), key))
+        scored.sort()
+        return [key for _, _, key in scored[:limit]]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        query = normalize_autocomplete_text(query)
+        if not query:
+            return []
+        keys = list(self._prefix_keys(query)[:limit])
+        if len(keys) < limit:
+            keys += [k for k in self._fuzzy_keys(query, limit) if k not in keys]
+        return [self._public(key) for key in keys[:limit]]
+
+    def _public(self, key):
+        entry = self._titles[key]
+        return {"name": entry["name"], "slug": entry["slug"], "cover": entry["cover"]}
+
+    def is_warm(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """True when IGDB has recently been asked about this query or a prefix of it"""
+        query = normalize_autocomplete_text(query)
+        if self._fetched_count(query) is not None:
+            return True
+        # A shorter prefix that returned fewer than a full page covered this one too
+        return any(
+            0 < (self._fetched_count(query[:end]) or limit) < limit
+            for end in range(1, len(query))
+        )
 
-# --- IGDB AUTOCOMPLETE ENDPOINT ---
-@app.get("/api/igdb-autocomplete")
-async def igdb_autocomplete(q: str = Query(..., min_length=1)):
-    results = await igdb_search_games(q, limit=7)
-    return [
+    def _fetched_count(self, query):
+        fetched = self._fetched.get(query)
+        if fetched is None:
+            return None
+        count, fetched_at = fetched
+        if time.time() - fetched_at > AUTOCOMPLETE_FETCHED_TTL:
+            del self._fetched[query]
+            return None
+        return count
+
+    def mark_fetched(self, query, count):
+        query = normalize_autocomplete_text(query)
+        self._fetched[query] = (count, time.time())
+        self._fetched.move_to_end(query)
+        while len(self._fetched) > AUTOCOMPLETE_FETCHED_PREFIXES:
+            self._fetched.popitem(last=False)
+
+    def load_cached_igdb(self):
+        """Seed the index from IGDB responses already in the upstream cache"""
+        for games in upstream_cache.values("igdb:games"):
+            self.add_igdb_results(games)
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+async def autocomplete_titles(query, limit=AUTOCOMPLETE_LIMIT):
+    with timed_stage("autocomplete_index"):
+        results = autocomplete_index.search(query, limit)
+    if len(results) >= limit or autocomplete_index.is_warm(query, limit):
+        autocomplete_index.hits += 1
+        return results
+    autocomplete_index.misses += 1
+    with timed_stage("igdb_autocomplete"):
+        games = await igdb_search_games(query, limit=limit)
+    # Only a query whose results all made it into the index can be answered from it
+    if games and autocomplete_index.add_igdb_results(games) == len(games):
+        autocomplete_index.mark_fetched(query, len(games))
+    # IGDB's own ordering wins for a cold query, topped up from the index
+    seen = set()
+    merged = []
+    for game in [
         {
             "name": g["name"],
             "slug": g.get("slug"),
             "cover": g.get("cover", {}).get("url"),
         }
-        for g in results
-    ]
+        for g in games
+    ] + results:
+        if game["name"] not in seen:
+            seen.add(game["name"])
+            merged.append(game)
+    return merged[:limit]
+
+
+# --- END LOCAL AUTOCOMPLETE INDEX ---
+
+
+# --- IGDB AUTOCOMPLETE ENDPOINT ---
+@app.get("/api/igdb-autocomplete")
+async def igdb_autocomplete(
+    q: str = Query(..., min_length=1), fields: Optional[str] = None
+):
+    results = await autocomplete_titles(q, limit=AUTOCOMPLETE_LIMIT)
+    selected = parse_fields(fields)
+    return FastJSONResponse([select_fields(result, selected) for result in results])
+
+
+def parse_autocomplete_message(text):
+    """Accept {"id": ..., "q": ...} messages, a JSON string, or a bare query string"""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    if isinstance(message, str):
+        return None, message.strip()
+    if not isinstance(message, dict):
+        return None, text.strip()
+    return message.get("id"), str(message.get("q") or "").strip()
+
+
+@app.websocket("/api/igdb-autocomplete/ws")
+async def igdb_autocomplete_ws(websocket: WebSocket):
+    """
+    One connection per search box. Every keystroke sends a query; a newer
+    query cancels the lookup still running for an older one, so only the
+    latest query is answered and stale IGDB calls are abandoned.
+    """
+    await websocket.accept()
+    client_ip = websocket.client.host if websocket.client else "unknown"
+    pending = None
+
+    async def answer(query_id, query):
+        try:
+            results = await autocomplete_titles(query, limit=AUTOCOMPLETE_LIMIT)
+            await websocket.send_json({"id": query_id, "q": query, "results": results})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Autocomplete socket lookup failed", extra={"error": str(e)})
+
+    try:
+        while True:
+            query_id, query = parse_autocomplete_message(await websocket.receive_text())
+            if pending is not None:
+                pending.cancel()
+                pending = None
+            if not query:
+                await websocket.send_json({"id": query_id, "q": query, "results": []})
+                continue
+            allowed, headers = await rate_limiter.check("autocomplete", client_ip)
+            if not allowed:
+                await websocket.send_json(
+                    {
+                        "id": query_id,
+                        "q": query,
+                        "error": "Rate limit exceeded",
+                        "retry_after": int(headers["Retry-After"]),
+                    }
+                )
+                continue
+            pending = asyncio.create_task(answer(query_id, query))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if pending is not None:
+            pending.cancel()
 
 
 # --- END IGDB AUTOCOMPLETE ENDPOINT ---
@@ -224,20 +2139,23 @@ def filters_to_natural_language(filters: dict) -> str:
     return ", ".join(f"{mapping.get(k, k)}: {v}" for k, v in filters.items() if v)
 
 
-# Enhanced GPT-4o-powered game recommendation system
-async def fetch_game_titles_gpt4o(preference: str, filters=None):  # noqa: C901
-    """
-    Enhanced gaming AI using GPT-4o with specialized gaming knowledge and reasoning
-    """
-    if filters is None:
-        filters = {}
-    openai_api_key = get_openai_api_key()
-    if not openai_api_key:
-        raise HTTPException(
-            status_code=500,
-            detail="AI recommendation service is currently unavailable. Please check your OpenAI API key configuration.",
-        )
+OPENAI_CHAT_URL = os.getenv(
+    "OPENAI_CHAT_URL", "https://api.openai.com/v1/chat/completions"
+)
+MAX_RECOMMENDED_TITLES = 18
+# Consume the completion as a stream and start RAWG lookups per finished title
+OPENAI_STREAM_TITLES = os.getenv("OPENAI_STREAM_TITLES", "true").lower() == "true"
+
+_TITLE_NUMBER_PREFIXES = tuple(f"{n}." for n in range(1, MAX_RECOMMENDED_TITLES + 1))
 
+AI_UNAVAILABLE_DETAIL = (
+    "Sorry, we're having trouble connecting to our AI "
+    "recommendation service right now. Please try again in a few moments."
+)
+
+
+def build_recommendation_messages(preference: str, filters: dict):  # noqa: C901
+    """Build the GPT-4o chat messages for a preference and its filters"""
     filter_str = filters_to_natural_language(filters)
 
     # Optimized gaming expert prompt - concise and focused
@@ -307,558 +2225,1932 @@ RECOMMENDATION STRATEGY:
         ):
             return True
 
-        return False
+        return False
+
+    # Determine the appropriate prompt based on input type
+    if is_likely_game_name(preference):
+        # For specific game names, focus on finding that game and similar ones
+        user_content = f"""Find the game "{preference}" and recommend similar games.
+
+REQUIREMENTS:
+- If "{preference}" is a real game, include it first
+- Then recommend 17 similar games (80% trending/popular, 20% classics)
+- Return ONLY comma-separated game titles
+- No explanations or extra text"""
+    else:
+        # For general preferences, use the standard recommendation strategy
+        user_content = f"""Recommend exactly 18 games for: "{preference}"
+{f"Filters: {filter_str}" if filter_str else ""}
+
+CRITICAL REQUIREMENTS:
+- ONLY recommend games that actually match the user's specific request
+- Focus on the core meaning and intent of what the user is asking for
+- 80% trending/popular games (14-15 games) AMONG THOSE THAT MATCH
+- 20% perfect-fit classics/gems (3-4 games) AMONG THOSE THAT MATCH
+- Return ONLY comma-separated game titles
+- No explanations or extra text"""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def clean_game_title(title: str) -> str:
+    """Remove any numbering, bullets, or extra formatting from an LLM title"""
+    cleaned_title = title.strip()
+    if cleaned_title.startswith(_TITLE_NUMBER_PREFIXES):
+        cleaned_title = cleaned_title.split(".", 1)[1].strip()
+    if cleaned_title.startswith(("-", "*", "•")):
+        cleaned_title = cleaned_title[1:].strip()
+    return cleaned_title
+
+
+def openai_chat_request(openai_api_key, messages, stream=False):
+    # Use direct API call instead of SDK
+    headers = {
+        "Authorization": f"Bearer {openai_api_key}",
+        "Content-Type": "application/json",
+    }
+    data = {
+        "model": "gpt-4o",
+        "messages": messages,
+        "max_tokens": 1000,
+        "temperature": 0.3,
+    }
+    if stream:
+        data["stream"] = True
+    return headers, data
+
+
+# --- LLM PROVIDERS ---
+# Titles come from GPT-4o, with Claude as a second provider when
+# CLAUDE_API_KEY is set. Requests are hedged: if the first provider has not
+# produced an answer (or, when streaming, its first title) within
+# LLM_HEDGE_DELAY seconds, the next provider is started too and the first good
+# answer wins. A circuit breaker per provider skips providers that keep
+# failing until a trial request succeeds.
+LLM_PROVIDER_ORDER = [
+    name.strip()
+    for name in os.getenv("LLM_PROVIDERS", "openai,anthropic").split(",")
+    if name.strip()
+]
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))  # seconds
+LLM_BREAKER_FAILURES = 3  # consecutive failures that open a provider's circuit
+LLM_BREAKER_RESET = 30  # seconds before an open circuit lets a trial through
+ANTHROPIC_MESSAGES_URL = os.getenv(
+    "ANTHROPIC_MESSAGES_URL", "https://api.anthropic.com/v1/messages"
+)
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-latest")
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; allows one trial per reset period"""
+
+    def __init__(
+        self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "half-open":
+            # Let this request through as the trial; others wait another period
+            self.opened_at = time.monotonic()
+        return state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LLMProvider(ABC):
+    """A chat completion API called over the pooled HTTP session"""
+
+    name = None
+    label = None
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+
+    @abstractmethod
+    def api_key(self):
+        """The configured API key, or None"""
+
+    @abstractmethod
+    def request(self, messages, stream=False):
+        """Returns (url, headers, json body)"""
+
+    @abstractmethod
+    def text_from_result(self, result):
+        """Completion text from a non-streamed response"""
+
+    @abstractmethod
+    def text_from_event(self, event):
+        """Text delta from one streamed event, or None"""
+
+    @contextmanager
+    def timed_call(self):
+        """Time one completion as both a pipeline stage and an upstream call"""
+        call = {"status": None}
+        started = time.monotonic()
+        try:
+            with timed_stage(f"llm_{self.name}"):
+                yield call
+        finally:
+            record_upstream_call(self.name, call["status"], time.monotonic() - started)
+
+    async def complete(self, messages):
+        url, headers, data = self.request(messages)
+        session = get_http_session(self.name)
+        with self.timed_call() as call:
+            async with session.post(url, headers=headers, json=data) as response:
+                call["status"] = response.status
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning(
+                        "LLM API error",
+                        extra={
+                            "provider": self.name,
+                            "status": response.status,
+                            "body": error_text[:500],
+                        },
+                    )
+                    raise Exception(f"{self.label} API error: {response.status}")
+                return self.text_from_result(await response.json(loads=json_loads))
+
+    async def stream(self, messages):
+        """Yield text deltas from a server-sent event completion"""
+        url, headers, data = self.request(messages, stream=True)
+        session = get_http_session(self.name)
+        with self.timed_call() as call:
+            async with session.post(url, headers=headers, json=data) as response:
+                call["status"] = response.status
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning(
+                        "LLM API error",
+                        extra={
+                            "provider": self.name,
+                            "status": response.status,
+                            "body": error_text[:500],
+                        },
+                    )
+                    raise Exception(f"{self.label} API error: {response.status}")
+
+                # Server-sent events: one "data: {...}" line per generated chunk
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:") :].strip()
+                    if payload == "[DONE]":
+                        break
+                    text = self.text_from_event(json_loads(payload))
+                    if text:
+                        yield text
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    label = "GPT-4o"
+
+    def api_key(self):
+        return get_openai_api_key()
+
+    def request(self, messages, stream=False):
+        headers, data = openai_chat_request(self.api_key(), messages, stream)
+        return OPENAI_CHAT_URL, headers, data
+
+    def text_from_result(self, result):
+        return result["choices"][0]["message"]["content"].strip()
+
+    def text_from_event(self, event):
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+    label = "Claude"
+
+    def api_key(self):
+        return get_claude_api_key()
+
+    def request(self, messages, stream=False):
+        headers = {
+            "x-api-key": self.api_key(),
+            "anthropic-version": ANTHROPIC_VERSION,
+            "Content-Type": "application/json",
+        }
+        data = {
+            "model": ANTHROPIC_MODEL,
+            "system": "\n\n".join(
+                m["content"] for m in messages if m["role"] == "system"
+            ),
+            "messages": [m for m in messages if m["role"] != "system"],
+            "max_tokens": 1000,
+            "temperature": 0.3,
+        }
+        if stream:
+            data["stream"] = True
+        return ANTHROPIC_MESSAGES_URL, headers, data
+
+    def text_from_result(self, result):
+        return "".join(
+            block.get("text", "") for block in result.get("content", [])
+        ).strip()
+
+    def text_from_event(self, event):
+        if event.get("type") == "error":
+            raise Exception(f"Claude stream error: {event.get('error')}")
+        if event.get("type") == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        return None
+
+
+LLM_PROVIDER_CLASSES = {"openai": OpenAIProvider, "anthropic": AnthropicProvider}
+llm_providers = [
+    LLM_PROVIDER_CLASSES[name]()
+    for name in LLM_PROVIDER_ORDER
+    if name in LLM_PROVIDER_CLASSES
+]
+
+
+def llm_providers_or_raise():
+    """Configured providers whose circuit isn't open, in order"""
+    configured = [provider for provider in llm_providers if provider.api_key()]
+    if not configured:
+        raise HTTPException(
+            status_code=500,
+            detail="AI recommendation service is currently unavailable. Please check your OpenAI API key configuration.",
+        )
+    # Checking state doesn't use up a half-open trial; allow() is only called
+    # once a provider is actually started (see next_allowed_provider)
+    available = [
+        provider for provider in configured if provider.breaker.state != "open"
+    ]
+    if not available:
+        raise HTTPException(status_code=500, detail=AI_UNAVAILABLE_DETAIL)
+    return available
+
+
+def next_allowed_provider(waiting):
+    """Pop providers until one's circuit lets this request through, or None"""
+    while waiting:
+        provider = waiting.popleft()
+        if provider.breaker.allow():
+            return provider
+    return None
+
+
+def titles_from_text(content):
+    """Parse the comma-separated list of titles from a completion"""
+    titles = [title.strip() for title in content.split(",") if title.strip()]
+
+    # Clean up any potential formatting issues
+    cleaned_titles = []
+    for title in titles[:MAX_RECOMMENDED_TITLES]:
+        cleaned_title = clean_game_title(title)
+        if cleaned_title:
+            cleaned_titles.append(cleaned_title)
+    return cleaned_titles[:MAX_RECOMMENDED_TITLES]
+
+
+async def provider_titles(provider, messages):
+    """Yield each title from one provider's streamed completion once it is complete"""
+    yielded = 0
+    buffer = ""
+    async for text in provider.stream(messages):
+        buffer += text
+        *finished, buffer = buffer.split(",")
+        for title in finished:
+            cleaned_title = clean_game_title(title)
+            if cleaned_title:
+                yield cleaned_title
+                yielded += 1
+                if yielded >= MAX_RECOMMENDED_TITLES:
+                    return
+    cleaned_title = clean_game_title(buffer)
+    if cleaned_title:
+        yield cleaned_title
+
+
+async def _complete_titles(provider, messages):
+    try:
+        titles = titles_from_text(await provider.complete(messages))
+        if not titles:
+            raise Exception(f"{provider.label} returned no titles")
+    except Exception as e:
+        provider.breaker.record_failure()
+        logger.warning(
+            "LLM API error", extra={"provider": provider.name, "error": str(e)}
+        )
+        raise
+    provider.breaker.record_success()
+    return titles
+
+
+async def _first_title(provider, titles):
+    try:
+        return await titles.__anext__()
+    except StopAsyncIteration:
+        raise Exception(f"{provider.label} returned no titles")
+
+
+async def hedged_titles(messages):
+    """Titles from the first provider to answer; later providers start on a delay"""
+    waiting = deque(llm_providers_or_raise())
+    running = set()
+
+    def start():
+        provider = next_allowed_provider(waiting)
+        if provider is not None:
+            running.add(asyncio.ensure_future(_complete_titles(provider, messages)))
+
+    try:
+        while waiting or running:
+            if waiting and not running:
+                start()
+                if not running:
+                    break
+            done, running = await asyncio.wait(
+                running,
+                timeout=LLM_HEDGE_DELAY if waiting else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # The current provider is slow: race the next one against it
+                start()
+                continue
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+    finally:
+        for task in running:
+            task.cancel()
+    raise HTTPException(status_code=500, detail=AI_UNAVAILABLE_DETAIL)
+
+
+async def hedged_title_stream(messages, outcome=None):
+    """
+    Stream titles from whichever provider produces its first title first.
+    The losing streams are cancelled once a winner is known. If the winner
+    fails part way, outcome["partial"] is set and the stream ends early.
+    """
+    waiting = deque(llm_providers_or_raise())
+    running = {}  # first-title task -> (provider, title iterator)
+    winner = None
+
+    def start():
+        provider = next_allowed_provider(waiting)
+        if provider is None:
+            return
+        titles = provider_titles(provider, messages)
+        running[asyncio.ensure_future(_first_title(provider, titles))] = (
+            provider,
+            titles,
+        )
+
+    try:
+        while winner is None and (waiting or running):
+            if waiting and not running:
+                start()
+                if not running:
+                    break
+            done, _ = await asyncio.wait(
+                list(running),
+                timeout=LLM_HEDGE_DELAY if waiting else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # No title yet from the current provider: race the next one
+                start()
+                continue
+            for task in done:
+                provider, titles = running.pop(task)
+                error = task.exception()
+                if error is None and winner is None:
+                    provider.breaker.record_success()
+                    winner = (provider, titles, task.result())
+                    continue
+                if error is not None:
+                    provider.breaker.record_failure()
+                    logger.warning(
+                        "LLM API error",
+                        extra={"provider": provider.name, "error": str(error)},
+                    )
+                await titles.aclose()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for _, titles in running.values():
+            await titles.aclose()
+
+    if winner is None:
+        raise HTTPException(status_code=500, detail=AI_UNAVAILABLE_DETAIL)
+    provider, titles, first = winner
+    yield first
+    try:
+        async for title in titles:
+            yield title
+    except Exception as e:
+        # Keep the titles that already streamed through
+        if outcome is not None:
+            outcome["partial"] = True
+        provider.breaker.record_failure()
+        logger.warning(
+            "LLM API error", extra={"provider": provider.name, "error": str(e)}
+        )
+    finally:
+        await titles.aclose()
+
+
+# --- END LLM PROVIDERS ---
+
+
+# LLM title lists are cached under a canonical form of the request, so
+# "Games like Hades!" and "games like hades" share one completion. The cache
+# lives in the persistent upstream cache and is independent of the response
+# cache, so cards can be refreshed without asking the LLM again.
+PREFERENCE_STOPWORDS = frozenset(
+    "a an the some any me i im m my please want need looking for give show find "
+    "recommend suggest game games video".split()
+)
+
+
+def canonical_preference(preference: str) -> str:
+    text = unicodedata.normalize("NFKD", preference.lower())
+    words = "".join(
+        c if c.isalnum() else " " for c in text if not unicodedata.combining(c)
+    ).split()
+    return " ".join(word for word in words if word not in PREFERENCE_STOPWORDS)
+
+
+def canonical_filters(filters: dict) -> str:
+    return filters_to_natural_language(
+        {
+            key: value.strip().lower() if isinstance(value, str) else value
+            for key, value in sorted(filters.items())
+        }
+    )
+
+
+def llm_title_cache_params(preference: str, filters: dict):
+    return {
+        "preference": canonical_preference(preference),
+        "filters": canonical_filters(filters),
+    }
+
+
+# Enhanced GPT-4o-powered game recommendation system
+async def fetch_game_titles_gpt4o(preference: str, filters=None):
+    """
+    Enhanced gaming AI using GPT-4o with specialized gaming knowledge and reasoning.
+    Hedged across the configured LLM providers.
+    """
+    if filters is None:
+        filters = {}
+    cache_params = llm_title_cache_params(preference, filters)
+    cached = await upstream_cache.get("llm:titles", cache_params)
+    if cached:
+        return cached
+    messages = build_recommendation_messages(preference, filters)
+    return await upstream_flights.do(
+        ("llm", upstream_cache.make_key("llm:titles", cache_params)),
+        lambda: _fetch_and_cache_titles(messages, cache_params),
+    )
+
+
+async def _fetch_and_cache_titles(messages, cache_params):
+    titles = await hedged_titles(messages)
+    await cache_upstream_response("llm:titles", cache_params, titles)
+    return titles
+
+
+async def stream_game_titles_gpt4o(preference: str, filters=None):
+    """
+    Streaming variant of fetch_game_titles_gpt4o: yields each title as soon as
+    the model finishes writing it, while the rest of the list is still generating.
+    Concurrent identical requests read from one shared completion.
+    """
+    if filters is None:
+        filters = {}
+    cache_params = llm_title_cache_params(preference, filters)
+    cached = await upstream_cache.get("llm:titles", cache_params)
+    if cached:
+        for title in cached:
+            yield title
+        return
+    messages = build_recommendation_messages(preference, filters)
+    async for title in upstream_flights.stream(
+        ("llm", "stream", upstream_cache.make_key("llm:titles", cache_params)),
+        lambda: _stream_and_cache_titles(messages, cache_params),
+    ):
+        yield title
+
+
+async def _stream_and_cache_titles(messages, cache_params):
+    titles = []
+    outcome = {}
+    async for title in hedged_title_stream(messages, outcome):
+        titles.append(title)
+        yield title
+    # A list cut short by a provider error is served once but never cached
+    if titles and not outcome.get("partial"):
+        await cache_upstream_response("llm:titles", cache_params, titles)
+
+
+# Legacy function for backward compatibility (now uses GPT-4o)
+async def fetch_game_titles(preference: str, filters: dict = {}):
+    """
+    Main game recommendation function - now powered by GPT-4o AI
+    """
+    return await fetch_game_titles_gpt4o(preference, filters)
+
+
+# RAWG API request tracking
+RAWG_REQUESTS_FILE = "rawg_requests.json"
+RAWG_REQUEST_LIMIT = 20000  # Monthly limit
+RAWG_WARNING_THRESHOLD = 1000  # Warning when below this number
+RAWG_SUMMARY_INTERVAL = int(os.getenv("RAWG_SUMMARY_INTERVAL", "900"))  # seconds
+RAWG_REQUEST_HISTORY_SIZE = 500  # Most recent requests kept in the history
+RAWG_QUOTA_FLUSH_INTERVAL = 30  # seconds between background saves
+
+
+class RawgQuotaTracker:
+    """
+    In-memory RAWG quota counters with incremental daily/monthly rollups.
+    Requests are recorded on the event loop; the state is written to
+    RAWG_REQUESTS_FILE periodically by a background task and on shutdown.
+    """
+
+    def __init__(self, path, limit, history_size):
+        self.path = path
+        self.limit = limit
+        self.remaining = limit
+        self.total_requests = 0
+        self.reset_time = datetime.now() + timedelta(days=30)
+        self.daily_stats = {}
+        self.history = deque(maxlen=history_size)
+        self._loaded = False
+        self._dirty = False
+        self._days_total = 0
+        self._month = None
+        self._month_requests = 0
+        self._write_lock = threading.Lock()
+
+    def load(self):
+        """Read the saved state once; later reads are served from memory"""
+        self._loaded = True
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.remaining = data["remaining"]
+            self.total_requests = data["total_requests"]
+            self.reset_time = datetime.fromisoformat(data["reset_time"])
+            self.daily_stats = data.get("daily_stats", {})
+            self.history.extend(data.get("request_history", []))
+        else:
+            self._dirty = True
+        self._days_total = sum(self.daily_stats.values())
+        self._month = None
+        self._roll_over(datetime.now())
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _roll_over(self, now):
+        if now >= self.reset_time:
+            # Reset all stats for new cycle
+            self.remaining = self.limit
+            self.total_requests = 0
+            self.reset_time = now + timedelta(days=30)
+            self.daily_stats = {}
+            self.history.clear()
+            self._days_total = 0
+            self._month = None
+            self._dirty = True
+        month = now.strftime("%Y-%m")
+        if month != self._month:
+            self._month = month
+            self._month_requests = sum(
+                count
+                for date, count in self.daily_stats.items()
+                if date.startswith(month)
+            )
+
+    def record(self, title):
+        self._ensure_loaded()
+        now = datetime.now()
+        self._roll_over(now)
+        today = now.strftime("%Y-%m-%d")
+        self.daily_stats[today] = self.daily_stats.get(today, 0) + 1
+        self._days_total += 1
+        self._month_requests += 1
+        self.total_requests += 1
+        self.remaining -= 1
+        self.history.append({"timestamp": now.isoformat(), "title": title})
+        self._dirty = True
+
+    def stats(self):
+        self._ensure_loaded()
+        now = datetime.now()
+        self._roll_over(now)
+        return {
+            "today": self.daily_stats.get(now.strftime("%Y-%m-%d"), 0),
+            "daily_average": (
+                self._days_total / len(self.daily_stats) if self.daily_stats else 0
+            ),
+            "month": self._month_requests,
+            "monthly_average": self._month_requests / now.day,
+            "remaining": self.remaining,
+            "total_requests": self.total_requests,
+            "reset_time": self.reset_time,
+        }
+
+    def to_dict(self):
+        return {
+            "remaining": self.remaining,
+            "reset_time": self.reset_time.isoformat(),
+            "total_requests": self.total_requests,
+            "daily_stats": dict(self.daily_stats),
+            "request_history": list(self.history),
+        }
+
+    def _write(self, data):
+        # Write to a temp file and rename so readers never see a partial file
+        with self._write_lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write, self.to_dict())
+        except Exception as e:
+            self._dirty = True
+            logger.error("RAWG quota save failed", extra={"error": str(e)})
+
+
+class SharedRawgQuotaTracker(RawgQuotaTracker):
+    """
+    RAWG quota shared by every worker through the shared state database.
+    Workers count locally; each flush adds the pending requests to the shared
+    totals and reloads them, so no worker overwrites another's counts.
+    RAWG_REQUESTS_FILE is imported once when the database is first created;
+    requests it counted beyond its daily stats are kept as a baseline.
+    """
+
+    def __init__(self, store, path, limit, history_size):
+        super().__init__(path, limit, history_size)
+        self.store = store
+        self._pending_days = defaultdict(int)
+        self._pending_history = []
+
+    def load(self):
+        self._loaded = True
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM rawg_quota WHERE key = 'reset_time'"
+            ).fetchone()
+            if row is None:
+                self._import_legacy(conn)
+        self._apply(self._sync({}, []))
+
+    def _import_legacy(self, conn):
+        reset_time = datetime.now() + timedelta(days=30)
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            reset_time = datetime.fromisoformat(data["reset_time"])
+            daily_stats = data.get("daily_stats", {})
+            conn.executemany(
+                "INSERT OR REPLACE INTO rawg_quota_days (day, count) VALUES (?, ?)",
+                list(daily_stats.items()),
+            )
+            # The file's total also covers requests made before daily stats existed
+            baseline = data["total_requests"] - sum(daily_stats.values())
+            conn.execute(
+                "INSERT OR REPLACE INTO rawg_quota (key, value) VALUES ('baseline', ?)",
+                (str(max(baseline, 0)),),
+            )
+            conn.executemany(
+                "INSERT INTO rawg_quota_history (timestamp, title) VALUES (?, ?)",
+                [
+                    (entry["timestamp"], entry.get("title"))
+                    for entry in data.get("request_history", [])
+                ],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO rawg_quota (key, value) VALUES ('reset_time', ?)",
+            (reset_time.isoformat(),),
+        )
+
+    def record(self, title):
+        super().record(title)
+        now = datetime.now()
+        self._pending_days[now.strftime("%Y-%m-%d")] += 1
+        self._pending_history.append((now.isoformat(), title))
+
+    def _sync(self, days, history):
+        """Add pending requests to the shared totals and return the new totals"""
+        now = datetime.now()
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM rawg_quota WHERE key = 'reset_time'"
+            ).fetchone()
+            reset_time = datetime.fromisoformat(row[0])
+            if now >= reset_time:
+                reset_time = now + timedelta(days=30)
+                conn.execute("DELETE FROM rawg_quota_days")
+                conn.execute("DELETE FROM rawg_quota_history")
+                conn.execute("DELETE FROM rawg_quota WHERE key = 'baseline'")
+                conn.execute(
+                    "UPDATE rawg_quota SET value = ? WHERE key = 'reset_time'",
+                    (reset_time.isoformat(),),
+                )
+            conn.executemany(
+                "INSERT INTO rawg_quota_days (day, count) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count",
+                list(days.items()),
+            )
+            conn.executemany(
+                "INSERT INTO rawg_quota_history (timestamp, title) VALUES (?, ?)",
+                history,
+            )
+            conn.execute(
+                "DELETE FROM rawg_quota_history WHERE id <= "
+                "(SELECT MAX(id) FROM rawg_quota_history) - ?",
+                (self.history.maxlen,),
+            )
+            daily_stats = dict(
+                conn.execute("SELECT day, count FROM rawg_quota_days").fetchall()
+            )
+            recent = conn.execute(
+                "SELECT timestamp, title FROM rawg_quota_history "
+                "ORDER BY id DESC LIMIT ?",
+                (self.history.maxlen,),
+            ).fetchall()
+            row = conn.execute(
+                "SELECT value FROM rawg_quota WHERE key = 'baseline'"
+            ).fetchone()
+        baseline = int(row[0]) if row else 0
+        return reset_time, daily_stats, recent[::-1], baseline
+
+    def _apply(self, snapshot):
+        reset_time, daily_stats, recent, baseline = snapshot
+        # Requests recorded while the sync ran are still pending; keep showing them
+        for day, count in self._pending_days.items():
+            daily_stats[day] = daily_stats.get(day, 0) + count
+        self.reset_time = reset_time
+        self.daily_stats = daily_stats
+        self.history.clear()
+        self.history.extend(
+            {"timestamp": timestamp, "title": title} for timestamp, title in recent
+        )
+        self._days_total = sum(daily_stats.values())
+        self.total_requests = self._days_total + baseline
+        self.remaining = self.limit - self.total_requests
+        self._month = None
+        self._roll_over(datetime.now())
+
+    async def flush(self):
+        self._ensure_loaded()
+        days, history = self._pending_days, self._pending_history
+        self._pending_days, self._pending_history = defaultdict(int), []
+        try:
+            snapshot = await asyncio.to_thread(self._sync, days, history)
+        except Exception as e:
+            for day, count in days.items():
+                self._pending_days[day] += count
+            self._pending_history[:0] = history
+            logger.error("RAWG quota save failed", extra={"error": str(e)})
+            return
+        self._apply(snapshot)
+
+
+if shared_state:
+    rawg_quota = SharedRawgQuotaTracker(
+        shared_state, RAWG_REQUESTS_FILE, RAWG_REQUEST_LIMIT, RAWG_REQUEST_HISTORY_SIZE
+    )
+else:
+    rawg_quota = RawgQuotaTracker(
+        RAWG_REQUESTS_FILE, RAWG_REQUEST_LIMIT, RAWG_REQUEST_HISTORY_SIZE
+    )
+
+
+async def rawg_quota_flush_loop():
+    while True:
+        await asyncio.sleep(RAWG_QUOTA_FLUSH_INTERVAL)
+        await rawg_quota.flush()
+
+
+def log_rawg_usage(stats):
+    """Log one RAWG quota summary; a warning once the quota is running low"""
+    daily_limit = RAWG_REQUEST_LIMIT // 28
+    low = stats["remaining"] < RAWG_WARNING_THRESHOLD
+    logger.log(
+        logging.WARNING if low else logging.INFO,
+        "RAWG API usage",
+        extra={
+            "today": stats["today"],
+            "daily_limit": daily_limit,
+            "daily_average": round(stats["daily_average"], 1),
+            "month": stats["month"],
+            "monthly_average": round(stats["monthly_average"], 1),
+            "remaining": stats["remaining"],
+            "total_requests": stats["total_requests"],
+            "reset_time": stats["reset_time"].isoformat(),
+        },
+    )
+
+
+async def rawg_usage_summary_loop():
+    """Summarize RAWG usage periodically instead of after every batch"""
+    logged_total = None
+    while True:
+        await asyncio.sleep(RAWG_SUMMARY_INTERVAL)
+        if rawg_quota.total_requests != logged_total:
+            stats = await asyncio.to_thread(rawg_quota.stats)
+            logged_total = stats["total_requests"]
+            log_rawg_usage(stats)
+
+
+def format_datetime(dt_str):
+    dt = datetime.fromisoformat(dt_str)
+    return dt.strftime("%m/%d/%Y %I:%M%p").lower()
+
+
+# --- TITLE RESOLUTION INDEX ---
+# LLM titles come in many spellings ("Witcher 3", "The Witcher III: Wild
+# Hunt"). Every spelling that resolved to a RAWG game is remembered as an alias
+# of its RAWG id, together with the game card, so known titles resolve with no
+# network calls. Aliases and cards persist in SQLite next to the upstream cache.
+TITLE_INDEX_PATH = os.getenv("TITLE_INDEX_PATH", UPSTREAM_CACHE_PATH)
+TITLE_INDEX_CARD_TTL = int(
+    os.getenv("TITLE_INDEX_CARD_TTL", 7 * 24 * 3600)
+)  # seconds before a card is looked up again
+# Single letters ("Mega Man X" is not "Mega Man 10") are left alone
+ROMAN_NUMERALS = {
+    numeral: str(value)
+    for value, numeral in enumerate(
+        "i ii iii iv v vi vii viii ix x xi xii xiii xiv xv xvi xvii xviii xix xx".split(),
+        start=1,
+    )
+    if len(numeral) > 1
+}
+
+
+def normalize_game_title(title):
+    """Case, accents, punctuation, a leading "The" and roman numerals folded away"""
+    text = unicodedata.normalize("NFKD", title.lower().replace("&", " and "))
+    text = "".join(
+        c if c.isalnum() else " " for c in text if not unicodedata.combining(c)
+    )
+    words = text.split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    return " ".join(ROMAN_NUMERALS.get(word, word) for word in words)
+
+
+class TitleIndex:
+    """Persistent normalized title -> RAWG id aliases plus the id's game card"""
+
+    def __init__(self, path, card_ttl=TITLE_INDEX_CARD_TTL):
+        self.path = path
+        self.card_ttl = card_ttl
+        self._aliases = {}  # normalized title -> rawg id
+        self._cards = {}  # rawg id -> (card, updated_at)
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS title_aliases ("
+                "alias TEXT PRIMARY KEY, rawg_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS title_cards (rawg_id INTEGER PRIMARY KEY, "
+                "card TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def load(self):
+        with self._lock:
+            conn = self._connection()
+            self._aliases.update(
+                conn.execute("SELECT alias, rawg_id FROM title_aliases").fetchall()
+            )
+            for rawg_id, card, updated_at in conn.execute(
+                "SELECT rawg_id, card, updated_at FROM title_cards"
+            ):
+                self._cards[rawg_id] = (json.loads(card), updated_at)
+
+    def resolve(self, title):
+        """Game card for a known title, or None when RAWG has to be searched"""
+        rawg_id = self._aliases.get(normalize_game_title(title))
+        entry = self._cards.get(rawg_id)
+        if entry is None or time.time() - entry[1] > self.card_ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry[0], twitch_viewers=0)
+
+    async def remember(self, title, card):
+        """Record the searched title and the card's own title"""
+        rawg_id = card.get("rawg_id")
+        if rawg_id is None:
+            return
+        # Only spellings that actually led to this game become aliases; a bare
+        # main title ("Resident Evil") belongs to a different game than
+        # "Resident Evil Village: Gold Edition"
+        aliases = {normalize_game_title(title), normalize_game_title(card["title"])}
+        aliases.discard("")
+        updated_at = time.time()
+        for alias in aliases:
+            self._aliases[alias] = rawg_id
+        self._cards[rawg_id] = (card, updated_at)
+        try:
+            await asyncio.to_thread(self._write, aliases, rawg_id, card, updated_at)
+        except Exception as e:
+            logger.error("Title index save failed", extra={"error": str(e)})
+
+    def _write(self, aliases, rawg_id, card, updated_at):
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO title_aliases (alias, rawg_id) VALUES (?, ?)",
+                [(alias, rawg_id) for alias in aliases],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO title_cards (rawg_id, card, updated_at) "
+                "VALUES (?, ?, ?)",
+                (rawg_id, json.dumps(card), updated_at),
+            )
 
-    # Determine the appropriate prompt based on input type
-    if is_likely_game_name(preference):
-        # For specific game names, focus on finding that game and similar ones
-        user_content = f"""Find the game "{preference}" and recommend similar games.
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
-REQUIREMENTS:
-- If "{preference}" is a real game, include it first
-- Then recommend 17 similar games (80% trending/popular, 20% classics)
-- Return ONLY comma-separated game titles
-- No explanations or extra text"""
-    else:
-        # For general preferences, use the standard recommendation strategy
-        user_content = f"""Recommend exactly 18 games for: "{preference}"
-{f"Filters: {filter_str}" if filter_str else ""}
 
-CRITICAL REQUIREMENTS:
-- ONLY recommend games that actually match the user's specific request
-- Focus on the core meaning and intent of what the user is asking for
-- 80% trending/popular games (14-15 games) AMONG THOSE THAT MATCH
-- 20% perfect-fit classics/gems (3-4 games) AMONG THOSE THAT MATCH
-- Return ONLY comma-separated game titles
-- No explanations or extra text"""
+title_index = TitleIndex(TITLE_INDEX_PATH)
 
-    try:
-        # Use direct API call instead of SDK
-        headers = {
-            "Authorization": f"Bearer {openai_api_key}",
-            "Content-Type": "application/json",
-        }
 
-        data = {
-            "model": "gpt-4o",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.3,
-        }
+# --- END TITLE RESOLUTION INDEX ---
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions", headers=headers, json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"OpenAI API error: {response.status} - {error_text}")
-                    raise Exception(f"OpenAI API error: {response.status}")
 
-                result = await response.json()
-                content = result["choices"][0]["message"]["content"].strip()
+def format_game_card(game):
+    """Turn a RAWG search result into the game card returned to clients"""
+    # Format release date
+    release_date = game.get("released", "N/A")
+    if release_date != "N/A":
+        try:
+            release_date = datetime.strptime(release_date, "%Y-%m-%d").strftime(
+                "%m/%d/%Y"
+            )
+        except ValueError:
+            pass
+
+    return {
+        "title": game["name"],
+        "rawg_id": game.get("id"),
+        "slug": game.get("slug"),
+        "release_date": release_date,
+        "platforms": ", ".join(
+            p["platform"]["name"] for p in game.get("platforms", [])
+        ),
+        "rating": game.get("rating", "N/A"),
+        "genres": ", ".join(g["name"] for g in game.get("genres", [])),
+        "developers": ", ".join(d["name"] for d in game.get("developers", [])),
+        "metacritic": game.get("metacritic", "N/A"),
+        "background_image": game.get("background_image", ""),
+        "twitch_viewers": 0,
+    }
 
-        # Parse the comma-separated list
-        titles = [title.strip() for title in content.split(",") if title.strip()]
 
-        # Clean up any potential formatting issues
-        cleaned_titles = []
-        for title in titles[:18]:  # Ensure max 18 titles
-            # Remove any numbering, bullets, or extra formatting
-            cleaned_title = title.strip()
-            if cleaned_title.startswith(
-                (
-                    "1.",
-                    "2.",
-                    "3.",
-                    "4.",
-                    "5.",
-                    "6.",
-                    "7.",
-                    "8.",
-                    "9.",
-                    "10.",
-                    "11.",
-                    "12.",
-                    "13.",
-                    "14.",
-                    "15.",
-                    "16.",
-                    "17.",
-                    "18.",
-                )
-            ):
-                cleaned_title = cleaned_title.split(".", 1)[1].strip()
-            if cleaned_title.startswith(("-", "*", "•")):
-                cleaned_title = cleaned_title[1:].strip()
-            if cleaned_title:
-                cleaned_titles.append(cleaned_title)
+async def fetch_game_card(title):
+    """
+    Resolve a title to its game card, from the title index when the title (or a
+    spelling of it) is known and otherwise by searching RAWG. Returns None if
+    the game can't be found.
+    """
+    card = title_index.resolve(title)
+    if card is None:
+        try:
+            result = await rawg_get("rawg:search", "/games", {"search": title})
+        except Exception as e:
+            dropped_results["game_card"] += 1
+            logger.warning(
+                "RAWG lookup dropped", extra={"title": title, "error": str(e)}
+            )
+            return None
+        if not result["results"]:
+            return None
+        card = format_game_card(result["results"][0])
+        await title_index.remember(title, card)
+    autocomplete_index.add(card["title"], card["slug"], boost=AUTOCOMPLETE_SEEN_BOOST)
+    return card
 
-        return cleaned_titles[:18]
 
-    except Exception as e:
-        print(f"GPT-4o API error: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=(
-                "Sorry, we're having trouble connecting to our AI "
-                "recommendation service right now. Please try again in a few moments."
-            ),
+async def add_twitch_viewers(games):
+    """Fill in twitch_viewers from the background viewer map; unknown games are looked up"""
+    try:
+        viewer_counts = await twitch_viewers.get_viewer_counts(
+            [g["title"] for g in games]
         )
+    except Exception as e:
+        dropped_results["twitch_viewers"] += len(games)
+        logger.warning("Twitch viewer counts failed", extra={"error": str(e)})
+        viewer_counts = {}
+    for game in games:
+        game["twitch_viewers"] = viewer_counts.get(game["title"], 0)
 
 
-# Legacy function for backward compatibility (now uses GPT-4o)
-async def fetch_game_titles(preference: str, filters: dict = {}):
+async def _as_async_iter(items):
+    for item in items:
+        yield item
+
+
+async def iter_game_details(titles):
     """
-    Main game recommendation function - now powered by GPT-4o AI
+    Yield game cards in completion order, as soon as each RAWG lookup finishes.
+    titles may be a list or an async iterator (e.g. titles streaming from
+    GPT-4o); each lookup starts the moment its title is known.
     """
-    return await fetch_game_titles_gpt4o(preference, filters)
+    if not hasattr(titles, "__aiter__"):
+        titles = _as_async_iter(titles)
+    results = asyncio.Queue()
+    tasks = []
+
+    async def lookup(title):
+        # Always report back, or the consumer below waits for this title forever
+        card = None
+        try:
+            card = await fetch_game_card(title)
+        except Exception as e:
+            dropped_results["game_card"] += 1
+            logger.warning(
+                "Game card lookup dropped", extra={"title": title, "error": str(e)}
+            )
+        finally:
+            results.put_nowait(("game", card))
 
+    async def schedule_lookups():
+        try:
+            # Deduplicate spellings of the same title to avoid unnecessary API calls
+            seen = set()
+            async for title in titles:
+                key = normalize_game_title(title)
+                if key not in seen:
+                    seen.add(key)
+                    tasks.append(asyncio.ensure_future(lookup(title)))
+            await results.put(("end", len(tasks)))
+        except Exception as e:
+            await results.put(("error", e))
 
-# Add color constants for terminal output
-class Colors:
-    GREEN = "\033[92m"
-    YELLOW = "\033[93m"
-    RED = "\033[91m"
-    ENDC = "\033[0m"
-    BOLD = "\033[1m"
+    producer = asyncio.ensure_future(schedule_lookups())
+    try:
+        expected, received = None, 0
+        # Different titles can resolve to the same game; yield each game once
+        yielded_ids = set()
+        while expected is None or received < expected:
+            kind, value = await results.get()
+            if kind == "error":
+                raise value
+            if kind == "end":
+                expected = value
+                continue
+            received += 1
+            if value and value.get("rawg_id") not in yielded_ids:
+                if value.get("rawg_id") is not None:
+                    yielded_ids.add(value["rawg_id"])
+                yield value
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+async def fetch_game_details(titles):
+    """Resolve titles (a list or async iterator) to game cards with viewer counts"""
+    rawg_api_key = get_rawg_api_key()
+    if not rawg_api_key:
+        raise HTTPException(status_code=500, detail="Rawg API key not found")
 
+    # With streamed titles this stage overlaps the LLM call
+    with timed_stage("game_cards"):
+        games = [game async for game in iter_game_details(titles)]
 
-# RAWG API request tracking
-RAWG_REQUESTS_FILE = "rawg_requests.json"
-RAWG_REQUEST_LIMIT = 20000  # Monthly limit
-RAWG_WARNING_THRESHOLD = 1000  # Warning when below this number
+    # Fetch Twitch viewer counts for all resolved games in one batch
+    with timed_stage("twitch_viewers"):
+        await add_twitch_viewers(games)
 
+    return games
 
-def get_monthly_stats(data):
-    now = datetime.now()
-    current_month = now.strftime("%Y-%m")
-    monthly_requests = sum(
-        count
-        for date, count in data["daily_stats"].items()
-        if date.startswith(current_month)
-    )
-    return monthly_requests
 
+# --- RECOMMENDATION RESPONSE CACHE ---
+RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", 3600))  # seconds
+RECOMMENDATION_CACHE_MAX_BYTES = int(
+    os.getenv("RECOMMENDATION_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+)
 
-def get_monthly_average(data):
-    now = datetime.now()
-    days_in_month = now.day
-    monthly_requests = get_monthly_stats(data)
-    return monthly_requests / days_in_month if days_in_month > 0 else 0
 
+class ResponseCache:
+    """LRU cache with a TTL, bounded by the total JSON size of its entries"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() >= entry[0]:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def expires_in(self, key):
+        """Seconds until an entry expires, or None; doesn't count as a lookup"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        remaining = entry[0] - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def set(self, key, value):
+        size = len(json_dumps(value, default=str))
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
 
-def log_rawg_requests():
-    data = load_rawg_requests()
-    now = datetime.now()
-    today = now.strftime("%Y-%m-%d")
-    daily_usage = data["daily_stats"].get(today, 0)
-    daily_limit = RAWG_REQUEST_LIMIT // 28
-    usage_color = get_color_for_usage(daily_usage, daily_limit)
 
-    # Calculate daily average
-    daily_avg = (
-        sum(data["daily_stats"].values()) / len(data["daily_stats"])
-        if data["daily_stats"]
-        else 0
-    )
+recommendation_cache = ResponseCache(
+    RECOMMENDATION_CACHE_MAX_BYTES, RECOMMENDATION_CACHE_TTL
+)
 
-    # Get monthly stats
-    monthly_requests = get_monthly_stats(data)
-    monthly_avg = get_monthly_average(data)
 
-    # Format reset time
-    reset_time = datetime.fromisoformat(data["reset_time"]).strftime("%m/%d/%Y")
+def recommendation_cache_key(preference: str, filters: dict) -> str:
+    """Cache key for a recommendation request; sort order is applied on read"""
+    normalized_preference = " ".join(preference.lower().split())
+    normalized_filters = {
+        k: v.strip().lower() if isinstance(v, str) else v
+        for k, v in filters.items()
+        if v
+    }
+    return json.dumps(
+        [normalized_preference, normalized_filters], sort_keys=True, default=str
+    )
 
-    print(f"\n[1] {Colors.BOLD}=== RAWG API Usage ==={Colors.ENDC}")
-    print("[1]")
-    print("[1] Daily Usage:")
-    print(
-        f"[1] Today's requests: {usage_color}{daily_usage}/{daily_limit} ({daily_usage/daily_limit*100:.1f}%){Colors.ENDC}"
+
+def sort_games(games, sort_by: str):
+    """Return a new list of games ordered for the requested sort option"""
+    if sort_by == "rating":
+        return sorted(
+            games,
+            key=lambda x: float(x["rating"]) if x["rating"] != "N/A" else 0,
+            reverse=True,
+        )
+    if sort_by == "metacritic":
+        return sorted(
+            games,
+            key=lambda x: (
+                int(x["metacritic"]) if x["metacritic"] not in ["N/A", None] else 0
+            ),
+            reverse=True,
+        )
+    # release_date
+    return sorted(
+        games,
+        key=lambda x: (
+            x["release_date"] if x["release_date"] != "N/A" else "1970-01-01"
+        ),
+        reverse=True,
     )
-    print(f"[1] Daily average requests: {daily_avg:.1f}")
-    print("[1]")
-    print(f"[1] Month's requests: {monthly_requests}")
-    print(f"[1] Monthly average: {monthly_avg:.1f}")
-    print("[1]")
-    print(f"[1] Remaining requests: {data['remaining']}")
-    print(f"[1] All time requests: {data['total_requests']}")
-    print("[1]")
-    print(f"[1] Reset time: {reset_time}")
-    print("[1]")
-    print(f"[1] {Colors.BOLD}====================={Colors.ENDC}\n")
-
-
-def load_rawg_requests():
-    if os.path.exists(RAWG_REQUESTS_FILE):
-        with open(RAWG_REQUESTS_FILE, "r") as f:
-            data = json.load(f)
-            # Check if reset time has passed
-            reset_time = datetime.fromisoformat(data["reset_time"])
-            now = datetime.now()
-            if now >= reset_time:
-                # Reset all stats for new cycle
-                data = {
-                    "remaining": RAWG_REQUEST_LIMIT,
-                    "total_requests": 0,
-                    "reset_time": "2025-07-16T00:00:00",  # Next reset date
-                    "daily_stats": {},
-                    "request_history": [],
-                }
-                save_rawg_requests(data)
-            return data
-    # Initialize with current values if file doesn't exist
-    initial_data = {
-        "remaining": 19494,  # Current remaining requests as of March 18, 2024
-        "total_requests": 506,  # Total requests made so far (20000 - 19494)
-        "reset_time": "2025-07-16T00:00:00",  # Next reset date
-        "daily_stats": {},
-        "request_history": [],
+
+
+# --- END RECOMMENDATION RESPONSE CACHE ---
+
+
+# --- Enhanced hybrid recommendation logic ---
+def ai_fallback_response():
+    """Static example shown when the AI recommendation pipeline is unavailable"""
+    static_games = [
+        {
+            "title": "The Witcher 3: Wild Hunt",
+            "description": "An epic open-world RPG with a rich story and deep gameplay.",
+            "rating": 9.5,
+            "release_date": "2015-05-18",
+            "platforms": "PC, PS4, Xbox One, Switch",
+            "genres": "RPG, Adventure",
+            "developers": "CD Projekt Red",
+            "publishers": "CD Projekt",
+            "metacritic": 93,
+            "esrb_rating": "Mature",
+            "website": "https://thewitcher.com/en/witcher3",
+            "background_image": "https://media.rawg.io/media/games/0b7/0b78e1e8e6c6b1b2c2e2e2e2e2e2e2e2.jpg",
+        },
+        {
+            "title": "Celeste",
+            "description": "A beautiful indie platformer about climbing a mountain and overcoming challenges.",
+            "rating": 9.0,
+            "release_date": "2018-01-25",
+            "platforms": "PC, PS4, Xbox One, Switch",
+            "genres": "Platformer, Indie",
+            "developers": "Matt Makes Games",
+            "publishers": "Matt Makes Games",
+            "metacritic": 92,
+            "esrb_rating": "Everyone 10+",
+            "website": "https://www.celestegame.com/",
+            "background_image": "https://media.rawg.io/media/games/6b5/6b5a5e5e5e5e5e5e5e5e5e5e5e5e5e5e.jpg",
+        },
+    ]
+    return {
+        "ai_down": True,
+        "message": (
+            "Our AI-powered recommendations are temporarily unavailable. "
+            "Here's an example of what you would see if the service was live."
+        ),
+        "games": static_games,
     }
-    save_rawg_requests(initial_data)
-    return initial_data
 
 
-def save_rawg_requests(data):
-    with open(RAWG_REQUESTS_FILE, "w") as f:
-        json.dump(data, f)
+# Start the generic GPT-4o recommendation call while the exact-match probes
+# run, so whichever branch is needed is already in flight
+SPECULATIVE_RECOMMENDATIONS = (
+    os.getenv("SPECULATIVE_RECOMMENDATIONS", "true").lower() == "true"
+)
 
 
-def update_daily_stats(data):
-    today = datetime.now().strftime("%Y-%m-%d")
-    if today not in data["daily_stats"]:
-        data["daily_stats"][today] = 0
-    data["daily_stats"][today] += 1
+async def igdb_exact_match(preference: str):
+    """Return the IGDB game whose name equals the preference, if any"""
+    preference_lower = preference.lower().strip()
+    try:
+        with timed_stage("igdb_exact"):
+            igdb_results = await igdb_search_games(preference, limit=5)
+        for game in igdb_results:
+            if game["name"].lower() == preference_lower:
+                return game["name"]
+    except Exception as e:
+        logger.warning("IGDB exact match failed", extra={"error": str(e)})
+    return None
 
 
-def format_datetime(dt_str):
-    dt = datetime.fromisoformat(dt_str)
-    return dt.strftime("%m/%d/%Y %I:%M%p").lower()
+async def rawg_exact_match(preference: str):
+    """Return a RAWG game that matches the preference exactly or very closely"""
+    preference_lower = preference.lower().strip()
+    try:
+        if get_rawg_api_key():
+            with timed_stage("rawg_exact"):
+                result = await rawg_get("rawg:search", "/games", {"search": preference})
+            # Check for exact or very close matches
+            for game in result.get("results", [])[:3]:
+                game_name_lower = game["name"].lower()
+                if (
+                    game_name_lower == preference_lower
+                    or preference_lower in game_name_lower
+                    or game_name_lower in preference_lower
+                ):
+                    return game["name"]
+    except Exception as e:
+        logger.warning("RAWG exact match failed", extra={"error": str(e)})
+    return None
 
 
-def get_color_for_usage(daily_usage, daily_limit):
-    percentage = (daily_usage / daily_limit) * 100
-    if percentage < 70:
-        return Colors.GREEN
-    elif percentage < 90:
-        return Colors.YELLOW
-    else:
-        return Colors.RED
+async def find_exact_match(preference: str):
+    """
+    Probe IGDB and RAWG concurrently for the game the preference names;
+    the first probe to find a match wins and the other is cancelled.
+    """
+    probes = [
+        asyncio.ensure_future(igdb_exact_match(preference)),
+        asyncio.ensure_future(rawg_exact_match(preference)),
+    ]
+    try:
+        for next_done in asyncio.as_completed(probes):
+            exact_match_title = await next_done
+            if exact_match_title:
+                return exact_match_title
+        return None
+    finally:
+        for probe in probes:
+            probe.cancel()
 
 
-async def fetch_game_details(titles: List[str]):
-    rawg_api_key = get_rawg_api_key()
-    if not rawg_api_key:
-        raise HTTPException(status_code=500, detail="Rawg API key not found")
+class PrefetchedTitles:
+    """Consumes a title stream in the background and buffers it until read"""
 
-    base_url = "https://api.rawg.io/api/games"
-    # Deduplicate and validate titles to avoid unnecessary API calls
-    unique_titles = list(dict.fromkeys(titles))
-    games = []
-
-    # Load current RAWG request data
-    rawg_data = load_rawg_requests()
-    reset_time = datetime.fromisoformat(rawg_data["reset_time"])
-    now = datetime.now()
-
-    # If reset time has passed, reset the counter
-    if now >= reset_time:
-        rawg_data = {
-            "remaining": RAWG_REQUEST_LIMIT,
-            "reset_time": (now + timedelta(days=30)).isoformat(),
-            "total_requests": 0,
-            "daily_stats": {},
-            "request_history": [],
-        }
-        save_rawg_requests(rawg_data)
+    def __init__(self, titles):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._pump(titles))
+
+    async def _pump(self, titles):
+        try:
+            async for title in titles:
+                await self._queue.put(("title", title))
+            await self._queue.put(("end", None))
+        except Exception as e:
+            await self._queue.put(("error", e))
 
-    # Track requests for this batch
-    batch_requests = 0
+    def cancel(self):
+        self._task.cancel()
 
-    async def fetch_game(title):
-        nonlocal batch_requests
-        params = {"search": title, "key": rawg_api_key}
+    async def __aiter__(self):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(base_url, params=params) as response:
-                    response.raise_for_status()
-                    # Update request counts
-                    batch_requests += 1
-                    rawg_data["total_requests"] += 1
-
-                    # Update daily stats
-                    update_daily_stats(rawg_data)
-
-                    # Add to request history
-                    rawg_data["request_history"].append(
-                        {"timestamp": datetime.now().isoformat(), "title": title}
-                    )
+            while True:
+                kind, value = await self._queue.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            # Stop generating if the reader gives up early
+            self.cancel()
+
+
+def _discard_task_result(task):
+    if not task.cancelled():
+        task.exception()
+
+
+def start_generic_titles(preference: str, filters: dict, stream: bool):
+    """Start GPT-4o recommendations for the raw preference without waiting"""
+    if stream:
+        return PrefetchedTitles(stream_game_titles_gpt4o(preference, filters))
+    task = asyncio.ensure_future(fetch_game_titles_gpt4o(preference, filters))
+    # A cancelled-or-unused speculative call must not log "never retrieved"
+    task.add_done_callback(_discard_task_result)
+    return task
+
+
+def recommendation_explain(exact_match_title):
+    if exact_match_title:
+        return f"Found exact match for '{exact_match_title}' with similar trending games and curated gems."
+    return "AI-powered game recommendations tailored to your preferences."
+
+
+async def iter_similar_titles(exact_match_title, filters):
+    """Stream the exact match followed by similar games as GPT-4o generates them"""
+    yield exact_match_title
+    similar = 0
+    async for title in stream_game_titles_gpt4o(
+        f"Games similar to {exact_match_title}", filters
+    ):
+        if title.lower() != exact_match_title.lower():
+            yield title
+            similar += 1
+            if similar >= MAX_RECOMMENDED_TITLES - 1:
+                return
+
+
+async def fetch_similar_titles(exact_match_title, filters):
+    ai_titles = await fetch_game_titles_gpt4o(
+        f"Games similar to {exact_match_title}", filters
+    )
+    return [exact_match_title] + [
+        t for t in ai_titles if t.lower() != exact_match_title.lower()
+    ][: MAX_RECOMMENDED_TITLES - 1]
 
-                    result = await response.json()
-
-                    if result["results"]:
-                        game = result["results"][0]
-                        # Format release date
-                        release_date = game.get("released", "N/A")
-                        if release_date != "N/A":
-                            try:
-                                release_date = datetime.strptime(
-                                    release_date, "%Y-%m-%d"
-                                ).strftime("%m/%d/%Y")
-                            except ValueError:
-                                pass
-
-                        # Fetch Twitch viewer count for the game title
-                        viewer_count = await get_twitch_viewer_count(game["name"])
-                        return {
-                            "title": game["name"],
-                            "release_date": release_date,
-                            "platforms": ", ".join(
-                                p["platform"]["name"] for p in game.get("platforms", [])
-                            ),
-                            "rating": game.get("rating", "N/A"),
-                            "genres": ", ".join(
-                                g["name"] for g in game.get("genres", [])
-                            ),
-                            "developers": ", ".join(
-                                d["name"] for d in game.get("developers", [])
-                            ),
-                            "metacritic": game.get("metacritic", "N/A"),
-                            "background_image": game.get("background_image", ""),
-                            "twitch_viewers": viewer_count,
-                        }
-        except Exception:
-            return None
 
-    tasks = [fetch_game(title) for title in unique_titles]
-    results = await asyncio.gather(*tasks)
-    games = [game for game in results if game]
+async def resolve_recommendation_titles(
+    preference: str, filters: dict, stream: bool = False
+):
+    """
+    Pick the titles to recommend: an exact match plus similar games when the
+    preference names a known game, otherwise GPT-4o recommendations.
+    Returns (titles, explain); with stream=True titles is an async iterator
+    that yields each title as soon as GPT-4o produces it.
+    """
+    generic = None
+    if SPECULATIVE_RECOMMENDATIONS:
+        generic = start_generic_titles(preference, filters, stream)
+    try:
+        exact_match_title = await find_exact_match(preference)
+    except BaseException:
+        if generic is not None:
+            generic.cancel()
+        raise
+    explain = recommendation_explain(exact_match_title)
+
+    # Generate recommendations based on match type
+    if exact_match_title:
+        # Found exact match - get similar games
+        if generic is not None:
+            generic.cancel()
+        if stream:
+            return iter_similar_titles(exact_match_title, filters), explain
+        return await fetch_similar_titles(exact_match_title, filters), explain
+
+    # No exact match - use AI for general recommendations
+    if generic is None:
+        generic = start_generic_titles(preference, filters, stream)
+    if stream:
+        return generic, explain
+    return await generic, explain
+
+
+async def get_recommendations(
+    preference: str, sort_by: str = "release_date", filters=None, refresh=False
+):
+    """
+    Enhanced recommendation system with intelligent exact matching and AI recommendations.
+    refresh=True recomputes (and re-caches) the result even when it is cached.
+    """
+    if filters is None:
+        filters = {}
+
+    # Identical queries are served from cache and only re-sorted
+    cache_key = recommendation_cache_key(preference, filters)
+    if not refresh:
+        query_prewarmer.record(cache_key, preference, filters)
+        cached = recommendation_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "games": sort_games(cached["games"], sort_by)}
 
-    # Update remaining requests after all requests are complete
-    rawg_data["remaining"] -= batch_requests
+    try:
+        # Concurrent identical queries share one pipeline run
+        result = await upstream_flights.do(
+            ("recommendations", cache_key),
+            lambda: compute_recommendations(preference, filters, cache_key),
+        )
+        return {**result, "games": sort_games(result["games"], sort_by)}
+    except Exception as e:
+        logger.warning("Recommendation fallback triggered", extra={"error": str(e)})
+        # AI API failed, return static example
+        return ai_fallback_response()
 
-    # Save the final state and log once after all requests are complete
-    save_rawg_requests(rawg_data)
-    log_rawg_requests()
 
-    return games
+async def compute_recommendations(preference: str, filters: dict, cache_key: str):
+    titles, explain = await resolve_recommendation_titles(
+        preference, filters, stream=OPENAI_STREAM_TITLES
+    )
+    # Fetch detailed game information
+    games = await fetch_game_details(titles)
+    result = {"games": games, "explain": explain}
+    if games:
+        recommendation_cache.set(cache_key, result)
+    return result
 
 
-# --- Enhanced hybrid recommendation logic ---
-async def get_recommendations(  # noqa: C901
+async def stream_recommendations(
     preference: str, sort_by: str = "release_date", filters=None
 ):
     """
-    Enhanced recommendation system with intelligent exact matching and AI recommendations
+    Streaming variant of get_recommendations. Yields frames in order:
+    "explain" once titles are known, one "game" per card as soon as its RAWG
+    lookup completes, "twitch" with viewer counts, then a sorted "done" frame.
     """
     if filters is None:
         filters = {}
-    preference_lower = preference.lower().strip()
 
-    # Enhanced exact matching using multiple sources
-    exact_match_found = False
-    exact_match_title = None
+    cache_key = recommendation_cache_key(preference, filters)
+    query_prewarmer.record(cache_key, preference, filters)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        games = sort_games(cached["games"], sort_by)
+        yield {"type": "explain", "explain": cached["explain"]}
+        for game in games:
+            yield {"type": "game", "game": game}
+        yield {"type": "done", **cached, "games": games}
+        return
+
     try:
-        # Try IGDB first for exact matching
-        try:
-            igdb_results = await igdb_search_games(preference, limit=5)
-            for game in igdb_results:
-                if game["name"].lower() == preference_lower:
-                    exact_match_found = True
-                    exact_match_title = game["name"]
-                    break
-        except Exception as e:
-            print(f"IGDB search error: {e}")
-        # If no exact match in IGDB, try RAWG for partial matches
-        if not exact_match_found:
+        titles, explain = await resolve_recommendation_titles(
+            preference, filters, stream=OPENAI_STREAM_TITLES
+        )
+        if not get_rawg_api_key():
+            raise HTTPException(status_code=500, detail="Rawg API key not found")
+        yield {"type": "explain", "explain": explain}
+
+        games = []
+        with timed_stage("game_cards"):
+            async for game in iter_game_details(titles):
+                games.append(game)
+                yield {"type": "game", "game": game}
+
+        with timed_stage("twitch_viewers"):
+            await add_twitch_viewers(games)
+        yield {
+            "type": "twitch",
+            "viewers": {game["title"]: game["twitch_viewers"] for game in games},
+        }
+
+        result = {"games": games, "explain": explain}
+        if games:
+            recommendation_cache.set(cache_key, result)
+        yield {"type": "done", **result, "games": sort_games(games, sort_by)}
+    except Exception as e:
+        logger.warning("Recommendation fallback triggered", extra={"error": str(e)})
+        yield {"type": "done", **ai_fallback_response()}
+
+
+# --- POPULAR QUERY PREWARMER ---
+# After a deploy the response cache is empty and the first users of popular
+# queries would pay for the whole pipeline. The prewarmer counts queries and
+# re-runs the most popular ones (plus optional seed queries): once shortly
+# after startup, then periodically inside off-peak hours. Off-peak passes keep
+# the persistent LLM and RAWG caches fresh for the day. It stops for the cycle
+# once it has used its share of the monthly RAWG budget. With several workers,
+# query counts and budget use live in the shared state database and one worker
+# at a time holds the lease to run a pass.
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", "20"))
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", 6 * 3600))  # seconds
+PREWARM_HOURS = os.getenv("PREWARM_HOURS", "2-6")  # local hours; empty = any time
+PREWARM_SEED_QUERIES = [
+    query.strip()
+    for query in os.getenv("PREWARM_SEED_QUERIES", "").split(";")
+    if query.strip()
+]
+PREWARM_RAWG_BUDGET_SHARE = float(os.getenv("PREWARM_RAWG_BUDGET_SHARE", "0.05"))
+PREWARM_STARTUP_DELAY = 60  # seconds after startup before the first pass
+PREWARM_CHECK_INTERVAL = 300  # seconds between off-peak window checks
+PREWARM_QUERY_SPACING = 5  # seconds between prewarmed queries
+PREWARM_MAX_TRACKED = 5000  # distinct queries counted
+PREWARM_SAVED_QUERIES = 500  # most popular queries kept across restarts
+
+
+def parse_hour_windows(spec):
+    """ "2-6,13-14" -> [(2, 6), (13, 14)]; a window may wrap past midnight"""
+    windows = []
+    for part in spec.split(","):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            windows.append((int(start) % 24, int(end) % 24))
+    return windows
+
+
+class QueryPrewarmer:
+    """Counts recommendation queries and keeps the most popular ones cached"""
+
+    def __init__(
+        self,
+        top_n=PREWARM_TOP_N,
+        budget_share=PREWARM_RAWG_BUDGET_SHARE,
+        hours=PREWARM_HOURS,
+        seeds=PREWARM_SEED_QUERIES,
+        store=None,
+    ):
+        self.top_n = top_n
+        self.budget_share = budget_share
+        self.windows = parse_hour_windows(hours)
+        self.seeds = seeds
+        self.store = store
+        self.counts = {}  # cache key -> [count, preference, filters]
+        self._pending = {}  # counts not yet added to the shared state, same shape
+        self.rawg_used = 0
+        self.budget_cycle = None
+        self.last_pass = 0.0
+        self.stats = Counter()
+
+    def record(self, cache_key, preference, filters):
+        entry = self.counts.get(cache_key)
+        if entry is None:
+            if len(self.counts) >= PREWARM_MAX_TRACKED:
+                # Forget the less popular half rather than scanning on every insert
+                ranked = sorted(self.counts, key=lambda k: self.counts[k][0])
+                for key in ranked[: len(ranked) // 2]:
+                    del self.counts[key]
+            entry = self.counts[cache_key] = [0, preference, dict(filters)]
+        entry[0] += 1
+        if self.store is not None:
+            pending = self._pending.setdefault(cache_key, [0, preference, entry[2]])
+            pending[0] += 1
+
+    def top_queries(self):
+        ranked = sorted(self.counts.values(), key=lambda entry: -entry[0])
+        queries = [(preference, filters) for _, preference, filters in ranked]
+        queries = queries[: self.top_n]
+        keys = {recommendation_cache_key(p, f) for p, f in queries}
+        for seed in self.seeds:
+            if recommendation_cache_key(seed, {}) not in keys:
+                queries.append((seed, {}))
+        return queries
+
+    def in_window(self, hour=None):
+        if not self.windows:
+            return True
+        hour = datetime.now().hour if hour is None else hour
+        return any(
+            start <= hour < end if start <= end else hour >= start or hour < end
+            for start, end in self.windows
+        )
+
+    def budget(self):
+        return int(RAWG_REQUEST_LIMIT * self.budget_share)
+
+    async def _use_budget(self, requests):
+        """Count RAWG requests against this cycle's budget, shared across workers"""
+        cycle = rawg_quota.reset_time.isoformat()
+        if cycle != self.budget_cycle:
+            self.budget_cycle = cycle
+            self.rawg_used = 0
+        if self.store is None:
+            self.rawg_used += requests
+        else:
+            self.rawg_used = await asyncio.to_thread(
+                self.store.increment, f"prewarm:rawg_used:{cycle}", requests
+            )
+
+    async def _budget_left(self):
+        await self._use_budget(0)
+        # A query can cost up to one RAWG search per recommended title
+        return (
+            self.rawg_used + MAX_RECOMMENDED_TITLES <= self.budget()
+            and rawg_quota.remaining > RAWG_WARNING_THRESHOLD
+        )
+
+    async def warm_once(self):
+        """Refresh the popular queries that aren't freshly cached; returns the count"""
+        warmed = 0
+        for preference, filters in self.top_queries():
+            key = recommendation_cache_key(preference, filters)
+            expires_in = recommendation_cache.expires_in(key)
+            if expires_in is not None and expires_in > RECOMMENDATION_CACHE_TTL / 2:
+                continue  # a user just computed it
+            if not await self._budget_left():
+                self.stats["budget_stops"] += 1
+                break
+            before = rawg_quota.total_requests
             try:
-                rawg_api_key = get_rawg_api_key()
-                if rawg_api_key:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(
-                            "https://api.rawg.io/api/games",
-                            params={"search": preference, "key": rawg_api_key},
-                        ) as response:
-                            if response.status == 200:
-                                result = await response.json()
-                                if result.get("results"):
-                                    # Check for exact or very close matches
-                                    for game in result["results"][:3]:
-                                        game_name_lower = game["name"].lower()
-                                        if (
-                                            game_name_lower == preference_lower
-                                            or preference_lower in game_name_lower
-                                            or game_name_lower in preference_lower
-                                        ):
-                                            exact_match_found = True
-                                            exact_match_title = game["name"]
-                                            break
+                await get_recommendations(preference, filters=filters, refresh=True)
             except Exception as e:
-                print(f"RAWG search error: {e}")
-        # Generate recommendations based on match type
-        if exact_match_found:
-            # Found exact match - get similar games
-            ai_titles = await fetch_game_titles_gpt4o(
-                f"Games similar to {exact_match_title}", filters
-            )
-            titles = [exact_match_title] + [
-                t for t in ai_titles if t.lower() != exact_match_title.lower()
-            ][:17]
-            explain = f"Found exact match for '{exact_match_title}' with similar trending games and curated gems."
-        else:
-            # No exact match - use AI for general recommendations
-            titles = await fetch_game_titles_gpt4o(preference, filters)
-            explain = "AI-powered game recommendations tailored to your preferences."
-        # Fetch detailed game information
-        games = await fetch_game_details(titles)
-        if games:
-            # Enhanced sorting options
-            if sort_by == "rating":
-                games.sort(
-                    key=lambda x: float(x["rating"]) if x["rating"] != "N/A" else 0,
-                    reverse=True,
-                )
-            elif sort_by == "metacritic":
-                games.sort(
-                    key=lambda x: (
-                        int(x["metacritic"])
-                        if x["metacritic"] not in ["N/A", None]
-                        else 0
-                    ),
-                    reverse=True,
-                )
-            else:  # release_date
-                games.sort(
-                    key=lambda x: (
-                        x["release_date"]
-                        if x["release_date"] != "N/A"
-                        else "1970-01-01"
-                    ),
-                    reverse=True,
+                logger.warning(
+                    "Prewarm failed",
+                    extra={"preference": preference, "error": str(e)},
                 )
-        return {"games": games, "explain": explain}
-    except Exception as e:
-        print(f"Recommendation fallback triggered: {e}")
-        # AI API failed, return static example
-        static_games = [
-            {
-                "title": "The Witcher 3: Wild Hunt",
-                "description": "An epic open-world RPG with a rich story and deep gameplay.",
-                "rating": 9.5,
-                "release_date": "2015-05-18",
-                "platforms": "PC, PS4, Xbox One, Switch",
-                "genres": "RPG, Adventure",
-                "developers": "CD Projekt Red",
-                "publishers": "CD Projekt",
-                "metacritic": 93,
-                "esrb_rating": "Mature",
-                "website": "https://thewitcher.com/en/witcher3",
-                "background_image": "https://media.rawg.io/media/games/0b7/0b78e1e8e6c6b1b2c2e2e2e2e2e2e2e2.jpg",
-            },
-            {
-                "title": "Celeste",
-                "description": "A beautiful indie platformer about climbing a mountain and overcoming challenges.",
-                "rating": 9.0,
-                "release_date": "2018-01-25",
-                "platforms": "PC, PS4, Xbox One, Switch",
-                "genres": "Platformer, Indie",
-                "developers": "Matt Makes Games",
-                "publishers": "Matt Makes Games",
-                "metacritic": 92,
-                "esrb_rating": "Everyone 10+",
-                "website": "https://www.celestegame.com/",
-                "background_image": "https://media.rawg.io/media/games/6b5/6b5a5e5e5e5e5e5e5e5e5e5e5e5e5e5e.jpg",
-            },
-        ]
-        return {
-            "ai_down": True,
-            "message": (
-                "Our AI-powered recommendations are temporarily unavailable. "
-                "Here's an example of what you would see if the service was live."
-            ),
-            "games": static_games,
+            await self._use_budget(max(rawg_quota.total_requests - before, 0))
+            warmed += 1
+            self.stats["warmed"] += 1
+            await asyncio.sleep(PREWARM_QUERY_SPACING)
+        self.last_pass = time.time()
+        # Age the counts so the head follows recent traffic
+        await self.save(age=True)
+        return warmed
+
+    async def _claim_pass(self):
+        """With several workers, one of them runs each pass"""
+        if self.store is None:
+            return True
+        return await asyncio.to_thread(
+            self.store.try_lease, "prewarm", PREWARM_INTERVAL
+        )
+
+    async def run(self):
+        await asyncio.sleep(PREWARM_STARTUP_DELAY)
+        if not check_environment():
+            if await self._claim_pass():
+                await self.warm_once()
+            else:
+                self.last_pass = time.time()
+        while True:
+            await asyncio.sleep(PREWARM_CHECK_INTERVAL)
+            if self.store is not None:
+                # Hand this worker's counts to whichever worker runs the pass
+                await self.save()
+            if not self.in_window() or time.time() - self.last_pass < PREWARM_INTERVAL:
+                continue
+            if check_environment():
+                continue
+            if not await self._claim_pass():
+                self.last_pass = time.time()
+                continue
+            await self.warm_once()
+
+    async def load(self):
+        if self.store is not None:
+            await self.save()
+            await self._use_budget(0)
+            return
+        state = await upstream_cache.get("prewarm:state", {})
+        if not state:
+            return
+        for key, count, preference, filters in state["queries"]:
+            self.counts.setdefault(key, [count, preference, filters])
+        self.budget_cycle = state["budget_cycle"]
+        self.rawg_used = state["rawg_used"]
+
+    def _sync_counts(self, pending, age):
+        """Add pending counts to the shared ones; returns the most popular queries"""
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO prewarm_queries (key, count, preference, filters) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET count = count + excluded.count",
+                [
+                    (key, count, preference, json.dumps(filters))
+                    for key, (count, preference, filters) in pending.items()
+                ],
+            )
+            if age:
+                conn.execute("UPDATE prewarm_queries SET count = count / 2")
+            conn.execute(
+                "DELETE FROM prewarm_queries WHERE key NOT IN (SELECT key FROM "
+                "prewarm_queries ORDER BY count DESC LIMIT ?)",
+                (PREWARM_MAX_TRACKED,),
+            )
+            return conn.execute(
+                "SELECT key, count, preference, filters FROM prewarm_queries "
+                "ORDER BY count DESC LIMIT ?",
+                (PREWARM_SAVED_QUERIES,),
+            ).fetchall()
+
+    async def _save_shared(self, age):
+        pending, self._pending = self._pending, {}
+        try:
+            rows = await asyncio.to_thread(self._sync_counts, pending, age)
+        except Exception as e:
+            for key, (count, preference, filters) in pending.items():
+                entry = self._pending.setdefault(key, [0, preference, filters])
+                entry[0] += count
+            logger.error("Prewarm state save failed", extra={"error": str(e)})
+            return
+        self.counts = {
+            key: [count, preference, json.loads(filters)]
+            for key, count, preference, filters in rows
+        }
+        # Queries counted while the sync ran are still pending; keep them ranked
+        for key, (count, preference, filters) in self._pending.items():
+            entry = self.counts.setdefault(key, [0, preference, filters])
+            entry[0] += count
+
+    async def save(self, age=False):
+        if self.store is not None:
+            await self._save_shared(age)
+            return
+        if age:
+            for entry in self.counts.values():
+                entry[0] /= 2
+        ranked = sorted(self.counts.items(), key=lambda item: -item[1][0])
+        state = {
+            "queries": [
+                [key, count, preference, filters]
+                for key, (count, preference, filters) in ranked[:PREWARM_SAVED_QUERIES]
+            ],
+            "budget_cycle": self.budget_cycle,
+            "rawg_used": self.rawg_used,
         }
+        try:
+            await upstream_cache.set("prewarm:state", {}, state)
+        except Exception as e:
+            logger.error("Prewarm state save failed", extra={"error": str(e)})
+
+
+query_prewarmer = QueryPrewarmer(store=shared_state)
 
 
-async def get_game_details(title: str):
+# --- END POPULAR QUERY PREWARMER ---
+
+
+GAME_DETAILS_CACHE_TTL = int(os.getenv("GAME_DETAILS_CACHE_TTL", 6 * 3600))  # seconds
+GAME_DETAILS_CACHE_MAX_BYTES = int(
+    os.getenv("GAME_DETAILS_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+)
+
+# RAWG id (or slug) -> formatted game details
+game_details_cache = ResponseCache(GAME_DETAILS_CACHE_MAX_BYTES, GAME_DETAILS_CACHE_TTL)
+
+
+async def get_game_details(title: str, rawg_id=None, slug=None):
     """
-    Enhanced game details with additional gaming context
+    Enhanced game details with additional gaming context.
+    When the caller already knows the RAWG id or slug (from a recommendation
+    card) the search step is skipped.
     """
     rawg_api_key = get_rawg_api_key()
     if not rawg_api_key:
         raise HTTPException(status_code=500, detail="Rawg API key not found")
 
-    base_url = "https://api.rawg.io/api/games"
-    params = {"search": title, "key": rawg_api_key}
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(base_url, params=params) as response:
-                response.raise_for_status()
-                result = await response.json()
-
-                if result["results"]:
-                    game = result["results"][0]
-                    # Get the game ID for detailed info
-                    game_id = game["id"]
-
-                    # Fetch detailed game information
-                    detail_url = f"{base_url}/{game_id}"
-                    async with session.get(
-                        detail_url, params={"key": rawg_api_key}
-                    ) as detail_response:
-                        detail_response.raise_for_status()
-                        detail_result = await detail_response.json()
-
-                        # Get screenshots
-                        screenshot_url = f"{base_url}/{game_id}/screenshots"
-                        async with session.get(
-                            screenshot_url, params={"key": rawg_api_key}
-                        ) as screenshot_response:
-                            screenshot_response.raise_for_status()
-                            screenshot_result = await screenshot_response.json()
-                            screenshots = [
-                                s["image"]
-                                for s in screenshot_result.get("results", [])[:6]
-                            ]
-
-                        return {
-                            "title": detail_result["name"],
-                            "description": detail_result.get(
-                                "description_raw", "No description available."
-                            ),
-                            "screenshots": screenshots,
-                            "rating": detail_result.get("rating", "N/A"),
-                            "release_date": detail_result.get("released", "N/A"),
-                            "platforms": ", ".join(
-                                p["platform"]["name"]
-                                for p in detail_result.get("platforms", [])
-                            ),
-                            "genres": ", ".join(
-                                g["name"] for g in detail_result.get("genres", [])
-                            ),
-                            "developers": ", ".join(
-                                d["name"] for d in detail_result.get("developers", [])
-                            ),
-                            "publishers": ", ".join(
-                                p["name"] for p in detail_result.get("publishers", [])
-                            ),
-                            "metacritic": detail_result.get("metacritic", "N/A"),
-                            "esrb_rating": (
-                                detail_result.get("esrb_rating", {}).get("name", "N/A")
-                                if detail_result.get("esrb_rating")
-                                else "N/A"
-                            ),
-                            "website": detail_result.get("website", ""),
-                            "background_image": detail_result.get(
-                                "background_image", ""
-                            ),
-                        }
-                else:
-                    raise HTTPException(status_code=404, detail="Game not found")
+        game_id = rawg_id or slug
+        if game_id is None:
+            with timed_stage("rawg_search"):
+                result = await rawg_get("rawg:search", "/games", {"search": title})
+            if not result["results"]:
+                raise HTTPException(status_code=404, detail="Game not found")
+            # Get the game ID for detailed info
+            game_id = result["results"][0]["id"]
+
+        cached = game_details_cache.get(str(game_id))
+        if cached is not None:
+            return cached
+
+        # Fetch detailed game information and screenshots together
+        with timed_stage("rawg_details"):
+            detail_result, screenshot_result = await asyncio.gather(
+                rawg_get("rawg:game", f"/games/{game_id}"),
+                rawg_get("rawg:screenshots", f"/games/{game_id}/screenshots"),
+            )
+        screenshots = [s["image"] for s in screenshot_result.get("results", [])[:6]]
+
+        details = {
+            "title": detail_result["name"],
+            "rawg_id": detail_result.get("id"),
+            "slug": detail_result.get("slug"),
+            "description": detail_result.get(
+                "description_raw", "No description available."
+            ),
+            "screenshots": screenshots,
+            "rating": detail_result.get("rating", "N/A"),
+            "release_date": detail_result.get("released", "N/A"),
+            "platforms": ", ".join(
+                p["platform"]["name"] for p in detail_result.get("platforms", [])
+            ),
+            "genres": ", ".join(g["name"] for g in detail_result.get("genres", [])),
+            "developers": ", ".join(
+                d["name"] for d in detail_result.get("developers", [])
+            ),
+            "publishers": ", ".join(
+                p["name"] for p in detail_result.get("publishers", [])
+            ),
+            "metacritic": detail_result.get("metacritic", "N/A"),
+            "esrb_rating": (
+                detail_result.get("esrb_rating", {}).get("name", "N/A")
+                if detail_result.get("esrb_rating")
+                else "N/A"
+            ),
+            "website": detail_result.get("website", ""),
+            "background_image": detail_result.get("background_image", ""),
+        }
+        # Cache under both the id and slug so either form hits next time
+        for key in {str(game_id), str(details["rawg_id"]), details["slug"]}:
+            if key and key != "None":
+                game_details_cache.set(key, details)
+        return details
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -886,11 +4178,62 @@ async def health_check():
             "environment": (
                 "production" if os.getenv("RAILWAY_ENVIRONMENT") else "development"
             ),
+            "upstream": {
+                provider: limiter.snapshot()
+                for provider, limiter in upstream_limiters.items()
+            },
+            "dropped_results": dict(dropped_results),
+            "rawg_quota": {
+                "total_requests": rawg_quota.total_requests,
+                "remaining": rawg_quota.remaining,
+            },
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage and upstream latency, call counts, cache hit ratios"""
+    caches = {
+        "recommendations": (recommendation_cache.hits, recommendation_cache.misses),
+        "game_details": (game_details_cache.hits, game_details_cache.misses),
+        "upstream": (upstream_cache.hits, upstream_cache.misses),
+        "title_index": (title_index.hits, title_index.misses),
+        "autocomplete_index": (autocomplete_index.hits, autocomplete_index.misses),
+        "twitch_viewers": (
+            twitch_viewers.stats["hits"],
+            twitch_viewers.stats["lazy"],
+        ),
+    }
+    cache_hits = Metric("nexa_cache_hits_total", "Cache lookups served", ("cache",))
+    cache_misses = Metric("nexa_cache_misses_total", "Cache lookups missed", ("cache",))
+    cache_ratio = Metric(
+        "nexa_cache_hit_ratio", "Share of cache lookups served", ("cache",), "gauge"
+    )
+    for cache, (hits, misses) in caches.items():
+        cache_hits.set(hits, cache)
+        cache_misses.set(misses, cache)
+        cache_ratio.set(round(hits / (hits + misses), 4) if hits + misses else 0, cache)
+
+    lines = []
+    for metric in (
+        request_seconds,
+        requests_total,
+        stage_seconds,
+        upstream_seconds,
+        upstream_calls,
+        upstream_errors,
+        cache_hits,
+        cache_misses,
+        cache_ratio,
+    ):
+        lines.extend(metric.render())
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.get("/api/test-gpt4o")
 async def test_gpt4o():
     """Test endpoint to verify GPT-4o integration"""
@@ -917,61 +4260,33 @@ async def test_gpt4o():
             "temperature": 0.1,
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions", headers=headers, json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"OpenAI API error: {response.status} - {error_text}")
-                    raise Exception(f"OpenAI API error: {response.status}")
+        session = get_http_session("openai")
+        async with session.post(
+            OPENAI_CHAT_URL, headers=headers, json=data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.warning(
+                    "LLM API error",
+                    extra={
+                        "provider": "openai",
+                        "status": response.status,
+                        "body": error_text[:500],
+                    },
+                )
+                raise Exception(f"OpenAI API error: {response.status}")
 
-                result = await response.json()
-                content = result["choices"][0]["message"]["content"].strip()
+            result = await response.json()
+            content = result["choices"][0]["message"]["content"].strip()
 
         return {"status": "success", "message": content, "model": "gpt-4o"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-# Custom rate limiter implementation
-rate_limit_store = defaultdict(list)
-RATE_LIMIT_REQUESTS = 10
-RATE_LIMIT_WINDOW = 60  # seconds
-
-
-def check_rate_limit(client_ip: str) -> bool:
-    """Check if client has exceeded rate limit"""
-    now = time.time()
-    # Clean old requests outside the window
-    rate_limit_store[client_ip] = [
-        req_time
-        for req_time in rate_limit_store[client_ip]
-        if now - req_time < RATE_LIMIT_WINDOW
-    ]
-
-    # Check if limit exceeded
-    if len(rate_limit_store[client_ip]) >= RATE_LIMIT_REQUESTS:
-        return False
-
-    # Add current request
-    rate_limit_store[client_ip].append(now)
-    return True
-
-
 @app.post("/api/recommendations")
-async def recommendations(request: RecommendationRequest, req: Request):
-    # Check rate limit
-    client_ip = req.client.host
-    if not check_rate_limit(client_ip):
-        return JSONResponse(
-            status_code=429,
-            content={
-                "error": "Rate limit exceeded",
-                "message": "Too many requests. Please try again later.",
-            },
-        )
-
+async def recommendations(request: RecommendationRequest, fields: Optional[str] = None):
+    """fields= limits each game card to the listed keys, e.g. fields=title,rating"""
     try:
         # Check if required environment variables are set
         missing_vars = check_environment()
@@ -988,9 +4303,9 @@ async def recommendations(request: RecommendationRequest, req: Request):
         result = await get_recommendations(
             request.preference, request.sort_by, request.filters
         )
-        return result
+        return FastJSONResponse(select_game_fields(result, parse_fields(fields)))
     except Exception as e:
-        print(f"Error in recommendations endpoint: {str(e)}")
+        logger.exception("Recommendations endpoint failed")
         return JSONResponse(
             status_code=500,
             content={
@@ -1001,24 +4316,41 @@ async def recommendations(request: RecommendationRequest, req: Request):
         )
 
 
-@app.post("/api/game-details")
-async def game_details(request: GameDetailsRequest, req: Request):
-    # Check rate limit
-    client_ip = req.client.host
-    if not check_rate_limit(client_ip):
+@app.post("/api/recommendations/stream")
+async def recommendations_stream(
+    request: RecommendationRequest, fields: Optional[str] = None
+):
+    """Newline-delimited JSON stream of recommendation frames"""
+    missing_vars = check_environment()
+    if missing_vars:
         return JSONResponse(
-            status_code=429,
+            status_code=500,
             content={
-                "error": "Rate limit exceeded",
-                "message": "Too many requests. Please try again later.",
+                "error": "Missing required environment variables",
+                "missing_vars": missing_vars,
+                "message": "Please configure the required API keys in Railway environment variables",
             },
         )
 
+    selected = parse_fields(fields)
+
+    async def ndjson_frames():
+        async for frame in stream_recommendations(
+            request.preference, request.sort_by, request.filters
+        ):
+            yield json_dumps(select_game_fields(frame, selected)) + b"\n"
+
+    return StreamingResponse(ndjson_frames(), media_type="application/x-ndjson")
+
+
+@app.post("/api/game-details")
+async def game_details(request: GameDetailsRequest, fields: Optional[str] = None):
+    """fields= limits the payload to the listed keys, e.g. fields=title,screenshots"""
     try:
-        result = await get_game_details(request.title)
-        return result
+        result = await get_game_details(request.title, request.rawg_id, request.slug)
+        return FastJSONResponse(select_fields(result, parse_fields(fields)))
     except Exception as e:
-        print(f"Error in game details endpoint: {str(e)}")
+        logger.exception("Game details endpoint failed")
         return JSONResponse(
             status_code=500,
             content={"error": "Internal server error", "message": str(e)},
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+Load-test benchmark for the NEXA API.
+
+Starts local stand-ins for OpenAI, RAWG, IGDB and Twitch (with configurable
+latency, 503 and 429 rates), launches the app against them and drives
+concurrent load at /api/recommendations, /api/game-details and
+/api/igdb-autocomplete. Reports throughput, p50/p95/p99 latency, upstream
+calls per request and RAWG quota used per request. No API keys are needed.
+
+    python benchmark.py --requests 300 --concurrency 20
+    python benchmark.py --set rawg.throttle_rate=0.05 --set openai.latency=2
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json   # exits 1 on a regression
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+UPSTREAM_PROFILES = {
+    # latency: median seconds before answering; spread: lognormal sigma
+    # error_rate: share of 503 answers; throttle_rate: share of 429 answers
+    "openai": {"latency": 0.8, "spread": 0.4, "error_rate": 0.0, "throttle_rate": 0.0},
+    "rawg": {"latency": 0.15, "spread": 0.5, "error_rate": 0.0, "throttle_rate": 0.0},
+    "igdb": {"latency": 0.12, "spread": 0.5, "error_rate": 0.0, "throttle_rate": 0.0},
+    "twitch": {"latency": 0.1, "spread": 0.5, "error_rate": 0.0, "throttle_rate": 0.0},
+}
+OPENAI_CHUNK_INTERVAL = 0.01  # seconds between streamed completion chunks
+OPENAI_TITLES = 12  # titles per completion
+RETRY_AFTER = 1  # seconds, sent with mock 429s
+TWITCH_TOP_GAMES = 200  # games listed by /games/top
+APP_START_TIMEOUT = 60  # seconds
+
+# Catalog words never overlap with QUERY_* words, so only "games like <title>"
+# queries take the exact-match path
+# fmt: off
+ADJECTIVES = [
+    "Crimson", "Neon", "Silent", "Broken", "Eternal", "Hollow", "Iron", "Lunar",
+    "Savage", "Frozen", "Golden", "Shadow", "Solar", "Wild", "Ancient", "Electric",
+    "Forgotten", "Emerald", "Rogue", "Velvet",
+]
+NOUNS = [
+    "Odyssey", "Frontier", "Kingdom", "Protocol", "Legacy", "Horizon", "Citadel",
+    "Requiem", "Outpost", "Dynasty", "Labyrinth", "Vanguard", "Eclipse", "Harbor",
+    "Arcana", "Tempest", "Sanctum", "Voyage", "Bastion", "Reverie", "Exodus",
+    "Paradox", "Covenant", "Mirage", "Nexus", "Oracle", "Pinnacle", "Rift",
+    "Summit", "Wasteland",
+]
+# fmt: on
+QUERY_MOODS = ["cozy", "relaxing", "challenging", "story rich", "competitive"]
+QUERY_GENRES = ["farming", "racing", "puzzle", "roguelike", "survival", "strategy"]
+QUERY_EXTRAS = ["with co-op", "for beginners", "on handheld", "with great music"]
+
+ENDPOINTS = ["autocomplete", "recommendations", "game-details"]
+
+
+def stable_hash(text):
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def build_catalog():
+    catalog = []
+    for i, (adjective, noun) in enumerate(
+        (adjective, noun) for noun in NOUNS for adjective in ADJECTIVES
+    ):
+        name = f"{adjective} {noun}"
+        catalog.append(
+            {
+                "id": 1000 + i,
+                "name": name,
+                "slug": name.lower().replace(" ", "-"),
+                "released": f"{2005 + i % 19}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                "rating": round(2.5 + (i % 25) / 10, 2),
+                "metacritic": 60 + i % 35,
+                "platforms": [{"platform": {"name": "PC"}}],
+                "genres": [{"name": "Action"}, {"name": "Adventure"}],
+                "developers": [{"name": f"{noun} Studio"}],
+                "background_image": f"https://media.example/{i}.jpg",
+            }
+        )
+    return catalog
+
+
+CATALOG = build_catalog()
+CATALOG_BY_ID = {game["id"]: game for game in CATALOG}
+CATALOG_BY_NAME = {game["name"].lower(): game for game in CATALOG}
+
+
+def sample_latency(profile):
+    if profile["latency"] <= 0:
+        return 0
+    return random.lognormvariate(math.log(profile["latency"]), profile["spread"])
+
+
+# --- MOCK UPSTREAMS ---
+
+
+def rawg_search(query, page_size=5):
+    """Catalog games whose whole name appears in the query, then filler results"""
+    words = set(query.lower().split())
+    results = [g for g in CATALOG if set(g["name"].lower().split()) <= words]
+    offset = stable_hash(query.lower())
+    while len(results) < page_size:
+        results.append(CATALOG[(offset + len(results) * 7919) % len(CATALOG)])
+    return results[:page_size]
+
+
+async def rawg_games(request):
+    return web.json_response({"results": rawg_search(request.query.get("search", ""))})
+
+
+async def rawg_game(request):
+    game = CATALOG_BY_ID.get(int(request.match_info["id"]))
+    if game is None:
+        return web.json_response({"detail": "Not found."}, status=404)
+    return web.json_response(
+        {
+            **game,
+            "description_raw": f"{game['name']} is a benchmark game. " * 40,
+            "publishers": [{"name": "Benchmark Publishing"}],
+            "esrb_rating": {"name": "Teen"},
+            "website": f"https://{game['slug']}.example",
+        }
+    )
+
+
+async def rawg_screenshots(request):
+    game_id = request.match_info["id"]
+    return web.json_response(
+        {
+            "results": [
+                {"image": f"https://media.example/{game_id}/{i}.jpg"} for i in range(8)
+            ]
+        }
+    )
+
+
+async def igdb_games(request):
+    body = await request.text()
+    query = re.search(r'search "(.*?)";', body)
+    limit = re.search(r"limit (\d+);", body)
+    query = query.group(1).lower() if query else ""
+    matches = [
+        {
+            "id": game["id"],
+            "name": game["name"],
+            "slug": game["slug"],
+            "first_release_date": 1_300_000_000 + game["id"] * 86_400,
+            "cover": {"url": f"//images.example/{game['id']}.jpg"},
+            "total_rating_count": game["metacritic"] * 3,
+        }
+        for game in CATALOG
+        if game["name"].lower().startswith(query)
+        or any(word.startswith(query) for word in game["name"].lower().split())
+    ]
+    return web.json_response(matches[: int(limit.group(1)) if limit else 10])
+
+
+async def openai_completion(request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    rng = random.Random(stable_hash(prompt))
+    text = ", ".join(game["name"] for game in rng.sample(CATALOG, OPENAI_TITLES))
+    if not body.get("stream"):
+        return web.json_response(
+            {"choices": [{"message": {"role": "assistant", "content": text}}]}
+        )
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for i in range(0, len(text), 12):
+        chunk = {"choices": [{"delta": {"content": text[i : i + 12]}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await asyncio.sleep(OPENAI_CHUNK_INTERVAL)
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def twitch_token(request):
+    return web.json_response(
+        {"access_token": "benchmark", "expires_in": 3600, "token_type": "bearer"}
+    )
+
+
+def twitch_page(request, items):
+    first = int(request.query.get("first", 20))
+    offset = int(request.query.get("after") or 0)
+    page = items[offset : offset + first]
+    pagination = {"cursor": str(offset + first)} if offset + first < len(items) else {}
+    return web.json_response({"data": page, "pagination": pagination})
+
+
+async def twitch_games(request):
+    games = [
+        CATALOG_BY_NAME.get(name.lower()) for name in request.query.getall("name", [])
+    ]
+    return web.json_response(
+        {"data": [{"id": str(g["id"]), "name": g["name"]} for g in games if g]}
+    )
+
+
+async def twitch_top_games(request):
+    top = [{"id": str(g["id"]), "name": g["name"]} for g in CATALOG[:TWITCH_TOP_GAMES]]
+    return twitch_page(request, top)
+
+
+async def twitch_streams(request):
+    game_ids = request.query.getall("game_id", [])
+    if game_ids:
+        streams = [
+            {"game_id": game_id, "viewer_count": stable_hash(game_id) % 50}
+            for game_id in game_ids
+        ]
+        return web.json_response({"data": streams, "pagination": {}})
+    # Viewer counts fall off steeply, like the real long tail
+    streams = [
+        {
+            "game_id": str(CATALOG[i % TWITCH_TOP_GAMES]["id"]),
+            "viewer_count": int(5000 / (i + 1) ** 1.3),
+        }
+        for i in range(600)
+    ]
+    return twitch_page(request, streams)
+
+
+class MockUpstreams:
+    """Local aiohttp servers standing in for every upstream API"""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.calls = Counter()  # upstream -> requests received
+        self.faults = Counter()  # "upstream:status" -> injected failures
+        self.base_urls = {}
+        self._runners = []
+
+    def _middleware(self, name):
+        profile = self.profiles[name]
+
+        @web.middleware
+        async def inject_faults(request, handler):
+            if request.path.endswith("/oauth2/token"):
+                self.calls["twitch_auth"] += 1
+                return await handler(request)
+            self.calls[name] += 1
+            await asyncio.sleep(sample_latency(profile))
+            roll = random.random()
+            if roll < profile["throttle_rate"]:
+                self.faults[f"{name}:429"] += 1
+                return web.json_response(
+                    {"error": "Too Many Requests"},
+                    status=429,
+                    headers={"Retry-After": str(RETRY_AFTER)},
+                )
+            if roll < profile["throttle_rate"] + profile["error_rate"]:
+                self.faults[f"{name}:503"] += 1
+                return web.json_response({"error": "Service Unavailable"}, status=503)
+            return await handler(request)
+
+        return inject_faults
+
+    def _apps(self):
+        routes = {
+            "openai": [web.post("/v1/chat/completions", openai_completion)],
+            "rawg": [
+                web.get("/api/games", rawg_games),
+                web.get("/api/games/{id}", rawg_game),
+                web.get("/api/games/{id}/screenshots", rawg_screenshots),
+            ],
+            "igdb": [web.post("/v4/games", igdb_games)],
+            "twitch": [
+                web.post("/oauth2/token", twitch_token),
+                web.get("/helix/games", twitch_games),
+                web.get("/helix/games/top", twitch_top_games),
+                web.get("/helix/streams", twitch_streams),
+            ],
+        }
+        for name, upstream_routes in routes.items():
+            app = web.Application(middlewares=[self._middleware(name)])
+            app.add_routes(upstream_routes)
+            yield name, app
+
+    async def start(self):
+        for name, app in self._apps():
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            self._runners.append(runner)
+            host, port = runner.addresses[0][:2]
+            self.base_urls[name] = f"http://{host}:{port}"
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+    def app_env(self):
+        """Environment variables pointing the app at these servers"""
+        return {
+            "OPENAI_CHAT_URL": f"{self.base_urls['openai']}/v1/chat/completions",
+            "RAWG_API_BASE": f"{self.base_urls['rawg']}/api",
+            "IGDB_API_BASE": f"{self.base_urls['igdb']}/v4",
+            "TWITCH_API_BASE": f"{self.base_urls['twitch']}/helix",
+            "TWITCH_TOKEN_URL": f"{self.base_urls['twitch']}/oauth2/token",
+            "IGDB_TOKEN_URL": f"{self.base_urls['twitch']}/oauth2/token",
+        }
+
+
+# --- END MOCK UPSTREAMS ---
+
+
+# --- APP UNDER TEST ---
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(upstreams, workdir, port, workers):
+    """Run the app in a subprocess; relative cache paths land in workdir"""
+    env = dict(os.environ)
+    env.update(upstreams.app_env())
+    env.update(
+        {
+            "PYTHONPATH": ROOT,
+            "PYTHONUNBUFFERED": "1",
+            "OPENAI_API_KEY": "benchmark",
+            "RAWG_API_KEY": "benchmark",
+            "TWITCH_CLIENT_ID": "benchmark",
+            "TWITCH_CLIENT_SECRET": "benchmark",
+            "IGDB_CLIENT_ID": "benchmark",
+            "IGDB_CLIENT_SECRET": "benchmark",
+            "LLM_PROVIDERS": "openai",
+            "PREWARM_ENABLED": "false",
+            "RATE_LIMIT_RECOMMENDATIONS": "1000000000",
+            "RATE_LIMIT_DETAILS": "1000000000",
+            "RATE_LIMIT_AUTOCOMPLETE": "1000000000",
+        }
+    )
+    if workers > 1:
+        env["SHARED_STATE"] = "true"
+    log = open(os.path.join(workdir, "app.log"), "wb")
+    # fmt: off
+    command = [
+        sys.executable, "-m", "uvicorn", "app_fastapi:app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    # fmt: on
+    return subprocess.Popen(
+        command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+async def wait_until_ready(session, base_url, process):
+    deadline = time.monotonic() + APP_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            async with session.get(f"{base_url}/health") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"App did not start within {APP_START_TIMEOUT}s")
+
+
+async def rawg_quota_used(session, base_url):
+    async with session.get(f"{base_url}/health") as resp:
+        health = await resp.json()
+    return health.get("rawg_quota", {}).get("total_requests", 0)
+
+
+# --- END APP UNDER TEST ---
+
+
+# --- LOAD GENERATION ---
+
+
+def recommendation_queries(count, named_share, rng):
+    queries = []
+    for i in range(count):
+        if rng.random() < named_share:
+            queries.append(f"games like {rng.choice(CATALOG)['name']}")
+        else:
+            queries.append(
+                f"{rng.choice(QUERY_MOODS)} {rng.choice(QUERY_GENRES)} games "
+                f"{rng.choice(QUERY_EXTRAS)} #{i}"
+            )
+    return queries
+
+
+def request_factory(endpoint, args, rng):
+    """Return i -> (method, path, request kwargs) for one endpoint's workload"""
+    if endpoint == "recommendations":
+        queries = recommendation_queries(args.distinct_queries, args.named_share, rng)
+        return lambda i: (
+            "POST",
+            "/api/recommendations",
+            {
+                "json": {
+                    "preference": rng.choice(queries),
+                    "sort_by": rng.choice(["release_date", "rating"]),
+                    "filters": {},
+                }
+            },
+        )
+    if endpoint == "game-details":
+        games = rng.sample(CATALOG, min(args.distinct_queries, len(CATALOG)))
+
+        def details(i):
+            game = rng.choice(games)
+            return (
+                "POST",
+                "/api/game-details",
+                {"json": {"title": game["name"], "rawg_id": game["id"]}},
+            )
+
+        return details
+
+    def autocomplete(i):
+        name = rng.choice(CATALOG)["name"]
+        return (
+            "GET",
+            "/api/igdb-autocomplete",
+            {"params": {"q": name[: rng.randint(2, 8)]}},
+        )
+
+    return autocomplete
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_phase(session, base_url, make_request, total, concurrency):
+    """Send total requests from concurrency workers; returns (latencies, outcomes)"""
+    latencies, outcomes = [], Counter()
+    indexes = iter(range(total))
+
+    async def worker():
+        for i in indexes:
+            method, path, kwargs = make_request(i)
+            start = time.perf_counter()
+            try:
+                async with session.request(method, base_url + path, **kwargs) as resp:
+                    body = await resp.read()
+                    status = resp.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                outcomes["connection_error"] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                outcomes[f"http_{status}"] += 1
+            elif b'"ai_down":true' in body.replace(b" ", b""):
+                outcomes["fallback"] += 1
+            else:
+                outcomes["ok"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, outcomes
+
+
+async def benchmark_endpoint(session, base_url, upstreams, endpoint, args, rng):
+    make_request = request_factory(endpoint, args, rng)
+    if args.warmup:
+        await run_phase(session, base_url, make_request, args.warmup, args.concurrency)
+    calls_before = Counter(upstreams.calls)
+    quota_before = await rawg_quota_used(session, base_url)
+    started = time.perf_counter()
+    latencies, outcomes = await run_phase(
+        session, base_url, make_request, args.requests, args.concurrency
+    )
+    elapsed = time.perf_counter() - started
+    quota_used = await rawg_quota_used(session, base_url) - quota_before
+    calls = upstreams.calls - calls_before
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "outcomes": dict(outcomes),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "upstream_calls_per_request": round(sum(calls.values()) / args.requests, 3),
+        "upstream_calls": {
+            name: round(count / args.requests, 3)
+            for name, count in sorted(calls.items())
+        },
+        "rawg_quota_per_request": round(quota_used / args.requests, 3),
+    }
+
+
+# --- END LOAD GENERATION ---
+
+
+REGRESSION_METRICS = ["p95_ms", "upstream_calls_per_request", "rawg_quota_per_request"]
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for endpoint, result in results.items():
+        before = baseline.get(endpoint)
+        if not before:
+            continue
+        for metric in REGRESSION_METRICS:
+            if result[metric] > before.get(metric, 0) * (1 + tolerance) + 1e-9:
+                regressions.append(
+                    f"{endpoint} {metric}: {before.get(metric)} -> {result[metric]}"
+                )
+    return regressions
+
+
+def print_report(results, upstreams):
+    header = f"{'endpoint':<16}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header + f"{'calls/req':>11}{'rawg/req':>10}  outcomes")
+    for endpoint, r in results.items():
+        print(
+            f"{endpoint:<16}{r['throughput_rps']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+            f"{r['p99_ms']:>9}{r['upstream_calls_per_request']:>11}"
+            f"{r['rawg_quota_per_request']:>10}  {r['outcomes']}"
+        )
+        print(f"{'':<16}upstream calls/request: {r['upstream_calls']}")
+    if upstreams.faults:
+        print(f"Injected upstream faults: {dict(upstreams.faults)}")
+
+
+def parse_profile_overrides(overrides):
+    profiles = {name: dict(profile) for name, profile in UPSTREAM_PROFILES.items()}
+    for override in overrides:
+        key, _, value = override.partition("=")
+        name, _, field = key.partition(".")
+        if name not in profiles or field not in profiles[name] or not value:
+            raise SystemExit(
+                f"Invalid --set {override!r}, expected e.g. rawg.latency=0.2"
+            )
+        profiles[name][field] = float(value)
+    return profiles
+
+
+async def main_async(args):
+    random.seed(args.seed)
+    upstreams = MockUpstreams(parse_profile_overrides(args.set))
+    await upstreams.start()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="nexa-bench-") as workdir:
+        process = start_app(upstreams, workdir, port, args.workers)
+        timeout = aiohttp.ClientTimeout(total=120)
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        try:
+            async with aiohttp.ClientSession(
+                timeout=timeout, connector=connector
+            ) as session:
+                await wait_until_ready(session, base_url, process)
+                for endpoint in args.endpoints:
+                    rng = random.Random(f"{args.seed}:{endpoint}")
+                    results[endpoint] = await benchmark_endpoint(
+                        session, base_url, upstreams, endpoint, args, rng
+                    )
+        except Exception:
+            with open(os.path.join(workdir, "app.log"), "rb") as log:
+                sys.stderr.write(log.read()[-4000:].decode("utf-8", "replace"))
+            raise
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            await upstreams.stop()
+    print_report(results, upstreams)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--requests", type=int, default=200, help="measured requests per endpoint"
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--warmup", type=int, default=0, help="unmeasured requests per endpoint first"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="uvicorn worker processes"
+    )
+    parser.add_argument(
+        "--endpoints",
+        type=lambda value: [e for e in value.split(",") if e],
+        default=ENDPOINTS,
+        help=f"comma separated, from {','.join(ENDPOINTS)}",
+    )
+    parser.add_argument(
+        "--distinct-queries",
+        type=int,
+        default=100,
+        help="size of each endpoint's query pool",
+    )
+    parser.add_argument(
+        "--named-share",
+        type=float,
+        default=0.3,
+        help='share of "games like <title>" queries',
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="UPSTREAM.FIELD=VALUE",
+        help="override an upstream profile, e.g. rawg.throttle_rate=0.05",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed relative regression"
+    )
+    args = parser.parse_args()
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
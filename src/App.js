@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import GameRecommender from "./components/GameRecommender";
 import GameDetailsModal from "./components/GameDetailsModal";
 import ParticlesBackground from "./components/ParticlesBackground";
@@ -15,6 +15,18 @@ function App() {
   const [filters, setFilters] = useState({});
   const [aiDown, setAiDown] = useState(false);
   const [aiDownMessage, setAiDownMessage] = useState("");
+  const autocompleteSocket = useRef(null);
+
+  useEffect(() => {
+    autocompleteSocket.current = gameService.openAutocompleteSocket(
+      (results) => setAutocomplete(results),
+      (message) => {
+        console.warn("Autocomplete error:", message.error);
+        setAutocomplete([]);
+      }
+    );
+    return () => autocompleteSocket.current.close();
+  }, []);
 
   const handleGetRecommendations = async (preference, sortBy, filtersArg) => {
     setLoading(true);
@@ -22,10 +34,19 @@ function App() {
     setAiDown(false);
     setAiDownMessage("");
     try {
-      const result = await gameService.getRecommendations(
+      setGames([]);
+      const result = await gameService.streamRecommendations(
         preference,
         sortBy,
-        filtersArg || filters
+        filtersArg || filters,
+        (frame) => {
+          // Show each card as soon as the server resolves it
+          if (frame.type === "explain") {
+            setExplain(frame.explain || "");
+          } else if (frame.type === "game") {
+            setGames((current) => [...current, frame.game]);
+          }
+        }
       );
       // Ensure games is always an array
       setGames(Array.isArray(result.games) ? result.games : []);
@@ -48,6 +69,10 @@ function App() {
   const handleAutocomplete = async (query) => {
     if (!query) {
       setAutocomplete([]);
+      autocompleteSocket.current?.search(""); // drop answers to older queries
+      return;
+    }
+    if (autocompleteSocket.current?.search(query)) {
       return;
     }
     try {
@@ -65,7 +90,11 @@ function App() {
     setLoading(true);
     setError(null);
     try {
-      const details = await gameService.getGameDetails(game.title);
+      const details = await gameService.getGameDetails(
+        game.title,
+        game.rawg_id,
+        game.slug
+      );
       setGameDetails(details);
     } catch (err) {
       console.error("Error getting game details:", err);
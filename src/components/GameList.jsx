@@ -33,7 +33,11 @@ const GameCard = ({ game }) => {
           headers: {
             "Content-Type": "application/json",
           },
-          body: JSON.stringify({ title: game.title }),
+          body: JSON.stringify({
+            title: game.title,
+            rawg_id: game.rawg_id,
+            slug: game.slug,
+          }),
         });
         const data = await response.json();
         setDetails(data);
@@ -23,10 +23,48 @@ class GameService {
     }
   }
 
-  async getGameDetails(title) {
+  // Streams recommendation frames (explain, game, twitch, done) as they arrive
+  async streamRecommendations(preference, sortBy, filters = {}, onFrame = () => {}) {
+    const response = await fetch(`${API_BASE_URL}/recommendations/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ preference, sort_by: sortBy, filters }),
+    });
+    if (!response.ok || !response.body) {
+      const data = await response.json().catch(() => ({}));
+      throw new Error(data.detail || data.error || "Failed to fetch recommendations");
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const frame = JSON.parse(line);
+        if (frame.type === "done") result = frame;
+        onFrame(frame);
+      }
+    }
+    if (!result) {
+      throw new Error("Failed to fetch recommendations");
+    }
+    return result;
+  }
+
+  // rawgId/slug come from a recommendation card and let the API skip its search
+  async getGameDetails(title, rawgId = null, slug = null) {
     try {
       const response = await axios.post(`${API_BASE_URL}/game-details`, {
         title,
+        rawg_id: rawgId,
+        slug,
       });
       return response.data;
     } catch (error) {
@@ -46,6 +84,83 @@ class GameService {
       return [];
     }
   }
+
+  // One WebSocket for every keystroke; the server cancels stale lookups and
+  // only answers the latest query. search() returns false if the socket is
+  // unavailable so the caller can fall back to igdbAutocomplete. A socket that
+  // fails before it opens (no WebSocket support on the host or a proxy) is not
+  // retried, and the query that was waiting on it is answered over HTTP.
+  openAutocompleteSocket(onResults, onError = () => {}) {
+    const url = `${API_BASE_URL.replace(/^http/, "ws")}/igdb-autocomplete/ws`;
+    let socket = null;
+    let failed = false;
+    let pending = null; // { id, query } waiting for the socket to open
+    let latestId = 0;
+
+    const connect = () => {
+      const ws = new WebSocket(url);
+      let opened = false;
+      const fail = () => {
+        if (ws !== socket) return;
+        socket = null;
+        if (opened) return; // reconnect on the next keystroke
+        failed = true;
+        if (pending && pending.id === latestId) {
+          const { id, query } = pending;
+          this.igdbAutocomplete(query).then(
+            (results) => id === latestId && onResults(Array.isArray(results) ? results : [])
+          );
+        }
+        pending = null;
+      };
+      ws.onopen = () => {
+        opened = true;
+        if (pending && pending.id === latestId) {
+          ws.send(JSON.stringify({ id: pending.id, q: pending.query }));
+        }
+        pending = null;
+      };
+      ws.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.id !== latestId) return;
+        if (Array.isArray(message.results)) {
+          onResults(message.results);
+        } else if (message.error) {
+          onError(message);
+        }
+      };
+      ws.onerror = fail;
+      ws.onclose = fail;
+      socket = ws;
+    };
+
+    return {
+      search(query) {
+        latestId += 1;
+        if (failed) return false;
+        const payload = JSON.stringify({ id: latestId, q: query });
+        if (!query) {
+          // Only invalidates older answers; no reason to open a socket for it
+          if (socket && socket.readyState === WebSocket.OPEN) socket.send(payload);
+          pending = null;
+          return true;
+        }
+        if (!socket) connect();
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(payload);
+          return true;
+        }
+        if (socket.readyState === WebSocket.CONNECTING) {
+          pending = { id: latestId, query };
+          return true;
+        }
+        return false;
+      },
+      close() {
+        if (socket) socket.close();
+      },
+    };
+  }
 }
 
 export const gameService = new GameService();
@@ -4,11 +4,28 @@ Startup script for Railway deployment
 """
 import os
 import uvicorn
-from app_fastapi import app
 
 if __name__ == "__main__":
     # Get port from environment variable, default to 8000
     port = int(os.getenv("PORT", 8000))
 
-    # Start the server
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
+    # Number of worker processes; "auto" uses every core on the machine
+    workers = os.getenv("WEB_CONCURRENCY", "1")
+    workers = (os.cpu_count() or 1) if workers == "auto" else int(workers)
+
+    if workers > 1:
+        # Workers share rate limits, OAuth tokens and the RAWG quota through
+        # SQLite; set before the workers import the app
+        os.environ.setdefault("SHARED_STATE", "true")
+        uvicorn.run(
+            "app_fastapi:app",
+            host="0.0.0.0",
+            port=port,
+            workers=workers,
+            log_level="info",
+        )
+    else:
+        from app_fastapi import app
+
+        # Start the server
+        uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
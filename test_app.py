@@ -2,13 +2,84 @@
 Test file for NEXA Game Recommender FastAPI application
 """
 
+import asyncio
+import json
+import threading
+import time
+
 import pytest
 from fastapi.testclient import TestClient
+
+import app_fastapi
 from app_fastapi import app
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def fresh_title_index(monkeypatch, tmp_path):
+    """Keep titles resolved in one test from short-circuiting RAWG in the next"""
+    index = app_fastapi.TitleIndex(str(tmp_path / "titles.sqlite3"))
+    monkeypatch.setattr(app_fastapi, "title_index", index)
+    yield index
+    index.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstream_cache(monkeypatch, tmp_path):
+    """Keep cached upstream answers (including LLM title lists) inside one test"""
+    cache = app_fastapi.UpstreamCache(
+        str(tmp_path / "upstream.sqlite3"), 10**7, app_fastapi.UPSTREAM_CACHE_TTLS
+    )
+    monkeypatch.setattr(app_fastapi, "upstream_cache", cache)
+    yield cache
+    cache.close()
+
+
+async def _iter_lines(lines):
+    for line in lines:
+        yield line
+
+
+class FakeResponse:
+    def __init__(self, payload, status=200, lines=(), headers=None):
+        self.payload = payload
+        self.status = status
+        self.content = _iter_lines(lines)
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self, loads=None):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise Exception(f"HTTP {self.status}")
+
+
+class FakeSession:
+    """Stand-in for a pooled upstream session that records every call"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return FakeResponse(*self.handler(method, url, kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
 def test_root_endpoint():
     """Test the root endpoint"""
     response = client.get("/")
@@ -58,5 +129,1512 @@ def test_cors_headers():
     assert response.status_code in [200, 405]
 
 
+def test_http_sessions_are_pooled_per_provider():
+    """Test that upstream calls reuse one session per provider until shutdown"""
+
+    async def scenario():
+        rawg = app_fastapi.get_http_session("rawg")
+        assert app_fastapi.get_http_session("rawg") is rawg
+        assert app_fastapi.get_http_session("twitch") is not rawg
+        await app_fastapi.close_http_sessions()
+        assert rawg.closed
+        assert app_fastapi.get_http_session("rawg") is not rawg
+        await app_fastapi.close_http_sessions()
+
+    asyncio.run(scenario())
+
+
+def test_twitch_viewer_counts_are_batched(monkeypatch):
+    """Test that viewer counts for many games take one games and one streams call"""
+
+    def handler(method, url, kwargs):
+        params = kwargs["params"]
+        if url.endswith("/games"):
+            names = [v for k, v in params if k == "name"]
+            return ({"data": [{"id": str(i), "name": n} for i, n in enumerate(names)]},)
+        ids = [v for k, v in params if k == "game_id"]
+        return ({"data": [{"game_id": gid, "viewer_count": 5} for gid in ids]},)
+
+    tokens = app_fastapi.OAuthTokenManager()
+    tokens._tokens[
+        (
+            app_fastapi.TWITCH_TOKEN_URL,
+            app_fastapi.TWITCH_CLIENT_ID,
+            app_fastapi.TWITCH_CLIENT_SECRET,
+        )
+    ] = {"access_token": "token", "expires_at": time.time() + 3600}
+    session = FakeSession(handler)
+    monkeypatch.setattr(app_fastapi, "_twitch_game_ids", {})
+    monkeypatch.setattr(app_fastapi, "oauth_tokens", tokens)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+
+    names = [f"Game {i}" for i in range(18)]
+    counts = asyncio.run(app_fastapi.get_twitch_viewer_counts(names))
+    assert counts == {name: 5 for name in names}
+    assert len(session.calls) == 2
+
+    # Game ids are cached, so a repeat lookup only hits /streams
+    asyncio.run(app_fastapi.get_twitch_viewer_counts(names))
+    assert len(session.calls) == 3
+    assert session.calls[-1][1].endswith("/streams")
+
+
+def test_response_cache_is_bounded_by_bytes():
+    """Test LRU eviction by total size and hit/miss accounting"""
+    cache = app_fastapi.ResponseCache(max_bytes=100, ttl=60)
+    cache.set("a", "x" * 40)
+    cache.set("b", "y" * 40)
+    assert cache.get("a") == "x" * 40  # "a" becomes most recently used
+    cache.set("c", "z" * 40)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.total_bytes <= 100
+    assert cache.stats()["evictions"] == 1
+    assert cache.hits == 3 and cache.misses == 1
+
+    cache.set("huge", "w" * 500)  # larger than the whole cache, never stored
+    assert cache.get("huge") is None
+
+
+def test_recommendations_are_cached_and_resorted(monkeypatch):
+    """Test that a repeated query re-sorts the cached games without refetching"""
+    calls = []
+
+    async def fake_igdb(query, limit=5):
+        return []
+
+    async def fake_titles(preference, filters=None):
+        calls.append(preference)
+        for title in ["Old", "New"]:
+            yield title
+
+    async def fake_details(titles):
+        assert [title async for title in titles] == ["Old", "New"]
+        return [
+            {"title": "Old", "release_date": "01/01/2001", "rating": 4.5},
+            {"title": "New", "release_date": "01/01/2020", "rating": 3.0},
+        ]
+
+    monkeypatch.setattr(app_fastapi, "igdb_search_games", fake_igdb)
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: None)
+    monkeypatch.setattr(app_fastapi, "stream_game_titles_gpt4o", fake_titles)
+    monkeypatch.setattr(app_fastapi, "fetch_game_details", fake_details)
+    monkeypatch.setattr(
+        app_fastapi, "recommendation_cache", app_fastapi.ResponseCache(10**6, 60)
+    )
+
+    first = asyncio.run(
+        app_fastapi.get_recommendations("Cozy  Games", "release_date", {"genre": "RPG"})
+    )
+    second = asyncio.run(
+        app_fastapi.get_recommendations(
+            "cozy games", "rating", {"genre": "RPG", "year": ""}
+        )
+    )
+    assert len(calls) == 1
+    assert [g["title"] for g in first["games"]] == ["New", "Old"]
+    assert [g["title"] for g in second["games"]] == ["Old", "New"]
+    assert app_fastapi.recommendation_cache.hits == 1
+
+
+def test_upstream_cache_persists_and_evicts(tmp_path):
+    """Test the SQLite upstream cache: key normalization, TTL and size cap"""
+    path = str(tmp_path / "cache.sqlite3")
+    ttls = {"rawg:game": 60, "rawg:search": -1}
+    cache = app_fastapi.UpstreamCache(path, max_bytes=1000, ttls=ttls)
+
+    async def scenario():
+        await cache.set("rawg:game", {"path": "/games/1", "key": "secret"}, {"id": 1})
+        # The API key is not part of the cache key
+        assert await cache.get("rawg:game", {"path": "/games/1"}) == {"id": 1}
+        await cache.set("rawg:search", {"search": "x"}, {"results": []})
+        assert await cache.get("rawg:search", {"search": "x"}) is None  # expired
+
+        cache.close()
+        reopened = app_fastapi.UpstreamCache(path, max_bytes=1000, ttls=ttls)
+        assert await reopened.get("rawg:game", {"path": "/games/1"}) == {"id": 1}
+        for i in range(20):
+            await reopened.set("rawg:game", {"path": f"/games/{i}"}, {"pad": "x" * 90})
+        assert reopened._total_bytes <= 1000
+        assert await reopened.get("rawg:game", {"path": "/games/19"}) is not None
+        assert await reopened.get("rawg:game", {"path": "/games/0"}) is None
+        reopened.close()
+
+    asyncio.run(scenario())
+
+
+def test_rawg_get_serves_repeat_requests_from_cache(monkeypatch, tmp_path):
+    """Test that only the first identical RAWG request reaches the network"""
+    session = FakeSession(lambda method, url, kwargs: ({"results": [{"id": 7}]},))
+    cache = app_fastapi.UpstreamCache(
+        str(tmp_path / "cache.sqlite3"), 10**6, app_fastapi.UPSTREAM_CACHE_TTLS
+    )
+    quota = app_fastapi.RawgQuotaTracker(str(tmp_path / "rawg.json"), 100, 10)
+    monkeypatch.setattr(app_fastapi, "upstream_cache", cache)
+    monkeypatch.setattr(app_fastapi, "rawg_quota", quota)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "secret")
+
+    async def scenario():
+        for _ in range(2):
+            result = await app_fastapi.rawg_get(
+                "rawg:search", "/games", {"search": "Hades"}
+            )
+            assert result == {"results": [{"id": 7}]}
+
+    asyncio.run(scenario())
+    cache.close()
+    assert len(session.calls) == 1
+    assert session.calls[0][2]["params"]["key"] == "secret"
+    assert quota.total_requests == 1
+
+
+def test_rawg_get_returns_fresh_data_when_cache_write_fails(monkeypatch):
+    """Test that a locked cache database doesn't turn a RAWG answer into an error"""
+    session = FakeSession(lambda method, url, kwargs: ({"results": [{"id": 7}]},))
+
+    async def locked(endpoint, params, value):
+        raise app_fastapi.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(app_fastapi.upstream_cache, "set", locked)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "secret")
+
+    result = asyncio.run(
+        app_fastapi.rawg_get("rawg:search", "/games", {"search": "Locked"})
+    )
+    assert result == {"results": [{"id": 7}]}
+
+
+def test_rawg_quota_tracker_rollups_and_flush(tmp_path):
+    """Test incremental quota counters, bounded history and atomic saves"""
+    path = tmp_path / "rawg.json"
+    quota = app_fastapi.RawgQuotaTracker(str(path), limit=100, history_size=3)
+    for i in range(5):
+        quota.record(f"Game {i}")
+
+    stats = quota.stats()
+    assert stats["today"] == 5 and stats["month"] == 5
+    assert stats["remaining"] == 95 and stats["total_requests"] == 5
+    assert [h["title"] for h in quota.history] == ["Game 2", "Game 3", "Game 4"]
+
+    asyncio.run(quota.flush())
+    saved = json.loads(path.read_text())
+    assert saved["remaining"] == 95
+    assert len(saved["request_history"]) == 3
+
+    reloaded = app_fastapi.RawgQuotaTracker(str(path), limit=100, history_size=3)
+    reloaded.record("Game 5")
+    assert reloaded.stats()["today"] == 6
+    assert reloaded.remaining == 94
+
+
+def test_recommendations_stream_emits_games_as_they_resolve(monkeypatch):
+    """Test the NDJSON stream: explain first, one frame per game, sorted summary"""
+
+    async def fake_resolve(preference, filters, stream=False):
+        return ["Old", "New", "Missing"], "Because you asked"
+
+    async def fake_card(title):
+        if title == "Missing":
+            return None
+        year = "2001" if title == "Old" else "2020"
+        return {"title": title, "release_date": f"01/01/{year}", "twitch_viewers": 0}
+
+    async def fake_viewers(names):
+        return {name: 42 for name in names}
+
+    monkeypatch.setattr(app_fastapi, "check_environment", lambda: [])
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "secret")
+    monkeypatch.setattr(app_fastapi, "resolve_recommendation_titles", fake_resolve)
+    monkeypatch.setattr(app_fastapi, "fetch_game_card", fake_card)
+    monkeypatch.setattr(app_fastapi, "get_twitch_viewer_counts", fake_viewers)
+    monkeypatch.setattr(
+        app_fastapi, "recommendation_cache", app_fastapi.ResponseCache(10**6, 60)
+    )
+
+    response = client.post(
+        "/api/recommendations/stream", json={"preference": "streaming test"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    frames = [json.loads(line) for line in response.text.splitlines()]
+    assert [f["type"] for f in frames] == ["explain", "game", "game", "twitch", "done"]
+    assert frames[0]["explain"] == "Because you asked"
+    assert frames[3]["viewers"] == {"Old": 42, "New": 42}
+    assert [g["title"] for g in frames[-1]["games"]] == ["New", "Old"]
+    assert all(g["twitch_viewers"] == 42 for g in frames[-1]["games"])
+
+
+def test_gpt4o_titles_stream_into_rawg_lookups(monkeypatch):
+    """Test that RAWG lookups start while the completion is still streaming"""
+    chunks = ["1. Hades, Ce", "leste, - Dead", " Cells"]
+    lines = [
+        f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n".encode()
+        for c in chunks
+    ] + [b"data: [DONE]\n"]
+    session = FakeSession(lambda method, url, kwargs: (None, 200, lines))
+    looked_up = []
+
+    async def fake_card(title):
+        looked_up.append(title)
+        return {"title": title}
+
+    monkeypatch.setattr(app_fastapi, "get_openai_api_key", lambda: "sk-test")
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "fetch_game_card", fake_card)
+
+    async def scenario():
+        titles = app_fastapi.stream_game_titles_gpt4o("roguelikes")
+        return [game async for game in app_fastapi.iter_game_details(titles)]
+
+    games = asyncio.run(scenario())
+    assert session.calls[0][2]["json"]["stream"] is True
+    assert looked_up == ["Hades", "Celeste", "Dead Cells"]
+    assert sorted(g["title"] for g in games) == ["Celeste", "Dead Cells", "Hades"]
+
+
+def test_exact_match_probes_run_concurrently(monkeypatch):
+    """Test that a fast RAWG match wins without waiting for a slow IGDB probe"""
+    cancelled = []
+
+    async def slow_igdb(preference):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("igdb")
+            raise
+
+    async def fast_rawg(preference):
+        return "Hades II"
+
+    monkeypatch.setattr(app_fastapi, "igdb_exact_match", slow_igdb)
+    monkeypatch.setattr(app_fastapi, "rawg_exact_match", fast_rawg)
+
+    async def scenario():
+        started = time.monotonic()
+        title = await app_fastapi.find_exact_match("hades 2")
+        await asyncio.sleep(0)
+        return title, time.monotonic() - started
+
+    title, elapsed = asyncio.run(scenario())
+    assert title == "Hades II"
+    assert elapsed < 1
+    assert cancelled == ["igdb"]
+
+
+def test_generic_recommendations_start_speculatively(monkeypatch):
+    """Test that the generic GPT-4o call overlaps the probes and is cancelled on a match"""
+    events = []
+
+    async def fake_titles(preference, filters=None):
+        events.append(("start", preference))
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            events.append(("cancelled", preference))
+            raise
+        return ["Generic"]
+
+    def make_probe(result):
+        async def probe(preference):
+            events.append(("probe", preference))
+            await asyncio.sleep(0.01)
+            return result
+
+        return probe
+
+    monkeypatch.setattr(app_fastapi, "fetch_game_titles_gpt4o", fake_titles)
+    monkeypatch.setattr(app_fastapi, "igdb_exact_match", make_probe(None))
+
+    monkeypatch.setattr(app_fastapi, "rawg_exact_match", make_probe(None))
+    titles, _ = asyncio.run(app_fastapi.resolve_recommendation_titles("cozy", {}))
+    assert titles == ["Generic"]
+    assert events[0] == ("start", "cozy")
+
+    events.clear()
+    monkeypatch.setattr(app_fastapi, "rawg_exact_match", make_probe("Stardew Valley"))
+    titles, explain = asyncio.run(
+        app_fastapi.resolve_recommendation_titles("stardew", {})
+    )
+    assert ("cancelled", "stardew") in events
+    assert titles[0] == "Stardew Valley"
+    assert "Stardew Valley" in explain
+
+
+def test_game_details_use_carried_id_and_cache(monkeypatch):
+    """Test that a known RAWG id skips the search and repeat opens hit the cache"""
+    requested = []
+
+    async def fake_rawg_get(endpoint, path, params=None):
+        requested.append(path)
+        await asyncio.sleep(0.01)
+        if path.endswith("/screenshots"):
+            return {"results": [{"image": "shot.jpg"}]}
+        return {"id": 3328, "slug": "the-witcher-3-wild-hunt", "name": "The Witcher 3"}
+
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "secret")
+    monkeypatch.setattr(app_fastapi, "rawg_get", fake_rawg_get)
+    monkeypatch.setattr(
+        app_fastapi, "game_details_cache", app_fastapi.ResponseCache(10**6, 60)
+    )
+
+    details = asyncio.run(app_fastapi.get_game_details("Witcher 3", rawg_id=3328))
+    assert details["screenshots"] == ["shot.jpg"]
+    assert details["rawg_id"] == 3328
+    assert sorted(requested) == ["/games/3328", "/games/3328/screenshots"]
+
+    response = client.post(
+        "/api/game-details",
+        json={"title": "Witcher 3", "slug": "the-witcher-3-wild-hunt"},
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "The Witcher 3"
+    assert len(requested) == 2
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """Test that identical concurrent calls share one in-flight request"""
+    flights = app_fastapi.SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": 1}
+
+    async def titles():
+        calls.append(1)
+        for title in ["A", "B"]:
+            await asyncio.sleep(0.01)
+            yield title
+
+    async def read(key):
+        return [t async for t in flights.stream(key, titles)]
+
+    async def scenario():
+        results = await asyncio.gather(*(flights.do("k", fetch) for _ in range(5)))
+        assert all(r == {"value": 1} for r in results)
+        streams = await asyncio.gather(read("s"), read("s"), read("s"))
+        assert streams == [["A", "B"]] * 3
+        # A finished flight is forgotten, so the next call fetches again
+        await flights.do("k", fetch)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+    assert flights.shared == 6
+
+
+def test_token_refresh_does_not_stampede(monkeypatch):
+    """Test that concurrent callers with an expired token trigger one refresh"""
+
+    def handler(method, url, kwargs):
+        return ({"access_token": "fresh", "expires_in": 3600},)
+
+    session = FakeSession(handler)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "oauth_tokens", app_fastapi.OAuthTokenManager())
+
+    async def scenario():
+        return await asyncio.gather(
+            *(app_fastapi.get_twitch_token() for _ in range(10))
+        )
+
+    assert asyncio.run(scenario()) == ["fresh"] * 10
+    assert len(session.calls) == 1
+
+
+def test_identical_credentials_share_one_token(monkeypatch):
+    """Test that Twitch and IGDB with the same client share a token and refresh ahead"""
+    session = FakeSession(
+        lambda method, url, kwargs: ({"access_token": "t1", "expires_in": 3600},)
+    )
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    tokens = app_fastapi.OAuthTokenManager()
+    tokens.register("https://auth/token", "client", "secret")
+    tokens.register("https://auth/token", "client", "secret")
+    tokens.register("https://auth/token", None, None)  # unconfigured, ignored
+    assert len(tokens._credentials) == 1
+
+    async def scenario():
+        refresher = asyncio.create_task(tokens.run())
+        await asyncio.sleep(0.01)
+        refresher.cancel()
+        return await tokens.get_token("https://auth/token", "client", "secret")
+
+    # The background loop fetched the token, so the caller pays no round trip
+    assert asyncio.run(scenario()) == "t1"
+    assert len(session.calls) == 1
+
+
+def test_authorized_request_retries_once_on_401(monkeypatch):
+    """Test that a revoked token is dropped and the call retried with a fresh one"""
+    issued = iter(["stale", "fresh"])
+
+    def handler(method, url, kwargs):
+        if url == "https://auth/token":
+            return ({"access_token": next(issued), "expires_in": 3600},)
+        if kwargs["headers"]["Authorization"] == "Bearer stale":
+            return ({}, 401)
+        return ({"data": ["ok"]},)
+
+    session = FakeSession(handler)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "oauth_tokens", app_fastapi.OAuthTokenManager())
+
+    status, payload = asyncio.run(
+        app_fastapi.authorized_request(
+            "twitch",
+            "GET",
+            "https://api/games",
+            "https://auth/token",
+            "client",
+            "secret",
+        )
+    )
+    assert (status, payload) == (200, {"data": ["ok"]})
+    assert [call[1] for call in session.calls] == [
+        "https://auth/token",
+        "https://api/games",
+        "https://auth/token",
+        "https://api/games",
+    ]
+
+
+def test_sliding_window_rate_limit_headers_and_retry_after():
+    """Test per-route limits, rate limit headers and the weighted previous window"""
+    limiter = app_fastapi.RateLimiter(
+        app_fastapi.MemoryRateLimitBackend(),
+        {"details": 2, "autocomplete": 5},
+        window=60,
+    )
+    assert (
+        asyncio.run(limiter.check("details", "1.2.3.4"))[1]["X-RateLimit-Remaining"]
+        == "1"
+    )
+    assert asyncio.run(limiter.check("details", "1.2.3.4"))[0]
+    allowed, headers = asyncio.run(limiter.check("details", "1.2.3.4"))
+    assert not allowed and int(headers["Retry-After"]) >= 1
+    # Other routes and other clients have their own budgets
+    assert asyncio.run(limiter.check("autocomplete", "1.2.3.4"))[0]
+    assert asyncio.run(limiter.check("details", "5.6.7.8"))[0]
+
+    # Half way into the next window, half of the previous count still applies
+    counter = [0, 0, 0]
+    for _ in range(10):
+        app_fastapi.sliding_window_hit(counter, 10, 60, 30)
+    allowed, remaining, _, retry_after = app_fastapi.sliding_window_hit(
+        counter, 10, 60, 90
+    )
+    assert allowed and remaining == 4
+    for _ in range(4):
+        app_fastapi.sliding_window_hit(counter, 10, 60, 90)
+    allowed, _, _, retry_after = app_fastapi.sliding_window_hit(counter, 10, 60, 90)
+    assert not allowed and 0 < retry_after <= 30
+
+
+def test_stage_timings_reach_server_timing_and_metrics(monkeypatch):
+    """Test that pipeline stages show up in Server-Timing and /metrics"""
+
+    async def fake_rawg_get(endpoint, path, params=None):
+        app_fastapi.record_upstream_call("rawg", 200, 0.01)
+        if path.endswith("/screenshots"):
+            return {"results": []}
+        if path == "/games":
+            return {"results": [{"id": 7, "name": "Tunic"}]}
+        return {"id": 7, "slug": "tunic", "name": "Tunic"}
+
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "secret")
+    monkeypatch.setattr(app_fastapi, "rawg_get", fake_rawg_get)
+    monkeypatch.setattr(
+        app_fastapi, "game_details_cache", app_fastapi.ResponseCache(10**6, 60)
+    )
+
+    response = client.post("/api/game-details", json={"title": "Tunic"})
+    assert response.status_code == 200
+    stages = [
+        entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")
+    ]
+    assert stages == ["rawg_search", "rawg_details", "total"]
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    body = metrics.text
+    assert 'nexa_stage_duration_seconds_count{stage="rawg_details"}' in body
+    assert (
+        'nexa_request_duration_seconds_bucket{route="/api/game-details",le="+Inf"}'
+        in body
+    )
+    assert 'nexa_upstream_requests_total{provider="rawg",status="200"}' in body
+    assert 'nexa_cache_hit_ratio{cache="game_details"}' in body
+
+
+def test_request_logs_are_json_and_carry_request_id(monkeypatch):
+    """Test that logs inside a request carry its id and a completion record is written"""
+    records = []
+
+    class Capture(app_fastapi.logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    async def fake_details(title, rawg_id=None, slug=None):
+        app_fastapi.logger.warning("RAWG lookup dropped", extra={"title": title})
+        return {"title": title}
+
+    monkeypatch.setattr(app_fastapi, "get_game_details", fake_details)
+    capture = Capture()
+    app_fastapi.logger.addHandler(capture)
+    try:
+        response = client.post(
+            "/api/game-details",
+            json={"title": "Hades"},
+            headers={"X-Request-ID": "req-42"},
+        )
+    finally:
+        app_fastapi.logger.removeHandler(capture)
+
+    assert response.headers["X-Request-ID"] == "req-42"
+    inside, completed = records
+    assert inside.request_id == completed.request_id == "req-42"
+    entry = json.loads(app_fastapi.JsonLogFormatter().format(completed))
+    assert entry["message"] == "Request completed"
+    assert entry["route"] == "/api/game-details" and entry["status"] == 200
+    assert entry["request_id"] == "req-42" and "duration_ms" in entry
+
+
+@pytest.mark.parametrize("fast_json", [False, True])
+def test_sparse_fieldsets_and_fast_json(monkeypatch, fast_json):
+    """Test fields= trims payloads, with either JSON encoder"""
+    if fast_json:
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(app_fastapi, "use_orjson", fast_json)
+    card = {"title": "Hades", "rawg_id": 1, "rating": 4.6, "platforms": "PC"}
+
+    async def fake_details(title, rawg_id=None, slug=None):
+        return {**card, "description": "x" * 1000, "screenshots": ["a.jpg"]}
+
+    async def fake_recommendations(preference, sort_by="release_date", filters=None):
+        return {"games": [card, {**card, "title": "Tunic"}], "explain": "Because"}
+
+    monkeypatch.setattr(app_fastapi, "get_game_details", fake_details)
+    monkeypatch.setattr(app_fastapi, "get_recommendations", fake_recommendations)
+    monkeypatch.setattr(app_fastapi, "check_environment", lambda: [])
+
+    details = client.post(
+        "/api/game-details?fields=title,rating", json={"title": "Hades"}
+    )
+    assert details.json() == {"title": "Hades", "rating": 4.6}
+    assert (
+        "description"
+        in client.post("/api/game-details", json={"title": "Hades"}).json()
+    )
+
+    result = client.post(
+        "/api/recommendations?fields=title", json={"preference": "roguelikes"}
+    ).json()
+    assert result == {
+        "games": [{"title": "Hades"}, {"title": "Tunic"}],
+        "explain": "Because",
+    }
+    assert app_fastapi.json_loads(app_fastapi.json_dumps({"é": [1, None]})) == {
+        "é": [1, None]
+    }
+
+
+def test_rate_limit_backend_evicts_idle_clients():
+    """Test that idle clients are dropped and the key count stays bounded"""
+    backend = app_fastapi.MemoryRateLimitBackend(max_keys=3)
+    for i in range(5):
+        backend.hit(f"ip{i}", 10, 60, 0)
+    assert len(backend) == 3
+    backend.hit("late", 10, 60, 200)  # everyone else has been idle for two windows
+    assert len(backend) == 1
+
+
+def test_rate_limited_endpoint_returns_429_with_headers(monkeypatch):
+    """Test that the middleware rejects over-limit clients with Retry-After"""
+    limiter = app_fastapi.RateLimiter(
+        app_fastapi.MemoryRateLimitBackend(),
+        {"details": 1, "autocomplete": 1, "recommendations": 1},
+    )
+    monkeypatch.setattr(app_fastapi, "rate_limiter", limiter)
+
+    async def fake_details(title, rawg_id=None, slug=None):
+        return {"title": title}
+
+    monkeypatch.setattr(app_fastapi, "get_game_details", fake_details)
+    first = client.post("/api/game-details", json={"title": "Hades"})
+    assert first.status_code == 200 and first.headers["X-RateLimit-Remaining"] == "0"
+    second = client.post("/api/game-details", json={"title": "Hades"})
+    assert second.status_code == 429
+    assert "Retry-After" in second.headers
+    assert client.get("/health").status_code == 200  # unlisted paths are not limited
+
+
+def test_shared_state_rate_limits_span_workers(tmp_path):
+    """Test that two workers on the same state file share one rate limit budget"""
+    path = str(tmp_path / "state.sqlite3")
+    workers = [
+        app_fastapi.RateLimiter(
+            app_fastapi.SqliteRateLimitBackend(app_fastapi.SharedStateStore(path)),
+            {"details": 3},
+        )
+        for _ in range(2)
+    ]
+    results = [
+        asyncio.run(workers[i % 2].check("details", "1.2.3.4"))[0] for i in range(4)
+    ]
+    assert results == [True, True, True, False]
+
+
+def test_shared_state_rate_limit_runs_off_the_event_loop(tmp_path, monkeypatch):
+    """Test that SQLite rate limit writes never block the event loop thread"""
+    backend = app_fastapi.SqliteRateLimitBackend(
+        app_fastapi.SharedStateStore(str(tmp_path / "state.sqlite3"))
+    )
+    hit_threads = []
+    hit = backend.hit
+
+    def recording_hit(*args):
+        hit_threads.append(threading.get_ident())
+        return hit(*args)
+
+    monkeypatch.setattr(backend, "hit", recording_hit)
+    limiter = app_fastapi.RateLimiter(backend, {"details": 3})
+
+    async def scenario():
+        await limiter.check("details", "1.2.3.4")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(hit_threads) == 1 and hit_threads[0] != loop_thread
+
+
+def test_shared_state_token_fetched_once_across_workers(tmp_path, monkeypatch):
+    """Test that a second worker adopts the token fetched by the first"""
+    session = FakeSession(
+        lambda method, url, kwargs: ({"access_token": "shared", "expires_in": 3600},)
+    )
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    path = str(tmp_path / "state.sqlite3")
+    first = app_fastapi.OAuthTokenManager(store=app_fastapi.SharedStateStore(path))
+    second = app_fastapi.OAuthTokenManager(store=app_fastapi.SharedStateStore(path))
+
+    assert (
+        asyncio.run(first.get_token("https://auth/token", "client", "secret"))
+        == "shared"
+    )
+    assert (
+        asyncio.run(second.get_token("https://auth/token", "client", "secret"))
+        == "shared"
+    )
+    assert len(session.calls) == 1
+
+    # A 401 in one worker must not leave the revoked token for the others
+    asyncio.run(second.invalidate("https://auth/token", "client", "secret", "shared"))
+    assert first._load_shared(("https://auth/token", "client", "secret")) is None
+
+
+def test_shared_rawg_quota_merges_worker_counts(tmp_path):
+    """Test that concurrent workers add to the shared RAWG quota instead of overwriting"""
+    legacy = tmp_path / "rawg_requests.json"
+    legacy.write_text(
+        json.dumps(
+            {
+                "remaining": 19985,
+                "total_requests": 15,
+                "reset_time": "2999-01-01T00:00:00",
+                "daily_stats": {"2000-01-01": 10},
+                "request_history": [],
+            }
+        )
+    )
+    path = str(tmp_path / "state.sqlite3")
+    workers = [
+        app_fastapi.SharedRawgQuotaTracker(
+            app_fastapi.SharedStateStore(path), str(legacy), 20000, 5
+        )
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.load()
+    # Requests the file counted outside its daily stats still count
+    plain = app_fastapi.RawgQuotaTracker(str(legacy), 20000, 5)
+    plain.load()
+    assert workers[0].total_requests == plain.total_requests == 15
+    assert workers[0].remaining == plain.remaining == 19985
+    for i in range(3):
+        workers[0].record(f"a{i}")
+        workers[1].record(f"b{i}")
+
+    async def flush_all():
+        for worker in workers:
+            await worker.flush()
+        await workers[0].flush()
+
+    asyncio.run(flush_all())
+    for worker in workers:
+        assert worker.total_requests == 21 and worker.remaining == 19979
+        assert len(worker.history) == 5
+
+
+def test_autocomplete_index_prefix_fuzzy_and_popularity():
+    """Test word-start prefixes, popularity ranking and typo-tolerant matches"""
+    index = app_fastapi.AutocompleteIndex()
+    index.add("The Legend of Zelda: Breath of the Wild", "zelda-botw", rating_count=500)
+    index.add("Zelda II: The Adventure of Link", "zelda-2", rating_count=50)
+    index.add("Zeus: Master of Olympus", "zeus", rating_count=10)
+
+    assert [r["slug"] for r in index.search("zel")] == ["zelda-botw", "zelda-2"]
+    assert index.search("breath")[0]["slug"] == "zelda-botw"
+    index.add("Zelda II: The Adventure of Link", boost=1000)
+    assert index.search("zel")[0]["slug"] == "zelda-2"
+    # A misspelling has no prefix match but is still found through trigrams
+    assert index.search("zeus mastr of olympus")[0]["slug"] == "zeus"
+
+
+def test_autocomplete_rating_count_is_not_summed_across_igdb_responses():
+    """Test that a game returned for many prefixes keeps its own rating count"""
+    index = app_fastapi.AutocompleteIndex()
+    hades = {"name": "Hades", "slug": "hades", "total_rating_count": 100}
+    for _ in ("ha", "had", "hade", "hades"):
+        index.add_igdb_results([hades])
+    index.add_igdb_results(
+        [{"name": "Half-Life", "slug": "hl", "total_rating_count": 300}]
+    )
+    assert index.search("ha")[0]["slug"] == "hl"
+    index.add("Hades", boost=app_fastapi.AUTOCOMPLETE_SEEN_BOOST)
+    assert (
+        index._titles["hades"]["popularity"]
+        == 100 + app_fastapi.AUTOCOMPLETE_SEEN_BOOST
+    )
+
+
+def test_autocomplete_full_index_evicts_least_popular_titles(monkeypatch):
+    """Test that new titles displace the least popular ones and stale prefixes expire"""
+    index = app_fastapi.AutocompleteIndex(max_titles=3)
+    index.add("Hades", "hades", rating_count=100)
+    index.add("Half-Life", "hl", rating_count=300)
+    index.add("Halo", "halo", rating_count=5)
+    index.mark_fetched("hal", 2)
+    assert index.is_warm("halo")
+
+    assert index.add_igdb_results([{"name": "Hollow Knight", "slug": "hk"}]) == 1
+    assert len(index) == 3 and "halo" not in index._titles
+    assert [r["slug"] for r in index.search("h")] == ["hl", "hades", "hk"]
+    assert index.search("halo")[0]["slug"] != "halo"
+    # "hal" found Halo, so it no longer counts as covering "halo"
+    assert not index.is_warm("halo")
+
+    index.mark_fetched("hol", 1)
+    assert index.is_warm("holl")
+    monkeypatch.setattr(app_fastapi, "AUTOCOMPLETE_FETCHED_TTL", -1)
+    assert not index.is_warm("holl")
+
+
+def test_autocomplete_only_queries_igdb_for_cold_prefixes(monkeypatch):
+    """Test that IGDB is asked once per cold prefix and warm prefixes stay local"""
+    calls = []
+
+    async def fake_igdb(query, limit=5):
+        calls.append(query)
+        return [
+            {
+                "name": "Hades",
+                "slug": "hades",
+                "cover": {"url": "//c/hades.jpg"},
+                "total_rating_count": 900,
+            }
+        ]
+
+    monkeypatch.setattr(app_fastapi, "igdb_search_games", fake_igdb)
+    monkeypatch.setattr(
+        app_fastapi, "autocomplete_index", app_fastapi.AutocompleteIndex()
+    )
+
+    first = client.get("/api/igdb-autocomplete", params={"q": "had"}).json()
+    assert first == [{"name": "Hades", "slug": "hades", "cover": "//c/hades.jpg"}]
+    # "had" returned less than a full page, so longer prefixes are answered locally
+    assert client.get("/api/igdb-autocomplete", params={"q": "hade"}).json() == first
+    assert client.get("/api/igdb-autocomplete", params={"q": "had"}).json() == first
+    assert calls == ["had"]
+
+
+def test_parse_autocomplete_message_forms():
+    """Test object, JSON string and plain text socket frames"""
+    parse = app_fastapi.parse_autocomplete_message
+    assert parse('{"id": 3, "q": " zelda "}') == (3, "zelda")
+    assert parse('"zelda"') == (None, "zelda")
+    assert parse("zelda") == (None, "zelda")
+    assert parse("1999") == (None, "1999")
+
+
+def test_autocomplete_socket_cancels_stale_queries(monkeypatch):
+    """Test that a newer keystroke cancels the older lookup and only the latest is answered"""
+    events = []
+    started = threading.Event()
+
+    async def fake_igdb(query, limit=5):
+        if query == "ha":
+            started.set()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                events.append("cancelled ha")
+                raise
+        events.append(f"answered {query}")
+        return [{"name": "Hades", "slug": "hades", "cover": {}}]
+
+    monkeypatch.setattr(app_fastapi, "igdb_search_games", fake_igdb)
+    monkeypatch.setattr(
+        app_fastapi, "autocomplete_index", app_fastapi.AutocompleteIndex()
+    )
+
+    with client.websocket_connect("/api/igdb-autocomplete/ws") as ws:
+        ws.send_text(json.dumps({"id": 1, "q": "ha"}))
+        assert started.wait(5)  # the stale lookup is in flight upstream
+        ws.send_text(json.dumps({"id": 2, "q": "had"}))
+        message = ws.receive_json()
+        assert message["id"] == 2 and message["results"][0]["slug"] == "hades"
+        ws.send_text("")  # bare (empty) queries are answered immediately
+        assert ws.receive_json()["results"] == []
+    assert events == ["cancelled ha", "answered had"]
+
+
+def test_normalize_game_title_folds_spellings():
+    """Test case, punctuation, leading article, accents and roman numeral folding"""
+    normalize = app_fastapi.normalize_game_title
+    assert normalize("The Witcher III: Wild Hunt") == normalize("witcher 3 - wild hunt")
+    assert normalize("Pokémon Red & Blue") == "pokemon red and blue"
+    assert normalize("Grand Theft Auto IV") == "grand theft auto 4"
+    # Single-letter numerals stay letters: these are different games
+    assert normalize("Mega Man X") != normalize("Mega Man 10")
+
+
+def test_known_titles_resolve_without_network_and_dedupe_by_id(
+    monkeypatch, fresh_title_index
+):
+    """Test that spellings of one game share one RAWG search and one card"""
+
+    def handler(method, url, kwargs):
+        return (
+            {
+                "results": [
+                    {
+                        "id": 3328,
+                        "name": "The Witcher 3: Wild Hunt",
+                        "slug": "the-witcher-3-wild-hunt",
+                    }
+                ]
+            },
+        )
+
+    async def no_twitch(games):
+        return None
+
+    session = FakeSession(handler)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "key")
+    monkeypatch.setattr(app_fastapi, "add_twitch_viewers", no_twitch)
+    monkeypatch.setattr(
+        app_fastapi,
+        "upstream_cache",
+        app_fastapi.UpstreamCache(":memory:", 10**6, app_fastapi.UPSTREAM_CACHE_TTLS),
+    )
+    monkeypatch.setattr(
+        app_fastapi,
+        "rawg_quota",
+        app_fastapi.RawgQuotaTracker("/nonexistent/quota.json", 20000, 10),
+    )
+
+    games = asyncio.run(app_fastapi.fetch_game_details(["The Witcher 3: Wild Hunt"]))
+    assert [g["rawg_id"] for g in games] == [3328]
+    assert len(session.calls) == 1
+
+    # Other spellings now resolve locally, and collapse to one card
+    games = asyncio.run(
+        app_fastapi.fetch_game_details(
+            ["Witcher 3 - Wild Hunt", "the witcher III: wild hunt"]
+        )
+    )
+    assert [g["rawg_id"] for g in games] == [3328]
+    assert len(session.calls) == 1
+
+    # A spelling that was searched becomes an alias of the game it found
+    asyncio.run(app_fastapi.fetch_game_details(["Witcher 3"]))
+    assert len(session.calls) == 2
+    asyncio.run(app_fastapi.fetch_game_details(["Witcher 3"]))
+    assert len(session.calls) == 2
+
+    # Aliases survive a restart
+    reloaded = app_fastapi.TitleIndex(fresh_title_index.path)
+    reloaded.load()
+    assert reloaded.resolve("WITCHER 3")["slug"] == "the-witcher-3-wild-hunt"
+    reloaded.close()
+
+
+def test_bare_main_title_is_not_an_alias_of_an_edition(fresh_title_index):
+    """Test that a subtitled card doesn't claim its bare main title"""
+    card = {
+        "rawg_id": 1,
+        "title": "Resident Evil Village: Gold Edition",
+        "slug": "re-village-gold",
+    }
+    asyncio.run(fresh_title_index.remember("Resident Evil Village Gold Edition", card))
+    assert (
+        fresh_title_index.resolve("resident evil village: gold edition")["rawg_id"] == 1
+    )
+    assert fresh_title_index.resolve("Resident Evil") is None
+
+
+def test_malformed_rawg_body_does_not_hang_game_details(monkeypatch):
+    """Test that a lookup failing on a malformed RAWG body is dropped, not awaited forever"""
+
+    async def malformed_rawg_get(endpoint, path, params):
+        if params["search"] == "Broken":
+            return {"count": 0}
+        return {"results": [{"id": 7, "name": "Fine", "slug": "fine"}]}
+
+    async def no_twitch(games):
+        return None
+
+    monkeypatch.setattr(app_fastapi, "get_rawg_api_key", lambda: "key")
+    monkeypatch.setattr(app_fastapi, "rawg_get", malformed_rawg_get)
+    monkeypatch.setattr(app_fastapi, "add_twitch_viewers", no_twitch)
+    monkeypatch.setattr(app_fastapi, "dropped_results", app_fastapi.Counter())
+
+    games = asyncio.run(
+        asyncio.wait_for(app_fastapi.fetch_game_details(["Broken", "Fine"]), timeout=5)
+    )
+    assert [g["rawg_id"] for g in games] == [7]
+    assert app_fastapi.dropped_results["game_card"] == 1
+
+
+def test_adaptive_limiter_caps_in_flight_and_backs_off():
+    """Test that the limiter queues requests beyond its limit and halves on overload"""
+    limiter = app_fastapi.AdaptiveConcurrencyLimiter(2, 1, 2, target_latency=10)
+    peak = []
+
+    async def call():
+        await limiter.acquire()
+        peak.append(limiter.in_flight)
+        await asyncio.sleep(0.01)
+        limiter.release(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert max(peak) == 2 and limiter.in_flight == 0
+
+    limiter.in_flight = 1
+    limiter.release(0.01, overloaded=True)
+    assert limiter.limit == 1
+
+
+def test_upstream_request_retries_gets_and_honors_retry_after(monkeypatch):
+    """Test jittered retries for GETs, Retry-After as the minimum wait and no retry for POSTs"""
+    responses = iter([({}, 429, (), {"Retry-After": "0.05"}), ({"ok": True},)])
+    session = FakeSession(
+        lambda method, url, kwargs: next(responses) if method == "GET" else ({}, 503)
+    )
+    delays = []
+
+    def fake_delay(attempt, retry_after=None):
+        delays.append(retry_after)
+        return 0
+
+    limiter = app_fastapi.AdaptiveConcurrencyLimiter(8, 1, 32, target_latency=10)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    monkeypatch.setattr(app_fastapi, "upstream_limiters", {"rawg": limiter})
+    monkeypatch.setattr(app_fastapi, "retry_delay", fake_delay)
+
+    result = asyncio.run(
+        app_fastapi.upstream_request("rawg", "GET", "https://rawg/games")
+    )
+    assert result == (200, {"ok": True})
+    assert delays == [0.05]
+    assert (
+        limiter.limit < 5
+        and limiter.stats["throttled"] == 1
+        and limiter.stats["retries"] == 1
+    )
+
+    assert asyncio.run(
+        app_fastapi.upstream_request("rawg", "POST", "https://rawg/games")
+    ) == (503, None)
+    assert len(session.calls) == 3
+    assert app_fastapi.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+class FakeLLM(app_fastapi.LLMProvider):
+    """Provider that answers after a delay, or fails"""
+
+    def __init__(self, name, delay, text="Hades, Celeste", fail=False):
+        super().__init__()
+        self.name = self.label = name
+        self.delay, self.text, self.fail = delay, text, fail
+        self.calls = 0
+        self.cancelled = 0
+
+    def api_key(self):
+        return "key"
+
+    def request(self, messages, stream=False):
+        return "http://llm.invalid", {}, {"messages": messages, "stream": stream}
+
+    def text_from_result(self, result):
+        return self.text
+
+    def text_from_event(self, event):
+        return event
+
+    async def _wait(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise Exception(f"{self.name} is down")
+
+    async def complete(self, messages):
+        await self._wait()
+        return self.text
+
+    async def stream(self, messages):
+        await self._wait()
+        for chunk in self.text.split(" "):
+            yield chunk + " "
+
+
+def test_llm_provider_missing_a_method_fails_on_creation():
+    """Test that an incomplete provider can't be created"""
+
+    class NoEvents(app_fastapi.LLMProvider):
+        def api_key(self):
+            return "key"
+
+        def request(self, messages, stream=False):
+            return "http://llm.invalid", {}, {}
+
+        def text_from_result(self, result):
+            return ""
+
+    with pytest.raises(TypeError, match="text_from_event"):
+        NoEvents()
+
+
+def test_llm_hedge_races_second_provider_when_first_is_slow(monkeypatch):
+    """Test that a slow primary is raced by the fallback provider and then cancelled"""
+    slow, fast = FakeLLM("openai", 5), FakeLLM(
+        "anthropic", 0.01, "Hollow Knight, Celeste"
+    )
+    monkeypatch.setattr(app_fastapi, "llm_providers", [slow, fast])
+    monkeypatch.setattr(app_fastapi, "LLM_HEDGE_DELAY", 0.05)
+
+    assert asyncio.run(app_fastapi.fetch_game_titles_gpt4o("metroidvanias")) == [
+        "Hollow Knight",
+        "Celeste",
+    ]
+
+    async def streamed():
+        return [
+            t
+            async for t in app_fastapi.stream_game_titles_gpt4o(
+                "metroidvanias on switch"
+            )
+        ]
+
+    assert asyncio.run(streamed()) == ["Hollow Knight", "Celeste"]
+    assert slow.calls == 2 and slow.cancelled == 2
+
+
+def test_llm_circuit_breaker_routes_around_failing_provider(monkeypatch):
+    """Test that repeated failures open the circuit and skip the provider"""
+    broken, backup = FakeLLM("openai", 0, fail=True), FakeLLM("anthropic", 0)
+    monkeypatch.setattr(app_fastapi, "llm_providers", [broken, backup])
+
+    for i in range(5):
+        assert asyncio.run(
+            app_fastapi.hedged_titles([{"role": "user", "content": str(i)}])
+        ) == ["Hades", "Celeste"]
+    assert broken.calls == app_fastapi.LLM_BREAKER_FAILURES
+    assert broken.breaker.state == "open" and backup.calls == 5
+
+    broken.breaker.opened_at -= (
+        app_fastapi.LLM_BREAKER_RESET
+    )  # trial request allowed again
+    broken.fail = False
+    assert asyncio.run(
+        app_fastapi.hedged_titles([{"role": "user", "content": "x"}])
+    ) == ["Hades", "Celeste"]
+    assert broken.breaker.state == "closed"
+
+
+def test_half_open_trial_is_kept_for_a_provider_that_is_not_started(monkeypatch):
+    """Test that listing providers doesn't spend the half-open trial of an unused fallback"""
+    primary, fallback = FakeLLM("openai", 0), FakeLLM("anthropic", 0)
+    fallback.breaker.opened_at = time.monotonic() - app_fastapi.LLM_BREAKER_RESET
+    monkeypatch.setattr(app_fastapi, "llm_providers", [primary, fallback])
+
+    assert asyncio.run(
+        app_fastapi.hedged_titles([{"role": "user", "content": "x"}])
+    ) == ["Hades", "Celeste"]
+
+    async def streamed():
+        return [
+            t
+            async for t in app_fastapi.hedged_title_stream(
+                [{"role": "user", "content": "y"}]
+            )
+        ]
+
+    assert asyncio.run(streamed()) == ["Hades", "Celeste"]
+    assert fallback.calls == 0 and fallback.breaker.state == "half-open"
+
+
+def test_llm_titles_survive_a_failed_cache_write(monkeypatch):
+    """Test that a locked cache database doesn't turn a paid LLM answer into an error"""
+
+    async def locked(endpoint, params, value):
+        raise app_fastapi.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(app_fastapi.upstream_cache, "set", locked)
+    monkeypatch.setattr(app_fastapi, "llm_providers", [FakeLLM("openai", 0)])
+
+    titles = asyncio.run(app_fastapi.fetch_game_titles_gpt4o("roguelikes"))
+    assert titles == ["Hades", "Celeste"]
+
+    async def streamed():
+        return [t async for t in app_fastapi.stream_game_titles_gpt4o("metroidvanias")]
+
+    assert asyncio.run(streamed()) == ["Hades", "Celeste"]
+
+
+def test_anthropic_provider_request_and_stream_events(monkeypatch):
+    """Test the Messages API request shape and text delta parsing"""
+    monkeypatch.setattr(app_fastapi, "get_claude_api_key", lambda: "claude-key")
+    provider = app_fastapi.AnthropicProvider()
+    url, headers, data = provider.request(
+        [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "roguelikes"},
+        ],
+        stream=True,
+    )
+    assert (
+        url == app_fastapi.ANTHROPIC_MESSAGES_URL
+        and headers["x-api-key"] == "claude-key"
+    )
+    assert data["system"] == "be brief" and data["messages"] == [
+        {"role": "user", "content": "roguelikes"}
+    ]
+    assert data["stream"] is True
+    assert (
+        provider.text_from_event(
+            {
+                "type": "content_block_delta",
+                "delta": {"type": "text_delta", "text": "Hades"},
+            }
+        )
+        == "Hades"
+    )
+    assert provider.text_from_event({"type": "message_start"}) is None
+
+
+def test_llm_titles_are_cached_under_canonical_request(monkeypatch):
+    """Test that spelling, punctuation, stopwords and filter order share one LLM call"""
+    llm = FakeLLM("openai", 0, "Dead Cells, Hollow Knight")
+    monkeypatch.setattr(app_fastapi, "llm_providers", [llm])
+
+    first = asyncio.run(
+        app_fastapi.fetch_game_titles_gpt4o(
+            "Games like Hades!", {"genre": "Action", "platform": "PC"}
+        )
+    )
+    again = asyncio.run(
+        app_fastapi.fetch_game_titles_gpt4o(
+            "  games   like hades", {"platform": "pc", "genre": "action"}
+        )
+    )
+
+    async def streamed():
+        return [
+            t
+            async for t in app_fastapi.stream_game_titles_gpt4o(
+                "I want some games like Hades", {"genre": "action", "platform": "PC"}
+            )
+        ]
+
+    assert first == again == asyncio.run(streamed()) == ["Dead Cells", "Hollow Knight"]
+    assert llm.calls == 1
+    assert app_fastapi.canonical_preference("Give me games like Hades!") == "like hades"
+
+    # Different intent is a different entry
+    asyncio.run(
+        app_fastapi.fetch_game_titles_gpt4o("games like hades", {"genre": "puzzle"})
+    )
+    assert llm.calls == 2
+
+
+def test_prewarmer_refreshes_popular_queries_within_rawg_budget(monkeypatch, tmp_path):
+    """Test top-N plus seeds ordering, the RAWG budget share and state persistence"""
+    quota = app_fastapi.RawgQuotaTracker(str(tmp_path / "quota.json"), 20000, 10)
+    quota.load()
+    warmed = []
+
+    async def fake_recommendations(
+        preference, sort_by="release_date", filters=None, refresh=False
+    ):
+        assert refresh is True
+        warmed.append(preference)
+        for _ in range(18):
+            quota.record(preference)
+        return {"games": [], "explain": ""}
+
+    monkeypatch.setattr(app_fastapi, "rawg_quota", quota)
+    monkeypatch.setattr(app_fastapi, "get_recommendations", fake_recommendations)
+    monkeypatch.setattr(app_fastapi, "PREWARM_QUERY_SPACING", 0)
+    monkeypatch.setattr(
+        app_fastapi, "recommendation_cache", app_fastapi.ResponseCache(10**6, 3600)
+    )
+
+    # 40 RAWG requests of budget: two queries fit, the third would not
+    prewarmer = app_fastapi.QueryPrewarmer(
+        top_n=2, budget_share=40 / 20000, hours="", seeds=["cozy farming"]
+    )
+    for preference, times in [("roguelikes", 3), ("soulslike", 5), ("puzzle", 1)]:
+        for _ in range(times):
+            key = app_fastapi.recommendation_cache_key(preference, {})
+            prewarmer.record(key, preference, {})
+
+    assert prewarmer.top_queries() == [
+        ("soulslike", {}),
+        ("roguelikes", {}),
+        ("cozy farming", {}),
+    ]
+    assert asyncio.run(prewarmer.warm_once()) == 2
+    assert warmed == ["soulslike", "roguelikes"]
+    assert prewarmer.rawg_used == 36 and prewarmer.stats["budget_stops"] == 1
+
+    restored = app_fastapi.QueryPrewarmer(top_n=2, hours="")
+    asyncio.run(restored.load())
+    assert restored.rawg_used == 36 and restored.top_queries()[0] == ("soulslike", {})
+
+
+def test_prewarmers_share_counts_budget_and_pass_lease(monkeypatch, tmp_path):
+    """Test that workers pool query counts and one RAWG budget, and take turns"""
+    quota = app_fastapi.RawgQuotaTracker(str(tmp_path / "quota.json"), 20000, 10)
+    quota.load()
+    warmed = []
+
+    async def fake_recommendations(
+        preference, sort_by="release_date", filters=None, refresh=False
+    ):
+        warmed.append(preference)
+        for _ in range(18):
+            quota.record(preference)
+        return {"games": [], "explain": ""}
+
+    monkeypatch.setattr(app_fastapi, "rawg_quota", quota)
+    monkeypatch.setattr(app_fastapi, "get_recommendations", fake_recommendations)
+    monkeypatch.setattr(app_fastapi, "PREWARM_QUERY_SPACING", 0)
+    monkeypatch.setattr(
+        app_fastapi, "recommendation_cache", app_fastapi.ResponseCache(10**6, 3600)
+    )
+    path = str(tmp_path / "state.sqlite3")
+    workers = [
+        app_fastapi.QueryPrewarmer(
+            top_n=2,
+            budget_share=40 / 20000,
+            hours="",
+            seeds=[],
+            store=app_fastapi.SharedStateStore(path),
+        )
+        for _ in range(2)
+    ]
+    # Each worker alone saw roguelikes most, but together soulslike leads
+    for worker, counts in zip(
+        workers, [{"roguelikes": 3, "soulslike": 2}, {"soulslike": 2, "puzzle": 1}]
+    ):
+        for preference, times in counts.items():
+            for _ in range(times):
+                key = app_fastapi.recommendation_cache_key(preference, {})
+                worker.record(key, preference, {})
+    for worker in workers:
+        asyncio.run(worker.save())
+    asyncio.run(workers[0].save())
+    assert workers[0].top_queries() == [("soulslike", {}), ("roguelikes", {})]
+
+    assert asyncio.run(workers[0]._claim_pass())
+    assert not asyncio.run(workers[1]._claim_pass())
+    assert asyncio.run(workers[0].warm_once()) == 2
+    # The budget used by the first worker is spent for the second one too
+    assert not asyncio.run(workers[1]._budget_left())
+    assert workers[1].rawg_used == 36 and warmed == ["soulslike", "roguelikes"]
+    # Counts were aged once, by the pass
+    asyncio.run(workers[1].save())
+    assert (
+        workers[1].counts[app_fastapi.recommendation_cache_key("soulslike", {})][0] == 2
+    )
+
+
+def test_prewarmer_off_peak_windows():
+    """Test hour windows, including one that wraps past midnight"""
+    prewarmer = app_fastapi.QueryPrewarmer(hours="2-6,22-1")
+    assert [h for h in range(24) if prewarmer.in_window(h)] == [0, 2, 3, 4, 5, 22, 23]
+    assert app_fastapi.QueryPrewarmer(hours="").in_window(12)
+
+
+def test_twitch_aggregator_serves_counts_without_request_time_calls(monkeypatch):
+    """Test full stream pagination in the background and map reads on the request path"""
+    pages = {
+        None: {
+            "data": [
+                {"game_id": "1", "viewer_count": 900},
+                {"game_id": "2", "viewer_count": 50},
+            ],
+            "pagination": {"cursor": "p2"},
+        },
+        "p2": {
+            "data": [
+                {"game_id": "1", "viewer_count": 40},
+                {"game_id": "2", "viewer_count": 1},
+            ],
+            "pagination": {"cursor": "p3"},
+        },
+        "p3": {"data": [{"game_id": "4", "viewer_count": 1}], "pagination": {}},
+    }
+    per_game = {"1": 1000, "2": 60, "9": 7}
+
+    def handler(method, url, kwargs):
+        params = dict(kwargs["params"])
+        if url.endswith("/games/top"):
+            return (
+                {
+                    "data": [
+                        {"id": "1", "name": "Elden Ring"},
+                        {"id": "2", "name": "Hades"},
+                        {"id": "3", "name": "Tunic"},
+                    ]
+                },
+            )
+        if url.endswith("/games"):
+            return ({"data": [{"id": "9", "name": "Obscure Gem"}]},)
+        if "game_id" in params:
+            game_ids = [value for key, value in kwargs["params"] if key == "game_id"]
+            streams = [
+                {"game_id": game_id, "viewer_count": per_game[game_id]}
+                for game_id in game_ids
+                if game_id in per_game
+            ]
+            return ({"data": streams},)
+        return (pages[params.get("after")],)
+
+    tokens = app_fastapi.OAuthTokenManager()
+    tokens._tokens[
+        (
+            app_fastapi.TWITCH_TOKEN_URL,
+            app_fastapi.TWITCH_CLIENT_ID,
+            app_fastapi.TWITCH_CLIENT_SECRET,
+        )
+    ] = {"access_token": "token", "expires_at": time.time() + 3600}
+    session = FakeSession(handler)
+    monkeypatch.setattr(app_fastapi, "_twitch_game_ids", {})
+    monkeypatch.setattr(app_fastapi, "oauth_tokens", tokens)
+    monkeypatch.setattr(app_fastapi, "get_http_session", lambda provider: session)
+    aggregator = app_fastapi.TwitchViewerAggregator()
+
+    asyncio.run(aggregator.refresh())
+    # Streams are followed to the last page, so a listed game with no streams has 0
+    assert [c[1].rsplit("/", 1)[1] for c in session.calls] == [
+        "top",
+        "streams",
+        "streams",
+        "streams",
+    ]
+
+    calls = len(session.calls)
+    counts = asyncio.run(aggregator.get_viewer_counts(["Elden Ring", "Hades", "Tunic"]))
+    assert counts == {"Elden Ring": 940, "Hades": 51, "Tunic": 0}
+    assert len(session.calls) == calls
+
+    # A long-tail game is fetched once, then tracked by the background pass
+    assert asyncio.run(aggregator.get_viewer_counts(["Obscure Gem"])) == {
+        "Obscure Gem": 7
+    }
+    assert "9" in aggregator.tracked
+    calls = len(session.calls)
+    assert asyncio.run(aggregator.get_viewer_counts(["Obscure Gem"])) == {
+        "Obscure Gem": 7
+    }
+    assert len(session.calls) == calls
+
+    # A scan cut short only has partial sums: top and tracked games are counted per game
+    monkeypatch.setattr(app_fastapi, "TWITCH_AGGREGATE_MAX_PAGES", 1)
+    asyncio.run(aggregator.refresh())
+    assert {game_id: aggregator.viewers[game_id][0] for game_id in "1239"} == {
+        "1": 1000,
+        "2": 60,
+        "3": 0,
+        "9": 7,
+    }
+    assert aggregator.stats["partial_scans"] == 1
+
+
+def test_pipeline_runs_against_benchmark_mock_upstreams(monkeypatch):
+    """Test that the benchmark stand-ins serve every upstream call the app makes"""
+    import benchmark
+
+    profiles = {
+        name: {**profile, "latency": 0}
+        for name, profile in benchmark.UPSTREAM_PROFILES.items()
+    }
+    upstreams = benchmark.MockUpstreams(profiles)
+
+    async def scenario():
+        await upstreams.start()
+        try:
+            for name, value in upstreams.app_env().items():
+                monkeypatch.setattr(app_fastapi, name, value)
+            monkeypatch.setattr(
+                app_fastapi, "oauth_tokens", app_fastapi.OAuthTokenManager()
+            )
+            monkeypatch.setattr(
+                app_fastapi, "twitch_viewers", app_fastapi.TwitchViewerAggregator()
+            )
+            monkeypatch.setattr(app_fastapi, "_twitch_game_ids", {})
+            for name in (
+                "TWITCH_CLIENT_ID",
+                "TWITCH_CLIENT_SECRET",
+                "IGDB_CLIENT_ID",
+                "IGDB_CLIENT_SECRET",
+            ):
+                monkeypatch.setattr(app_fastapi, name, "benchmark")
+            monkeypatch.setenv("RAWG_API_KEY", "benchmark")
+            monkeypatch.setenv("OPENAI_API_KEY", "benchmark")
+            monkeypatch.setattr(
+                app_fastapi, "llm_providers", [app_fastapi.OpenAIProvider()]
+            )
+
+            result = await app_fastapi.get_recommendations(
+                "cozy farming games with co-op #benchmark"
+            )
+            game = result["games"][0]
+            details = await app_fastapi.get_game_details(game["title"], game["rawg_id"])
+            return result, details
+        finally:
+            await app_fastapi.close_http_sessions()
+            await upstreams.stop()
+
+    result, details = asyncio.run(scenario())
+    assert not result.get("ai_down")
+    assert len(result["games"]) == benchmark.OPENAI_TITLES
+    assert details["screenshots"] and details["description"]
+    assert {"openai", "rawg", "igdb", "twitch", "twitch_auth"} <= set(upstreams.calls)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])